@@ -3,6 +3,11 @@ ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Servido por ASGI, os feeds e a disponibilidade usam as views assíncronas
+(reservas/async_views.py); ASYNC_VIEWS=0 volta para as síncronas. O servidor
+ASGI (uvicorn, daphne, hypercorn...) não faz parte do requirements.txt: o
+deploy padrão é o gunicorn síncrono de core/wsgi.py.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -12,5 +17,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 # Middleware
 # =========================
 MIDDLEWARE = [
+    # Primeiro: mede a requisição inteira (reservas/instrumentation.py)
+    'reservas.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
 
     # WhiteNoise para arquivos estáticos no deploy
@@ -55,6 +57,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Profiler sob demanda (reservas/profiling.py): parado custa quase nada
+    'reservas.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,6 +80,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'reservas.context_processors.user_permissions',  # personalizado
+                'reservas.context_processors.schedule_changes',
             ],
         },
     },
@@ -130,6 +135,11 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Variantes das fotos de perfil e imagens de avisos (reservas/images.py):
+# "thread" gera num pool de IMAGE_WORKERS threads depois do commit; "sync" gera na própria requisição.
+IMAGE_PROCESSING = os.environ.get("IMAGE_PROCESSING", "thread")
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+
 # =========================
 # Autenticação e Redirecionamentos
 # =========================
@@ -147,3 +157,107 @@ EMAIL_BACKEND = os.environ.get(
 )
 
 # Se você quiser ativar Gmail SMTP, defina as variáveis abaixo no ambiente da plat
+
+# =========================
+# Ocorrências materializadas (reservas + grade fixa)
+# =========================
+# Dias mantidos na tabela Occurrence antes/depois de hoje; fora disso, expansão ao vivo
+OCCURRENCE_HISTORY_DAYS = int(os.environ.get("OCCURRENCE_HISTORY_DAYS", 60))
+OCCURRENCE_HORIZON_DAYS = int(os.environ.get("OCCURRENCE_HORIZON_DAYS", 180))
+# Regras RRULE compiladas mantidas em memória (LRU por processo)
+RRULE_CACHE_SIZE = int(os.environ.get("RRULE_CACHE_SIZE", 1024))
+
+# =========================
+# Cache
+# =========================
+# Padrão: memória do processo. Com REDIS_URL (requer o pacote redis) o cache é compartilhado entre workers.
+REDIS_URL = os.environ.get("REDIS_URL")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Respostas do /api/events/ (nível local por processo + cache compartilhado acima)
+FEED_CACHE_ALIAS = "default"
+FEED_CACHE_TIMEOUT = int(os.environ.get("FEED_CACHE_TIMEOUT", 300))
+FEED_CACHE_LOCAL_SIZE = int(os.environ.get("FEED_CACHE_LOCAL_SIZE", 256))
+
+# /api/admin-events/ com janelas maiores que isso (ou ?stream=1) responde em streaming
+ADMIN_FEED_STREAM_DAYS = int(os.environ.get("ADMIN_FEED_STREAM_DAYS", 45))
+
+# Maior intervalo (em dias) aceito pela busca de salas livres (/api/free-rooms/)
+FREE_ROOMS_MAX_DAYS = int(os.environ.get("FREE_ROOMS_MAX_DAYS", 31))
+
+# Papel efetivo do usuário (reservas/roles.py) guardado no cache por esse tempo; 0 desliga.
+# Só com cache compartilhado (REDIS_URL): na memória do processo, os signals limpariam só
+# o worker que fez a mudança, e os outros manteriam o papel antigo até expirar.
+ROLE_CACHE_TIMEOUT = int(os.environ.get("ROLE_CACHE_TIMEOUT", 300 if REDIS_URL else 0))
+
+# Versões assíncronas de /api/events/, /api/admin-events/ e /api/availability/ (reservas/async_views.py).
+# core/asgi.py liga por padrão; sob WSGI as views síncronas continuam mais baratas.
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "False").lower() in ("true", "1", "yes")
+
+# Stream de mudanças (/api/changes/, SSE): intervalo de consulta ao diário, duração
+# máxima de cada conexão (o navegador reconecta sozinho) e por quanto tempo o diário é mantido.
+# Sob WSGI cada conexão aberta ocupa um worker/thread até o fim do prazo, então os calendários
+# só abrem o stream com ASYNC_VIEWS; sem isso consultam /api/changes/poll/ a cada
+# CHANGES_CLIENT_POLL_SECONDS (resposta imediata).
+CHANGES_POLL_SECONDS = float(os.environ.get("CHANGES_POLL_SECONDS", 2))
+CHANGES_STREAM_SECONDS = int(os.environ.get("CHANGES_STREAM_SECONDS", 55))
+CHANGES_KEEP_HOURS = int(os.environ.get("CHANGES_KEEP_HOURS", 24))
+# Janela relida abaixo do cursor: avisos cuja transação terminou depois de um id maior já entregue
+CHANGES_COMMIT_LAG_SECONDS = int(os.environ.get("CHANGES_COMMIT_LAG_SECONDS", 60))
+CHANGES_CLIENT_POLL_SECONDS = int(os.environ.get("CHANGES_CLIENT_POLL_SECONDS", 20))
+
+# =========================
+# Medições e logging
+# =========================
+# Cabeçalho Server-Timing (sql, occurrences, json, perm, total) em toda resposta; padrão: só em DEBUG
+SERVER_TIMING = os.environ.get("SERVER_TIMING", str(DEBUG)).lower() in ("true", "1", "yes")
+# Requisições acima disso (ms) saem como WARNING no logger reservas.timing; as outras, DEBUG
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", 500))
+# Máximo de linhas por minuto de uma mesma mensagem de log; 0 desliga o limite
+LOG_RATE_LIMIT = int(os.environ.get("LOG_RATE_LIMIT", 60))
+
+# /metrics/ (Prometheus): equipe logada ou "Authorization: Bearer <METRICS_TOKEN>".
+# Com vários workers, METRICS_DIR (diretório local compartilhado) faz o endpoint somar todos os processos;
+# cada um grava seu retrato a cada METRICS_FLUSH_SECONDS e retratos parados há METRICS_FILE_TTL_HOURS somem.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 10))
+METRICS_FILE_TTL_HOURS = int(os.environ.get("METRICS_FILE_TTL_HOURS", 24))
+
+# Profiler sob demanda (reservas/profiling.py): "X-Profile: 1" da equipe ou a chave de /api/profiles/.
+# Em disco efêmero (Render) os perfis somem no deploy: baixe-os antes.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "True").lower() in ("true", "1", "yes")
+PROFILING_DIR = os.environ.get("PROFILING_DIR") or BASE_DIR / "profiles"
+PROFILING_INTERVAL_MS = float(os.environ.get("PROFILING_INTERVAL_MS", 5))
+PROFILING_MAX_FILES = int(os.environ.get("PROFILING_MAX_FILES", 50))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "rate_limit": {
+            "()": "reservas.instrumentation.RateLimitFilter",
+            "per_minute": LOG_RATE_LIMIT,
+        },
+    },
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+            "formatter": "plain",
+            "filters": ["rate_limit"],
+        },
+    },
+    "loggers": {
+        "reservas": {
+            "handlers": ["console"],
+            "level": os.environ.get("RESERVAS_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
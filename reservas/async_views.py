@@ -0,0 +1,195 @@
+"""
+Versões assíncronas das APIs de leitura (/api/events/, /api/admin-events/,
+/api/availability/ e o stream /api/changes/) para rodar sob ASGI
+(core.asgi.application).
+
+Mesmo contrato das views de views.py: URLs, ETag/304, cache de respostas,
+formato compacto e streaming. A diferença é que esperam o banco com o ORM
+assíncrono (aiterator, afirst, aexists) em vez de prender uma thread, então
+um worker atende muitas cargas de calendário ao mesmo tempo — clientes lentos
+e feeds grandes não ocupam um worker síncrono inteiro.
+
+urls.py troca as views quando settings.ASYNC_VIEWS está ligado (core/asgi.py
+liga por padrão). Comparação com o caminho WSGI: manage.py bench_asgi.
+
+Os decoradores do Django 4.2 (login_required, condition, cache_control,
+require_POST) só embrulham views síncronas; aqui há equivalentes assíncronos.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import (
+    Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse,
+)
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.http import quote_etag
+from django.utils.timezone import now
+
+from .availability import aoccupancy
+from .changes import alatest_cursor, astream_changes, requested_cursor, sse_response
+from .feeds import (
+    CompactEvents, admin_events_etag, arequest_room_versions, astream_json_array,
+    cached_response, events_cache_key, events_etag, feed_cache,
+)
+from .instrumentation import timing
+from .models import Room
+from .occurrences import ahas_overlap, aoccurrences_in
+from .roles import is_staff_like, user_role
+from .views import (
+    _admin_event, _admin_feed_query, _admin_feed_streams, _availability_params,
+    _available_slots, _client_events,
+)
+
+
+# =============================
+# Decoradores
+# =============================
+def _load_user(request):
+    # request.user é preguiçoso e lê sessão + User do banco: avalia numa thread,
+    # junto com o papel (memorizado no user), para o resto da view não consultar nada
+    user_role(request.user)
+    return request.user
+
+
+def _async_user_passes_test(test_func):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            user = await sync_to_async(_load_user)(request)
+            if not test_func(user):
+                return redirect_to_login(request.get_full_path())
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async_login_required = _async_user_passes_test(lambda user: user.is_authenticated)
+async_staff_required = _async_user_passes_test(is_staff_like)
+
+
+def async_require_POST(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def async_feed_condition(etag_func, vary=()):
+    """condition(etag_func=...) + cache_control(private=True, no_cache=True) + vary_on_headers(*vary)"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            # Com as versões das salas já lidas, o etag_func não toca no banco
+            await arequest_room_versions(request)
+            etag = etag_func(request)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', quote_etag(etag))
+            patch_cache_control(response, private=True, no_cache=True)
+            if vary:
+                patch_vary_headers(response, vary)
+            return response
+        return wrapper
+    return decorator
+
+
+# =============================
+# API Normal — Eventos (FullCalendar do cliente)
+# =============================
+@async_login_required
+@async_feed_condition(events_etag, vary=('Accept-Encoding',))
+async def events_feed(request):
+    start = parse_datetime(request.GET.get('start'))
+    end = parse_datetime(request.GET.get('end'))
+    room_slug = request.GET.get('room')
+
+    if not (start and end):
+        return JsonResponse([], safe=False)
+
+    filters = {'room__slug': room_slug} if room_slug else {}
+
+    staff = is_staff_like(request.user)
+    if staff:
+        viewer = 'staff'
+    elif await ahas_overlap(start, end, kind='reservation', user_id=request.user.id, **filters):
+        viewer = request.user.id
+    else:
+        viewer = 'guest'
+    cache_key = events_cache_key(request, start, end, viewer)
+    entry = await sync_to_async(feed_cache.get)(cache_key)
+    if entry is not None:
+        return cached_response(request, entry)
+
+    occurrences = [triple async for triple in aoccurrences_in(start, end, **filters)]
+    compact = CompactEvents() if request.GET.get('format') == 'compact' else None
+    events = _client_events(occurrences, request.user.id, staff, compact)
+
+    room_ids = [pk for pk, *_ in request._feed_room_versions]
+    data = compact.as_dict() if compact is not None else events
+    entry = await sync_to_async(feed_cache.set)(cache_key, room_ids, data)
+    return cached_response(request, entry)
+
+
+# =============================
+# Horários disponíveis
+# =============================
+@async_login_required
+@async_require_POST
+async def availability(request):
+    params = _availability_params(request)
+    if isinstance(params, HttpResponse):
+        return params
+    target_date = params['date']
+
+    if target_date < now().date():
+        return JsonResponse({'available': []})
+
+    room = await Room.objects.filter(slug=params['room_slug']).afirst()
+    if room is None:
+        raise Http404('Sala não encontrada')
+
+    busy = (await aoccupancy([room.pk], target_date))[room.pk, target_date]
+    available_slots = _available_slots(
+        target_date, busy, params['duration_min'], params['granularity_min']
+    )
+    return JsonResponse({'available': available_slots})
+
+
+# =============================
+# API Admin — Eventos
+# =============================
+async def _admin_events(start, end, filters):
+    async for s, e, obj in aoccurrences_in(start, end, **filters):
+        yield _admin_event(s, e, obj)
+
+
+@async_staff_required
+@async_feed_condition(admin_events_etag)
+async def admin_events_feed(request):
+    start, end, filters = _admin_feed_query(request)
+    events = _admin_events(start, end, filters)
+
+    if _admin_feed_streams(request, start, end):
+        return StreamingHttpResponse(astream_json_array(events), content_type='application/json')
+
+    events = [event async for event in events]
+    with timing('json'):
+        return JsonResponse(events, safe=False)
+
+
+# =============================
+# Avisos de mudança na agenda (SSE)
+# =============================
+@async_login_required
+async def schedule_changes(request):
+    # Sob ASGI cada conexão aberta é só uma corrotina esperando o próximo poll
+    cursor = requested_cursor(request)
+    if cursor is None:
+        cursor = await alatest_cursor()
+    return sse_response(astream_changes(cursor, request.GET.get('room')))
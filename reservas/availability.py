@@ -0,0 +1,175 @@
+"""
+Disponibilidade por bitmap de minutos.
+
+Cada (sala, dia) vira um inteiro em que o bit m indica que o minuto m do dia
+(hora local) está ocupado — por reserva avulsa, ocorrência de série ou aula
+fixa. Procurar horários livres de qualquer duração e granularidade vira
+algumas operações de bits sobre o dia inteiro, em vez de testar cada
+candidato contra cada intervalo ocupado.
+"""
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from django.utils.timezone import get_current_timezone, localtime, make_aware
+
+from .occurrences import aoccurrences_in, occurrences_in
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def day_bounds(day):
+    """(início, fim) do dia em hora local, meia-noite a meia-noite"""
+    tz = get_current_timezone()
+    return (
+        make_aware(datetime.combine(day, time.min), timezone=tz),
+        make_aware(datetime.combine(day + timedelta(days=1), time.min), timezone=tz),
+    )
+
+
+def floor_minutes(delta):
+    return int(delta.total_seconds() // 60)
+
+
+def ceil_minutes(delta):
+    return int(-(-delta.total_seconds() // 60))
+
+
+def span_mask(start_min, end_min):
+    """Bitmap com os minutos [start_min, end_min) ligados"""
+    if end_min <= start_min:
+        return 0
+    return ((1 << (end_min - start_min)) - 1) << start_min
+
+
+@lru_cache(maxsize=64)
+def _grid(granularity, day_minutes):
+    mask = 0
+    for m in range(0, day_minutes, granularity):
+        mask |= 1 << m
+    return mask
+
+
+# =============================
+# Ocupação
+# =============================
+class _Occupancy:
+    """Acumula os bitmaps de occupancy() ocorrência a ocorrência"""
+
+    def __init__(self, room_ids, first_day, last_day=None):
+        self.first_day = first_day
+        self.last_day = last_day or first_day
+        self.room_ids = list(room_ids)
+        days = [first_day + timedelta(days=i) for i in range((self.last_day - first_day).days + 1)]
+        self.bounds = {day: day_bounds(day) for day in days}
+        self.bitmaps = {(room_id, day): 0 for room_id in self.room_ids for day in days}
+        self.range = (self.bounds[first_day][0], self.bounds[self.last_day][1])
+
+    def add(self, s, e, room_id):
+        day = max(localtime(s).date(), self.first_day)
+        # Ocorrências que viram a meia-noite ocupam o pedaço de cada dia
+        while day <= self.last_day:
+            ds, de = self.bounds[day]
+            if ds >= e:
+                break
+            self.bitmaps[room_id, day] |= span_mask(
+                max(0, floor_minutes(s - ds)), min(ceil_minutes(e - ds), floor_minutes(de - ds))
+            )
+            day += timedelta(days=1)
+
+
+def occupancy(room_ids, first_day, last_day=None):
+    """
+    {(room_id, dia): bitmap} de cada sala em cada dia de first_day a last_day.
+    Sai de uma única passada por occurrences_in, que já cobre reservas,
+    séries e aulas fixas (tabela materializada ou expansão ao vivo).
+    """
+    acc = _Occupancy(room_ids, first_day, last_day)
+    if acc.room_ids:
+        for s, e, obj in occurrences_in(*acc.range, room_id__in=acc.room_ids):
+            acc.add(s, e, obj.room_id)
+    return acc.bitmaps
+
+
+async def aoccupancy(room_ids, first_day, last_day=None):
+    """occupancy() sobre aoccurrences_in, para as views assíncronas"""
+    acc = _Occupancy(room_ids, first_day, last_day)
+    if acc.room_ids:
+        async for s, e, obj in aoccurrences_in(*acc.range, room_id__in=acc.room_ids):
+            acc.add(s, e, obj.room_id)
+    return acc.bitmaps
+
+
+# =============================
+# Horários livres
+# =============================
+def free_starts(busy, duration, granularity=30, day_minutes=MINUTES_PER_DAY, not_before=0):
+    """
+    Minutos do dia (múltiplos de `granularity`, a partir de `not_before`) em que
+    começa um intervalo livre de `duration` minutos, em ordem crescente.
+    """
+    if duration <= 0 or granularity <= 0 or duration > day_minutes:
+        return []
+    free = ~busy & ((1 << day_minutes) - 1)
+    # Dobrando o alcance: o bit t fica ligado só se os minutos t..t+run-1 estão livres
+    run = 1
+    while run < duration:
+        step = min(run, duration - run)
+        free &= free >> step
+        run += step
+    free &= _grid(granularity, day_minutes) & ~((1 << max(not_before, 0)) - 1)
+
+    starts = []
+    while free:
+        low = free & -free
+        starts.append(low.bit_length() - 1)
+        free ^= low
+    return starts
+
+
+# =============================
+# Janelas livres em várias salas
+# =============================
+def sweep_free_windows(intervals, room_ids, start, end, min_duration):
+    """
+    Sweep-line compartilhado por todas as salas: recebe (room_id, início, fim)
+    ocupados em qualquer ordem e devolve {room_id: [(início, fim), ...]} com as
+    janelas livres de [start, end) que duram pelo menos `min_duration`.
+    """
+    events = []
+    for room_id, s, e in intervals:
+        s, e = max(s, start), min(e, end)
+        if s < e:
+            # No mesmo instante, fins (-1) vêm antes de inícios (+1): encostar não ocupa
+            events.append((s, 1, room_id))
+            events.append((e, -1, room_id))
+    events.sort(key=lambda ev: (ev[0], ev[1]))
+
+    depth = dict.fromkeys(room_ids, 0)
+    free_since = dict.fromkeys(room_ids, start)
+    windows = {room_id: [] for room_id in room_ids}
+    for t, delta, room_id in events:
+        if delta > 0:
+            if depth[room_id] == 0 and t - free_since[room_id] >= min_duration:
+                windows[room_id].append((free_since[room_id], t))
+            depth[room_id] += 1
+        else:
+            depth[room_id] -= 1
+            if depth[room_id] == 0:
+                free_since[room_id] = t
+
+    for room_id in room_ids:
+        if depth[room_id] == 0 and end - free_since[room_id] >= min_duration:
+            windows[room_id].append((free_since[room_id], end))
+    return windows
+
+
+def free_windows(room_ids, start, end, min_duration):
+    """Janelas livres por sala em [start, end), a partir de uma única consulta"""
+    room_ids = list(room_ids)
+    if not room_ids:
+        return {}
+    intervals = (
+        (obj.room_id, s, e)
+        for s, e, obj in occurrences_in(start, end, room_id__in=room_ids)
+    )
+    return sweep_free_windows(intervals, room_ids, start, end, min_duration)
@@ -0,0 +1,117 @@
+"""
+Cancelamento em lote (/api/cancel-bulk/).
+
+Os ids são separados por tipo uma vez só e viram UPDATEs agrupados; os
+cancelamentos por data viram ReservationException via bulk_create, tudo na
+mesma transação. update() e bulk_create() não disparam signals, então as
+ocorrências materializadas, as versões das salas e os caches são acertados
+aqui, uma vez para o lote inteiro.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import changes
+from .availability import day_bounds
+from .conflicts import rooms_changed
+from .feeds import feed_cache
+from .models import Occurrence, Reservation, ReservationException, ScheduledClass
+
+# Datas por DELETE de ocorrências (limita a profundidade do OR no SQLite)
+DATES_PER_DELETE = 100
+
+
+def parse_event_id(sid):
+    """'r-12' -> ('r', 12), 'sc-3' -> ('sc', 3); None se não for um id do feed"""
+    kind, _, pk = str(sid).partition('-')
+    if kind not in ('r', 'sc') or not pk.isdigit():
+        return None
+    return kind, int(pk)
+
+
+def cancel_events(series_ids=(), dated=()):
+    """
+    Cancela em lote.
+    - series_ids: ids do feed ("r-1", "sc-2"): reserva cancelada / aula fixa desativada.
+    - dated: pares (id, date): só aquela data. Reservas recorrentes ganham uma
+      exceção; avulsas são canceladas inteiras (como em cancel_reservation).
+    Devolve as contagens do que mudou de fato.
+    """
+    counts = {'reservations': 0, 'scheduled_classes': 0, 'dates': 0, 'ignored': 0}
+    reservation_ids, class_ids, dates_by_reservation = set(), set(), {}
+
+    for sid in series_ids:
+        parsed = parse_event_id(sid)
+        if parsed is None:
+            counts['ignored'] += 1
+        elif parsed[0] == 'r':
+            reservation_ids.add(parsed[1])
+        else:
+            class_ids.add(parsed[1])
+
+    for sid, date in dated:
+        parsed = parse_event_id(sid)
+        # Aula fixa não tem exceção por data
+        if parsed is None or parsed[0] != 'r' or date is None:
+            counts['ignored'] += 1
+            continue
+        dates_by_reservation.setdefault(parsed[1], set()).add(date)
+
+    room_ids = set()
+    with transaction.atomic():
+        # Cancelamento por data: avulsas viram cancelamento da série
+        exception_rows = []
+        if dates_by_reservation:
+            series = Reservation.objects.filter(
+                pk__in=dates_by_reservation, is_cancelled=False
+            ).values_list('pk', 'recurrence_rule', 'room_id')
+            existing = set(ReservationException.objects.filter(
+                reservation_id__in=dates_by_reservation
+            ).values_list('reservation_id', 'date'))
+            for pk, rule, room_id in series:
+                if not rule:
+                    reservation_ids.add(pk)
+                    continue
+                for date in dates_by_reservation[pk]:
+                    if (pk, date) not in existing:
+                        exception_rows.append(ReservationException(reservation_id=pk, date=date))
+                        room_ids.add(room_id)
+
+        if exception_rows:
+            ReservationException.objects.bulk_create(exception_rows)
+            counts['dates'] = len(exception_rows)
+            # Ocorrências materializadas daquelas datas (dia local), agrupadas por data
+            by_date = {}
+            for row in exception_rows:
+                by_date.setdefault(row.date, []).append(row.reservation_id)
+            dates = sorted(by_date)
+            for i in range(0, len(dates), DATES_PER_DELETE):
+                Occurrence.objects.filter(reduce(or_, (
+                    Q(reservation_id__in=by_date[d],
+                      start__gte=day_bounds(d)[0], start__lt=day_bounds(d)[1])
+                    for d in dates[i:i + DATES_PER_DELETE]
+                ))).delete()
+
+        if reservation_ids:
+            affected = dict(Reservation.objects.filter(
+                pk__in=reservation_ids, is_cancelled=False
+            ).values_list('pk', 'room_id'))
+            counts['reservations'] = Reservation.objects.filter(pk__in=affected).update(is_cancelled=True)
+            Occurrence.objects.filter(reservation_id__in=affected).delete()
+            room_ids.update(affected.values())
+
+        if class_ids:
+            affected = dict(ScheduledClass.objects.filter(
+                pk__in=class_ids, is_active=True
+            ).values_list('pk', 'room_id'))
+            counts['scheduled_classes'] = ScheduledClass.objects.filter(pk__in=affected).update(is_active=False)
+            Occurrence.objects.filter(scheduled_class_id__in=affected).delete()
+            room_ids.update(affected.values())
+
+        # Uma versão nova por sala afetada (ETags, chaves do feed, índices de conflito)
+        changes.record(rooms_changed(room_ids))
+
+    feed_cache.forget_rooms(room_ids)
+    return counts
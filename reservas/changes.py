@@ -0,0 +1,203 @@
+"""
+Avisos de mudança na agenda para os calendários abertos (/api/changes/, SSE).
+
+Sempre que uma sala é versionada — signals de Reservation, ReservationException
+e ScheduledClass ou os lotes de bulk.py/timetable.py — grava-se uma linha de
+ScheduleChange com a sala, o trecho afetado e a nova versão, na mesma
+transação da mudança. O stream consulta esse diário a cada
+CHANGES_POLL_SECONDS a partir do último id entregue, então funciona com
+vários workers/processos sem broker; o EventSource reconecta sozinho com
+Last-Event-ID e não perde avisos entre uma conexão e outra.
+
+O id vem de uma sequência que é reservada antes do commit: uma transação
+que pegou o id N+1 pode terminar depois de o N+2 já ter sido entregue.
+Por isso cada consulta também relê as linhas criadas nos últimos
+CHANGES_COMMIT_LAG_SECONDS abaixo do cursor, pulando as que já foram
+entregues; quem recebe ainda descarta ids repetidos (reconexões e polling).
+
+Cada conexão dura no máximo CHANGES_STREAM_SECONDS. Sob WSGI síncrono isso
+ainda prende um worker por aba aberta, então os calendários só abrem o
+EventSource com ASYNC_VIEWS; sem isso consultam /api/changes/poll/ a cada
+CHANGES_CLIENT_POLL_SECONDS, que responde na hora com o que houver.
+"""
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.timezone import now
+
+from .models import ScheduleChange
+
+BATCH_SIZE = 200
+HEARTBEAT_SECONDS = 15
+PRUNE_INTERVAL = 3600
+
+_last_prune = 0.0
+
+
+def merge_ranges(*ranges):
+    """Menor trecho que cobre todos os (início, fim); None = sem limite"""
+    ranges = [r for r in ranges if r is not None]
+    starts = [s for s, _ in ranges]
+    ends = [e for _, e in ranges]
+    start = None if None in starts else min(starts)
+    end = None if None in ends else max(ends)
+    return start, end
+
+
+def reservation_range(reservation):
+    """Trecho ocupado pela série (do início até series_end; sem fim se a série não termina)"""
+    return reservation.start_dt, reservation.series_end
+
+
+def record(versions, start=None, end=None):
+    """Registra a nova versão de cada sala ({room_id: versão}) para o trecho [start, end)"""
+    rows = [
+        ScheduleChange(room_id=room_id, start=start, end=end, version=version)
+        for room_id, version in versions.items()
+        if room_id is not None and version is not None
+    ]
+    if rows:
+        ScheduleChange.objects.bulk_create(rows)
+        _prune()
+
+
+def _prune():
+    # O diário só precisa cobrir reconexões: apaga o que já passou de CHANGES_KEEP_HOURS
+    global _last_prune
+    if time.monotonic() - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = time.monotonic()
+    keep = timedelta(hours=getattr(settings, 'CHANGES_KEEP_HOURS', 24))
+    ScheduleChange.objects.filter(created_at__lt=now() - keep).delete()
+
+
+# =============================
+# Stream (Server-Sent Events)
+# =============================
+def requested_cursor(request):
+    """Último id já recebido pelo cliente (Last-Event-ID ou ?last_id=), ou None"""
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_id')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _latest_qs():
+    return ScheduleChange.objects.order_by('-pk').values_list('pk', flat=True)
+
+
+def latest_cursor():
+    return _latest_qs().first() or 0
+
+
+async def alatest_cursor():
+    return await _latest_qs().afirst() or 0
+
+
+def change_data(row):
+    """Dicionário de um aviso a partir de uma linha de ChangeStream.pending()"""
+    pk, room_slug, start, end, version = row
+    return {
+        'id': pk,
+        'room': room_slug,
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat() if end else None,
+        'version': version,
+    }
+
+
+class ChangeStream:
+    """Estado de uma conexão SSE; os laços síncrono e assíncrono só fazem o I/O"""
+
+    def __init__(self, cursor, room_slug=None):
+        self.cursor = cursor
+        self.room_slug = room_slug
+        self.poll = getattr(settings, 'CHANGES_POLL_SECONDS', 2)
+        self.lag = getattr(settings, 'CHANGES_COMMIT_LAG_SECONDS', 60)
+        # Ids já entregues ainda dentro da janela de releitura: {pk: instante do envio}
+        self.sent = {}
+        self.deadline = time.monotonic() + getattr(settings, 'CHANGES_STREAM_SECONDS', 55)
+        self.last_sent = time.monotonic()
+
+    def preamble(self):
+        # Reconexão rápida quando o servidor fecha a conexão no fim do prazo
+        return f'retry: {int(self.poll * 1000)}\n\n'
+
+    def pending(self):
+        expired = time.monotonic() - self.lag
+        self.sent = {pk: at for pk, at in self.sent.items() if at >= expired}
+        # Depois do cursor, mais as linhas recentes abaixo dele (commit fora de ordem)
+        recent = Q(pk__lte=self.cursor, created_at__gte=now() - timedelta(seconds=self.lag))
+        qs = ScheduleChange.objects.filter(Q(pk__gt=self.cursor) | recent).exclude(pk__in=list(self.sent))
+        if self.room_slug:
+            qs = qs.filter(room__slug=self.room_slug)
+        return qs.order_by('pk').values_list(
+            'pk', 'room__slug', 'start', 'end', 'version'
+        )[:BATCH_SIZE]
+
+    def chunk(self, rows):
+        """Texto SSE das linhas novas ('' se não há nada a mandar)"""
+        parts = []
+        for row in rows:
+            data = change_data(row)
+            pk = data.pop('id')
+            parts.append(f'id: {pk}\nevent: change\ndata: {json.dumps(data)}\n\n')
+            self.sent[pk] = time.monotonic()
+            self.cursor = max(self.cursor, pk)
+        if not parts and time.monotonic() - self.last_sent >= HEARTBEAT_SECONDS:
+            # Comentário SSE: mantém proxies e balanceadores com a conexão aberta
+            parts.append(': ping\n\n')
+        if parts:
+            self.last_sent = time.monotonic()
+        return ''.join(parts)
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+
+def stream_changes(cursor, room_slug=None):
+    stream = ChangeStream(cursor, room_slug)
+    yield stream.preamble()
+    while True:
+        chunk = stream.chunk(list(stream.pending()))
+        if chunk:
+            yield chunk
+        if stream.expired:
+            return
+        time.sleep(stream.poll)
+
+
+async def astream_changes(cursor, room_slug=None):
+    stream = ChangeStream(cursor, room_slug)
+    yield stream.preamble()
+    while True:
+        chunk = stream.chunk([row async for row in stream.pending()])
+        if chunk:
+            yield chunk
+        if stream.expired:
+            return
+        await asyncio.sleep(stream.poll)
+
+
+def poll_changes(cursor, room_slug=None):
+    """Avisos depois de `cursor`, para o polling curto: {'last_id', 'changes'}"""
+    stream = ChangeStream(cursor, room_slug)
+    changes = [change_data(row) for row in stream.pending()]
+    # Inclui as releituras abaixo do cursor: o cliente descarta os ids que já viu
+    cursor = max([cursor, *(change['id'] for change in changes)])
+    return {'last_id': cursor, 'changes': changes}
+
+
+def sse_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx: não bufferizar, senão os avisos só chegam no fim da conexão
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,212 @@
+"""
+Índice de intervalos por sala para detecção de conflitos.
+
+Cada sala mantém dois conjuntos ordenados:
+- aulas fixas em minutos da semana (segunda 00:00 = 0);
+- ocorrências de reservas materializadas dentro do horizonte.
+
+"[start, end) cruza algo?" sai em O(log n) via bisect sobre os inícios mais o
+máximo acumulado dos fins. O índice vive em memória por processo e é validado
+pela Room.schedule_version: mudanças locais são aplicadas incrementalmente
+(depois do commit, para um rollback não deixar intervalos fantasmas), mudanças
+de outros processos forçam a reconstrução da sala.
+"""
+import threading
+from bisect import bisect_left
+
+from django.db import transaction
+from django.db.models import F
+
+from .metrics import registry
+from .models import Occurrence, Reservation, Room, ScheduledClass
+from .occurrences import covers, ensure_horizon, has_overlap
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class IntervalSet:
+    """
+    Intervalos [start, end) identificados por chave, ordenados pelo início.
+    As listas são trocadas de uma vez a cada alteração, então leituras
+    concorrentes sempre enxergam um estado consistente.
+    """
+
+    def __init__(self, intervals=()):
+        self._set_items(sorted(intervals))
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def _set_items(self, items):
+        starts, max_end, running = [], [], None
+        for start, end, _ in items:
+            running = end if running is None or end > running else running
+            starts.append(start)
+            max_end.append(running)
+        self._state = (items, starts, max_end)
+
+    def replace(self, key, intervals):
+        """Troca todos os intervalos de `key` pelos novos (lista vazia só remove)"""
+        items = [item for item in self._state[0] if item[2] != key]
+        items.extend((start, end, key) for start, end in intervals)
+        items.sort()
+        self._set_items(items)
+
+    def overlapping(self, start, end):
+        """Gera as chaves dos intervalos que cruzam [start, end)"""
+        items, starts, max_end = self._state
+        i = bisect_left(starts, end)
+        # max_end é não decrescente: abaixo do primeiro <= start nada mais cruza
+        for j in range(i - 1, -1, -1):
+            if max_end[j] <= start:
+                break
+            if items[j][1] > start:
+                yield items[j][2]
+
+    def overlaps(self, start, end, exclude=None):
+        if exclude is None:
+            _, starts, max_end = self._state
+            i = bisect_left(starts, end)
+            return i > 0 and max_end[i - 1] > start
+        return any(key != exclude for key in self.overlapping(start, end))
+
+
+def _week_minutes(weekday, start_t, end_t):
+    start = weekday * MINUTES_PER_DAY + start_t.hour * 60 + start_t.minute
+    end = weekday * MINUTES_PER_DAY + end_t.hour * 60 + end_t.minute
+    if end <= start:
+        # Horário que "vira" a meia-noite vai até o fim do dia
+        end = (weekday + 1) * MINUTES_PER_DAY
+    return start, end
+
+
+class RoomIndex:
+    def __init__(self, room_id, version, horizon):
+        self.room_id = room_id
+        self.version = version
+        self.horizon = horizon
+        self.weekly = IntervalSet(
+            (*_week_minutes(wd, s, e), sc_id)
+            for sc_id, wd, s, e in ScheduledClass.objects.filter(
+                room_id=room_id, is_active=True
+            ).values_list('id', 'weekday', 'start_time', 'end_time')
+        )
+        occ_qs = Occurrence.objects.filter(room_id=room_id, reservation__isnull=False)
+        self.reservations = IntervalSet(occ_qs.values_list('start', 'end', 'reservation_id'))
+
+    # ---- consultas ----
+    def weekly_overlaps(self, weekday, start_t, end_t, exclude_id=None):
+        return self.weekly.overlaps(*_week_minutes(weekday, start_t, end_t), exclude=exclude_id)
+
+    def reservation_overlaps(self, start, end):
+        if covers(self.horizon, start, end):
+            return self.reservations.overlaps(start, end)
+        return has_overlap(start, end, kind='reservation', room_id=self.room_id)
+
+    # ---- atualizações incrementais ----
+    def replace_scheduled_class(self, sc, deleted=False):
+        slots = []
+        if not deleted and sc.is_active and sc.room_id == self.room_id:
+            slots.append(_week_minutes(sc.weekday, sc.start_time, sc.end_time))
+        self.weekly.replace(sc.id, slots)
+
+    def replace_reservation(self, reservation, deleted=False):
+        rows = []
+        if not deleted and reservation.room_id == self.room_id:
+            rows = Occurrence.objects.filter(reservation_id=reservation.id).values_list('start', 'end')
+        self.reservations.replace(reservation.id, rows)
+
+
+class ConflictIndex:
+    """Registro em memória dos índices por sala"""
+
+    def __init__(self):
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def for_room(self, room):
+        horizon = ensure_horizon()
+        with self._lock:
+            idx = self._rooms.get(room.pk)
+        if (
+            idx is None
+            or idx.version < room.schedule_version
+            or getattr(idx.horizon, 'end', None) != getattr(horizon, 'end', None)
+        ):
+            idx = RoomIndex(room.pk, room.schedule_version, horizon)
+            with self._lock:
+                self._rooms[room.pk] = idx
+        return idx
+
+    def apply(self, room_id, version, change):
+        """Aplica `change(idx)` se o índice local estava na versão anterior; senão descarta"""
+        with self._lock:
+            idx = self._rooms.get(room_id)
+            if idx is None:
+                return
+            if version is not None and idx.version == version - 1:
+                change(idx)
+                idx.version = version
+            else:
+                del self._rooms[room_id]
+
+    def forget(self, room_ids):
+        with self._lock:
+            for room_id in room_ids:
+                self._rooms.pop(room_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+
+conflict_index = ConflictIndex()
+
+
+# =============================
+# Invalidação (chamada pelos signals)
+# =============================
+def series_changed(instance, room_ids, deleted=False):
+    """
+    Reserva ou aula fixa mudou: versiona as salas afetadas e atualiza os índices.
+    Devolve {room_id: nova versão}.
+    """
+    if isinstance(instance, Reservation):
+        change = lambda idx: idx.replace_reservation(instance, deleted=deleted)
+    else:
+        change = lambda idx: idx.replace_scheduled_class(instance, deleted=deleted)
+    versions = {}
+    for room_id in {rid for rid in room_ids if rid is not None}:
+        versions[room_id] = Room.bump_schedule_version(room_id)
+
+    def apply():
+        for room_id, version in versions.items():
+            conflict_index.apply(room_id, version, change)
+
+    # Só depois do commit: num rollback o índice fica na versão que o banco voltou a ter
+    transaction.on_commit(apply)
+    return versions
+
+
+def rooms_changed(room_ids):
+    """
+    Mudança em lote feita sem signals (update/bulk_create): versiona as salas
+    numa única query e descarta os índices locais delas. Devolve {room_id: nova versão}.
+    """
+    room_ids = {rid for rid in room_ids if rid is not None}
+    if not room_ids:
+        return {}
+    rooms = Room.objects.filter(pk__in=room_ids)
+    rooms.update(schedule_version=F('schedule_version') + 1)
+    conflict_index.forget(room_ids)
+    return dict(rooms.values_list('pk', 'schedule_version'))
+
+
+def reservation_overlaps(room, start, end):
+    with registry.timer('reservas_conflict_check_duration_seconds', kind='reservation'):
+        return conflict_index.for_room(room).reservation_overlaps(start, end)
+
+
+def weekly_overlaps(room, weekday, start_t, end_t, exclude_id=None):
+    with registry.timer('reservas_conflict_check_duration_seconds', kind='weekly'):
+        return conflict_index.for_room(room).weekly_overlaps(weekday, start_t, end_t, exclude_id)
@@ -1,8 +1,20 @@
-from .views import is_staff_like
+from django.conf import settings
+
+from .roles import is_staff_like, user_role
 
 def user_permissions(request):
+    # user_role() fica memorizado no request.user: as views não repetem a consulta
     if request.user.is_authenticated:
         return {
-            'is_staff_like': is_staff_like(request.user)
+            'is_staff_like': is_staff_like(request.user),
+            'user_role': user_role(request.user),
         }
-    return {'is_staff_like': False}
+    return {'is_staff_like': False, 'user_role': None}
+
+
+def schedule_changes(request):
+    # Avisos de mudança na agenda (base_inovadanca.html): SSE só sob ASGI, senão polling curto
+    return {
+        'changes_live': getattr(settings, 'ASYNC_VIEWS', False),
+        'changes_poll_ms': int(getattr(settings, 'CHANGES_CLIENT_POLL_SECONDS', 20) * 1000),
+    }
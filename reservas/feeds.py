@@ -0,0 +1,286 @@
+"""
+Suporte aos feeds JSON do calendário (/api/events/ e /api/admin-events/).
+
+O ETag de cada resposta é derivado da Room.schedule_version das salas no
+escopo da consulta, dos parâmetros e de quem pergunta. Uma requisição com
+If-None-Match igual recebe 304 sem expandir nenhuma ocorrência.
+
+Além disso, o corpo do events_feed fica num cache de dois níveis (LRU local
+na frente do cache compartilhado do Django), já serializado e comprimido.
+As chaves incluem as versões das salas, então os signals que incrementam a
+versão invalidam as entradas; o nível local ainda é limpo na hora.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .instrumentation import timing
+from .models import Room
+from .roles import is_staff_like
+
+# Incrementar quando o formato do payload mudar
+FEED_REVISION = 1
+
+
+def _room_versions_qs(room_slug=None):
+    qs = Room.objects.order_by('pk')
+    if room_slug:
+        qs = qs.filter(slug=room_slug)
+    return qs.values_list('pk', 'slug', 'name', 'schedule_version')
+
+
+def room_versions(room_slug=None):
+    """[(id, slug, nome, versão)] das salas no escopo do feed, numa consulta"""
+    return list(_room_versions_qs(room_slug))
+
+
+def request_room_versions(request):
+    """room_versions() do escopo da requisição, calculado uma vez por requisição"""
+    if not hasattr(request, '_feed_room_versions'):
+        request._feed_room_versions = room_versions(request.GET.get('room'))
+    return request._feed_room_versions
+
+
+async def arequest_room_versions(request):
+    """request_room_versions() pelo ORM assíncrono; depois disso a versão síncrona não consulta o banco"""
+    if not hasattr(request, '_feed_room_versions'):
+        qs = _room_versions_qs(request.GET.get('room'))
+        request._feed_room_versions = [row async for row in qs]
+    return request._feed_room_versions
+
+
+def _etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    # Fraco: a ordem de eventos com o mesmo início não é garantida byte a byte
+    return f'W/"{digest}"'
+
+
+def events_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    return _etag(
+        FEED_REVISION,
+        'events',
+        sorted(request.GET.items()),
+        request_room_versions(request),
+        request.user.pk,
+        is_staff_like(request.user),
+    )
+
+
+def admin_events_etag(request):
+    return _etag(
+        FEED_REVISION,
+        'admin-events',
+        sorted(request.GET.items()),
+        request_room_versions(request),
+    )
+
+
+# =============================
+# Cache de respostas (events_feed)
+# =============================
+class FeedCache:
+    """
+    Corpos prontos (JSON + gzip) do feed. Nível 1: LRU em memória do processo;
+    nível 2: cache compartilhado do Django (FEED_CACHE_ALIAS).
+    """
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        return caches[getattr(settings, 'FEED_CACHE_ALIAS', 'default')]
+
+    def key(self, *parts):
+        return 'feed:' + hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                self._local.move_to_end(key)
+        if entry is None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self._remember(key, entry)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, key, room_ids, data):
+        with timing('json'):
+            body = json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+            entry = (frozenset(room_ids), body, gzip.compress(body, mtime=0))
+        self.shared.set(key, entry, getattr(settings, 'FEED_CACHE_TIMEOUT', 300))
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > getattr(settings, 'FEED_CACHE_LOCAL_SIZE', 256):
+                self._local.popitem(last=False)
+
+    def forget_rooms(self, room_ids=None):
+        """Descarta do nível local as entradas das salas (todas, se None)"""
+        with self._lock:
+            if room_ids is None:
+                self._local.clear()
+                return
+            room_ids = set(room_ids)
+            for key in [k for k, entry in self._local.items() if entry[0] & room_ids]:
+                del self._local[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'local_size': len(self._local),
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+feed_cache = FeedCache()
+
+
+# =============================
+# Formato compacto (?format=compact)
+# =============================
+class CompactEvents:
+    """
+    Payload dicionarizado do events_feed: salas, professores e séries aparecem
+    uma vez só, e as ocorrências viram colunas de inteiros
+    (série, início em epoch, duração em minutos, sala, professor).
+    O decodificador fica em templates/reservas/calendar.html.
+    """
+
+    def __init__(self):
+        self.rooms, self.teachers, self.series = [], [], []
+        self._room_idx, self._teacher_idx, self._series_idx = {}, {}, {}
+        self.columns = {'series': [], 'start': [], 'duration': [], 'room': [], 'teacher': []}
+
+    @staticmethod
+    def _index(table, lookup, key, row):
+        idx = lookup.get(key)
+        if idx is None:
+            idx = lookup[key] = len(table)
+            table.append(row)
+        return idx
+
+    def add(self, event_id, kind, title, can_cancel, start, end, room, user, teacher_name):
+        cols = self.columns
+        cols['series'].append(self._index(
+            self.series, self._series_idx, event_id, [event_id, kind, title, int(can_cancel)]
+        ))
+        cols['start'].append(int(start.timestamp()))
+        cols['duration'].append(int((end - start).total_seconds() // 60))
+        cols['room'].append(self._index(self.rooms, self._room_idx, room.pk, [room.slug, room.name]))
+        cols['teacher'].append(self._index(self.teachers, self._teacher_idx, user.pk, [user.pk, teacher_name]))
+
+    def as_dict(self):
+        return {
+            'format': 'compact',
+            'rooms': self.rooms,
+            'teachers': self.teachers,
+            'series': self.series,
+            'columns': self.columns,
+        }
+
+
+def events_cache_key(request, start, end, viewer):
+    """
+    Chave do events_feed. `viewer` resume o que depende de quem pergunta
+    (can_cancel): 'staff', o id do usuário se ele tem reservas na janela,
+    ou 'guest' — professores sem reservas na janela compartilham a entrada.
+    """
+    return feed_cache.key(
+        FEED_REVISION, 'events', start.isoformat(), end.isoformat(),
+        request.GET.get('room') or '', request.GET.get('format') or '',
+        request_room_versions(request), viewer,
+    )
+
+
+def stream_json_array(items, batch=200):
+    """Serializa um iterável como array JSON em pedaços, sem montar a lista inteira"""
+    encoder = DjangoJSONEncoder()
+    yield '['
+    chunk, first = [], True
+    for item in items:
+        chunk.append(encoder.encode(item))
+        if len(chunk) >= batch:
+            yield ('' if first else ',') + ','.join(chunk)
+            chunk, first = [], False
+    if chunk:
+        yield ('' if first else ',') + ','.join(chunk)
+    yield ']'
+
+
+async def astream_json_array(items, batch=200):
+    """stream_json_array para iteráveis assíncronos (StreamingHttpResponse sob ASGI)"""
+    encoder = DjangoJSONEncoder()
+    yield '['
+    chunk, first = [], True
+    async for item in items:
+        chunk.append(encoder.encode(item))
+        if len(chunk) >= batch:
+            yield ('' if first else ',') + ','.join(chunk)
+            chunk, first = [], False
+    if chunk:
+        yield ('' if first else ',') + ','.join(chunk)
+    yield ']'
+
+
+def accepts_gzip(request):
+    """
+    Se o Accept-Encoding aceita gzip, respeitando os pesos: "gzip;q=0" recusa,
+    e "*" vale para o gzip quando ele não aparece pelo nome.
+    """
+    weights = {}
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in weights:
+            return weights[coding] > 0
+    return False
+
+
+def cached_response(request, entry):
+    """HttpResponse com o corpo em cache, comprimido se o cliente aceitar gzip"""
+    _, body, gz = entry
+    use_gzip = accepts_gzip(request)
+    response = HttpResponse(gz if use_gzip else body, content_type='application/json')
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
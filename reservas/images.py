@@ -0,0 +1,238 @@
+"""
+Variantes das imagens enviadas (Profile.photo e Notice.imagem).
+
+Cada upload gera versões redimensionadas em WebP e JPEG nos tamanhos fixos de
+VARIANTS, sem metadados (EXIF, GPS, perfis de cor embutidos): Pillow só grava
+o que recebe, e a orientação do EXIF é aplicada antes de descartá-lo. O
+original também é regravado sem metadados e limitado a MAX_SOURCE_SIZE px; o
+campo passa a apontar para ele (no storage por conteúdo, reservas/storage.py,
+conteúdo novo é nome novo).
+
+Os nomes das variantes ficam em <campo>_variants no próprio registro:
+    {"source": "blobs/3f/3fa1….png",
+     "webp": {"40": "blobs/9c/9c0e….webp", ...},
+     "jpeg": {"40": "blobs/a7/a712….jpg", ...}}
+"source" diz de qual arquivo elas saíram: enquanto não bate com o campo (upload
+novo ainda em processamento), os templates usam o original.
+
+O processamento roda depois do commit, num pool de threads
+(IMAGE_PROCESSING="thread", padrão) ou na própria requisição ("sync").
+manage.py process_images refaz as variantes de tudo que já está gravado.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Quadrados (avatar, recorte central) ou larguras (aviso, proporção mantida).
+# Cada tamanho exibido tem também a versão 2x para telas de alta densidade.
+VARIANTS = {
+    'photo': {'crop': True, 'sizes': (40, 80, 160, 320)},
+    'imagem': {'crop': False, 'sizes': (320, 640, 1280)},
+}
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+MAX_SOURCE_SIZE = 2048
+
+_executor = None
+
+
+def variants_attr(field_name):
+    return f'{field_name}_variants'
+
+
+def _variant_name(source_name, size, ext):
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'variants', f'{stem}-{size}.{ext}')
+
+
+def _load(field_file):
+    field_file.open('rb')
+    try:
+        image = Image.open(field_file)
+        image.load()
+    finally:
+        field_file.close()
+    return ImageOps.exif_transpose(image)
+
+
+def _flatten(image):
+    """RGB para JPEG (transparência vira fundo branco); WebP aceita RGBA"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, fmt):
+    pil_format, _, options = FORMATS[fmt]
+    if fmt == 'jpeg':
+        image = _flatten(image)
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _resize(image, size, crop):
+    if crop:
+        return ImageOps.fit(image, (size, size), Image.LANCZOS)
+    if image.width <= size:
+        return image
+    return image.resize((size, round(image.height * size / image.width)), Image.LANCZOS)
+
+
+def _stripped(name, image):
+    """Original sem metadados e com no máximo MAX_SOURCE_SIZE px, no formato da extensão"""
+    if max(image.size) > MAX_SOURCE_SIZE:
+        image = image.copy()
+        image.thumbnail((MAX_SOURCE_SIZE, MAX_SOURCE_SIZE), Image.LANCZOS)
+    ext = os.path.splitext(name)[1].lower()
+    fmt = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.webp': 'WEBP', '.gif': 'GIF'}.get(ext, 'PNG')
+    if fmt == 'JPEG':
+        image = _flatten(image)
+    buffer = BytesIO()
+    image.save(buffer, fmt, **({'optimize': True} if fmt in ('PNG', 'JPEG') else {}))
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(field_file, crop, sizes):
+    """
+    Grava o original limpo e as variantes e devolve o dicionário de nomes; o
+    original novo vai em "source". Cada arquivo gravado é uma referência no
+    storage (reservas/storage.py): se algo falhar no meio, elas são soltas.
+    """
+    image = _load(field_file)
+    storage = field_file.storage
+    saved = []
+    try:
+        source = storage.save(field_file.name, _stripped(field_file.name, image))
+        saved.append(source)
+        result = {'source': source}
+        # Sem ampliar: tamanhos maiores que a imagem viram um só, com a largura real (descritor "w" do srcset)
+        limit = min(image.size) if crop else image.width
+        sizes = sorted({min(size, limit) for size in sizes})
+        for fmt, (_, ext, _) in FORMATS.items():
+            result[fmt] = {}
+            for size in sizes:
+                content = ContentFile(_encode(_resize(image, size, crop), fmt))
+                name = storage.save(_variant_name(source, size, ext), content)
+                saved.append(name)
+                result[fmt][str(size)] = name
+    except BaseException:
+        for name in saved:
+            storage.delete(name)
+        raise
+    return result
+
+
+def delete_variants(storage, variants):
+    for fmt in FORMATS:
+        for name in (variants or {}).get(fmt, {}).values():
+            storage.delete(name)
+
+
+def process(model, pk, field_name, force=False):
+    """
+    Troca o arquivo do registro pelo original limpo e atualiza as variantes,
+    soltando o arquivo e as variantes anteriores. Grava com update()
+    condicionado ao nome do arquivo, então um upload que chegou no meio do
+    caminho não é sobrescrito (e o que foi gerado aqui é solto).
+    """
+    obj = model.objects.filter(pk=pk).first()
+    if obj is None:
+        return
+    field_file = getattr(obj, field_name)
+    storage = field_file.storage
+    attr = variants_attr(field_name)
+    old = getattr(obj, attr) or {}
+    source = field_file.name
+    if not source:
+        # Foto removida: só sobram as variantes antigas
+        if old:
+            model.objects.filter(pk=pk).update(**{attr: {}})
+            delete_variants(storage, old)
+        return
+    if old.get('source') == source and not force:
+        return
+
+    spec = VARIANTS[field_name]
+    try:
+        new = build_variants(field_file, spec['crop'], spec['sizes'])
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        logger.warning("Imagem não processada: %s pk=%s arquivo=%s (%s)", model.__name__, pk, source, exc)
+        if model.objects.filter(pk=pk, **{field_name: source}).update(**{attr: {'source': source}}):
+            delete_variants(storage, old)
+        return
+
+    updated = model.objects.filter(pk=pk, **{field_name: source}).update(**{field_name: new['source'], attr: new})
+    if updated:
+        storage.delete(source)
+        delete_variants(storage, old)
+    else:
+        storage.delete(new['source'])
+        delete_variants(storage, new)
+
+
+def _run(model, pk, field_name):
+    try:
+        process(model, pk, field_name)
+    except Exception:
+        logger.exception("Falha ao processar imagem: %s pk=%s", model.__name__, pk)
+    finally:
+        # Conexão aberta nesta thread do pool
+        close_old_connections()
+
+
+def schedule(instance, field_name):
+    """Processa depois do commit: no pool de threads ou aqui mesmo (IMAGE_PROCESSING)"""
+    model, pk = type(instance), instance.pk
+
+    def submit():
+        if getattr(settings, 'IMAGE_PROCESSING', 'thread') == 'sync':
+            process(model, pk, field_name)
+            return
+        global _executor
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_WORKERS', 2), thread_name_prefix='images'
+            )
+        _executor.submit(_run, model, pk, field_name)
+
+    transaction.on_commit(submit)
+
+
+def needs_processing(instance, field_name):
+    variants = getattr(instance, variants_attr(field_name)) or {}
+    return variants.get('source', '') != (getattr(instance, field_name).name or '')
+
+
+def srcset(field_file, fmt):
+    """'url 40w, url 80w' das variantes prontas do arquivo ('' se ainda não há)"""
+    variants = ready_variants(field_file)
+    if not variants or fmt not in variants:
+        return ''
+    storage = field_file.storage
+    return ', '.join(f'{storage.url(name)} {size}w' for size, name in variants[fmt].items())
+
+
+def ready_variants(field_file):
+    if not field_file:
+        return None
+    variants = getattr(field_file.instance, variants_attr(field_file.field.name), None) or {}
+    if variants.get('source') != field_file.name or not variants.get('jpeg'):
+        return None
+    return variants
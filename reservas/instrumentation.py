@@ -0,0 +1,281 @@
+"""
+Medições por requisição: SQL (consultas e tempo), ocorrências expandidas,
+serialização JSON e checagem de papel.
+
+ServerTimingMiddleware abre um RequestMetrics num ContextVar — que acompanha a
+requisição também nas threads do sync_to_async — e, no fim, devolve os números
+no cabeçalho Server-Timing (se SERVER_TIMING), numa linha de log
+"reservas.timing" (DEBUG; WARNING acima de SLOW_REQUEST_MS) e no registro de
+reservas/metrics.py.
+
+Respostas em streaming (feed admin em janelas grandes) fazem o trabalho
+pesado enquanto o corpo é enviado, depois de o middleware retornar: o
+RequestMetrics volta a valer em volta de cada pedaço, e o registro e o log
+saem quando o corpo termina (o Server-Timing, já enviado, só cobre o começo).
+
+API para o resto do código, sem efeito fora de uma requisição:
+    with timing('json'): ...        # soma a duração do bloco em "json"
+    count('occurrences', n)         # soma n ao contador
+
+Este módulo é importado pela configuração de logging (RateLimitFilter), antes
+de os apps carregarem: não pode importar models.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import observe_request
+
+logger = logging.getLogger('reservas.timing')
+
+_metrics = ContextVar('reservas_request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'durations', 'counts')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def incr(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self):
+        data = {f'{name}_ms': round(seconds * 1000, 1) for name, seconds in self.durations.items()}
+        data.update(self.counts)
+        data['total_ms'] = round(self.total_ms(), 1)
+        return data
+
+    def header(self):
+        parts = []
+        for name, seconds in self.durations.items():
+            part = f'{name};dur={seconds * 1000:.1f}'
+            if name == 'sql':
+                part += f';desc="{self.counts.get("queries", 0)} consultas"'
+            parts.append(part)
+        parts.extend(
+            f'{name};desc="{value}"' for name, value in self.counts.items() if name != 'queries'
+        )
+        parts.append(f'total;dur={self.total_ms():.1f}')
+        return ', '.join(parts)
+
+
+def current():
+    return _metrics.get()
+
+
+@contextmanager
+def timing(name):
+    metrics = _metrics.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - started)
+
+
+def count(name, n=1):
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.incr(name, n)
+
+
+@contextmanager
+def _active(metrics):
+    token = _metrics.set(metrics)
+    try:
+        yield
+    finally:
+        _metrics.reset(token)
+
+
+def on_stream_end(response, callback, around=None):
+    """
+    Chama callback() uma vez, quando o corpo de uma resposta em streaming
+    terminou de sair ou a resposta foi fechada (cliente desistiu, corpo nunca
+    lido). around(): context manager aberto em volta de cada pedaço produzido.
+    Devolve False (sem efeito) se a resposta não é streaming ou é um arquivo,
+    que o servidor envia direto.
+    """
+    if not getattr(response, 'streaming', False) or getattr(response, 'file_to_stream', None) is not None:
+        return False
+    done = False
+
+    def finish():
+        nonlocal done
+        if not done:
+            done = True
+            callback()
+
+    content = response.streaming_content
+    around = around or nullcontext
+    if response.is_async:
+        async def wrapped():
+            try:
+                iterator = content.__aiter__()
+                while True:
+                    with around():
+                        try:
+                            chunk = await iterator.__anext__()
+                        except StopAsyncIteration:
+                            return
+                    yield chunk
+            finally:
+                finish()
+    else:
+        def wrapped():
+            try:
+                iterator = iter(content)
+                while True:
+                    with around():
+                        try:
+                            chunk = next(iterator)
+                        except StopIteration:
+                            return
+                    yield chunk
+            finally:
+                finish()
+
+    response.streaming_content = wrapped()
+    # close() roda mesmo se o corpo nunca foi iterado (aí o finally acima não roda)
+    response._resource_closers.append(finish)
+    return True
+
+
+# =============================
+# SQL (execute_wrapper em toda conexão)
+# =============================
+def _sql_wrapper(execute, sql, params, many, context):
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add('sql', time.perf_counter() - started)
+        metrics.incr('queries')
+
+
+def _install_sql_wrapper(connection, **kwargs):
+    if _sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_sql_wrapper)
+
+
+# Conexões abertas depois daqui (inclusive nas threads do sync_to_async)
+connection_created.connect(_install_sql_wrapper)
+
+
+# =============================
+# Middleware
+# =============================
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        for connection in connections.all():
+            _install_sql_wrapper(connection)
+        token = _metrics.set(RequestMetrics())
+        try:
+            response = self.get_response(request)
+            return self._finish(request, response)
+        finally:
+            _metrics.reset(token)
+
+    async def __acall__(self, request):
+        token = _metrics.set(RequestMetrics())
+        try:
+            response = await self.get_response(request)
+            return self._finish(request, response)
+        finally:
+            _metrics.reset(token)
+
+    def _finish(self, request, response):
+        metrics = _metrics.get()
+        if getattr(settings, 'SERVER_TIMING', False):
+            response['Server-Timing'] = metrics.header()
+        if not on_stream_end(response, lambda: self._record(request, response, metrics), lambda: _active(metrics)):
+            self._record(request, response, metrics)
+        return response
+
+    def _record(self, request, response, metrics):
+        data = metrics.as_dict()
+        match = getattr(request, 'resolver_match', None)
+        # Nome da URL (padrão da rota se não tiver nome); nunca o caminho, que não tem limite
+        view = (match.view_name or match.route) if match else 'unresolved'
+        observe_request(
+            view, response.status_code, data['total_ms'] / 1000,
+            queries=data.get('queries', 0), occurrences=data.get('occurrences', 0),
+        )
+
+        slow = data['total_ms'] >= getattr(settings, 'SLOW_REQUEST_MS', 500)
+        level = logging.WARNING if slow else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(
+                level,
+                'request view=%s path=%s status=%s total_ms=%.1f sql_ms=%.1f queries=%d occurrences=%d json_ms=%.1f',
+                view, request.path, response.status_code,
+                data['total_ms'], data.get('sql_ms', 0.0), data.get('queries', 0),
+                data.get('occurrences', 0), data.get('json_ms', 0.0),
+                extra={'timing': data},
+            )
+
+
+# =============================
+# Logging com limite de taxa
+# =============================
+class RateLimitFilter(logging.Filter):
+    """
+    Deixa passar no máximo `per_minute` registros por minuto de cada mensagem
+    (logger + texto do formato); o primeiro depois da janela informa quantos caíram.
+    """
+
+    def __init__(self, per_minute=60):
+        super().__init__()
+        self.per_minute = per_minute
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.per_minute:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            started, sent, dropped = self._windows.get(key, (now, 0, 0))
+            if now - started >= 60:
+                if dropped:
+                    record.msg = f'{record.msg} (+{dropped} suprimidas no último minuto)'
+                started, sent, dropped = now, 0, 0
+            if sent >= self.per_minute:
+                self._windows[key] = (started, sent, dropped + 1)
+                return False
+            self._windows[key] = (started, sent + 1, dropped)
+        return True
@@ -0,0 +1,54 @@
+"""
+Seção crítica por sala para criar/alterar reservas e aulas fixas.
+
+"Checa conflito → grava" só é seguro se ninguém grava na mesma sala no meio
+do caminho. room_lock() abre uma transação e trava as linhas de Room
+envolvidas (SELECT ... FOR UPDATE, sempre em ordem de pk para não haver
+deadlock); salas diferentes não disputam a mesma trava. As Room devolvidas
+vêm relidas dentro da trava, com a schedule_version atual, e é com elas que
+os índices de conflito devem ser consultados.
+
+No PostgreSQL dá para somar uma exclusion constraint sobre as ocorrências
+materializadas (manage.py booking_constraint), que recusa sobreposições de
+reservas mesmo de quem grava por fora dessas views.
+"""
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .conflicts import conflict_index
+from .models import Room
+
+EXCLUSION_CONSTRAINT = 'occurrence_no_double_booking'
+
+
+def lock_rooms(room_ids):
+    """Trava as salas até o fim da transação atual. Devolve {pk: Room} relidas"""
+    room_ids = sorted({rid for rid in room_ids if rid is not None})
+    if not connection.features.has_select_for_update:
+        # SQLite ignora FOR UPDATE: um UPDATE neutro pega a trava de escrita
+        # já no início, e as outras transações esperam em vez de falhar no commit
+        Room.objects.filter(pk__in=room_ids).update(schedule_version=F('schedule_version'))
+    rooms = Room.objects.select_for_update().filter(pk__in=room_ids).order_by('pk')
+    return {room.pk: room for room in rooms}
+
+
+@contextmanager
+def room_lock(room_ids):
+    """
+    with room_lock([room.pk]) as rooms: checa conflitos e grava.
+    Se algo falhar, a transação volta e os índices locais das salas são descartados
+    (um índice reconstruído dentro da trava pode ter visto gravações que não valeram).
+    """
+    room_ids = list(room_ids)
+    try:
+        with transaction.atomic():
+            yield lock_rooms(room_ids)
+    except Exception:
+        conflict_index.forget(room_ids)
+        raise
+
+
+def exclusion_constraint_available():
+    return connection.vendor == 'postgresql'
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time as _time
+import types
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import path
+from django.utils.timezone import localtime, now
+
+from reservas import async_views, views
+from reservas.feeds import feed_cache
+from reservas.models import Room
+
+BENCH_USER = 'bench-bot'
+ENDPOINTS = ('events', 'admin', 'availability')
+
+
+def _urlconf(module):
+    """URLconf só com as três APIs, apontando para as views síncronas ou assíncronas"""
+    urlconf = types.ModuleType(f'bench_urls_{module.__name__.rsplit(".", 1)[-1]}')
+    urlconf.urlpatterns = [
+        path('api/events/', module.events_feed),
+        path('api/admin-events/', module.admin_events_feed),
+        path('api/availability/', module.availability),
+    ]
+    return urlconf
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara as APIs de leitura pelos dois caminhos, com o middleware completo: '
+        'views síncronas no handler WSGI com N threads (N workers síncronos do gunicorn) '
+        'x views assíncronas no handler ASGI com N requisições simultâneas num único '
+        'event loop (um worker de um servidor ASGI). Cada requisição pede uma janela diferente, '
+        'então o cache de feeds fica frio. Cria só o usuário bench-bot e sessões.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--endpoint', choices=ENDPOINTS + ('all',), default='all')
+        parser.add_argument('--days', type=int, default=7, help='Tamanho da janela dos feeds')
+
+    def handle(self, *args, **options):
+        n, concurrency = options['requests'], options['concurrency']
+        if n < 1 or concurrency < 1:
+            raise CommandError('Use --requests >= 1 e --concurrency >= 1')
+        slugs = list(Room.objects.order_by('pk').values_list('slug', flat=True))
+        if not slugs:
+            raise CommandError('Nenhuma sala cadastrada.')
+
+        user, _ = User.objects.get_or_create(
+            username=BENCH_USER, defaults={'is_superuser': True, 'is_staff': True}
+        )
+        endpoints = ENDPOINTS if options['endpoint'] == 'all' else (options['endpoint'],)
+        hosts = list(settings.ALLOWED_HOSTS) + ['testserver']
+
+        self.stdout.write(f'{n} requisições, {concurrency} simultâneas, banco {connections["default"].vendor}')
+        self.stdout.write(f'{"endpoint":<14}{"caminho":<8}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"erros":>7}')
+        for endpoint in endpoints:
+            make = self._request_maker(endpoint, slugs, options['days'])
+            for label, run, urlconf in (
+                ('wsgi', self._run_wsgi, _urlconf(views)),
+                ('asgi', self._run_asgi, _urlconf(async_views)),
+            ):
+                self._cold()
+                with override_settings(ROOT_URLCONF=urlconf, ALLOWED_HOSTS=hosts):
+                    elapsed, latencies, errors = run(make, n, concurrency, user)
+                latencies.sort()
+                self.stdout.write(
+                    f'{endpoint:<14}{label:<8}{n / elapsed:>9.1f}'
+                    f'{latencies[len(latencies) // 2] * 1000:>9.1f}'
+                    f'{latencies[int(len(latencies) * 0.95) - 1] * 1000:>9.1f}{errors:>7}'
+                )
+
+    def _cold(self):
+        feed_cache.forget_rooms()
+        feed_cache.shared.clear()
+
+    def _request_maker(self, endpoint, slugs, days):
+        """i -> (método, url, corpo JSON ou None); janelas e salas variam com i"""
+        today = localtime(now()).date()
+
+        def window(i):
+            start = today + timedelta(days=i % 150)
+            return {'start': f'{start.isoformat()}T00:00:00', 'end': f'{(start + timedelta(days=days)).isoformat()}T00:00:00'}
+
+        if endpoint == 'events':
+            return lambda i: ('get', '/api/events/?' + urlencode(window(i)), None)
+        if endpoint == 'admin':
+            return lambda i: ('get', '/api/admin-events/?' + urlencode(window(i)), None)
+        return lambda i: ('post', '/api/availability/', {
+            'date': (today + timedelta(days=1 + i % 60)).isoformat(),
+            'room_slug': slugs[i % len(slugs)],
+            'duration_min': 60,
+        })
+
+    def _run_wsgi(self, make, n, concurrency, user):
+        latencies, errors, lock = [], [], threading.Lock()
+        indices = iter(range(n))
+
+        def worker():
+            client = Client()
+            client.force_login(user)
+            try:
+                while True:
+                    with lock:
+                        i = next(indices, None)
+                    if i is None:
+                        return
+                    method, url, body = make(i)
+                    t0 = _time.perf_counter()
+                    if body is None:
+                        response = client.get(url)
+                    else:
+                        response = client.post(url, body, content_type='application/json')
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    took = _time.perf_counter() - t0
+                    with lock:
+                        latencies.append(took)
+                        if response.status_code != 200:
+                            errors.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        started = _time.perf_counter()
+        pool = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for th in pool:
+            th.start()
+        for th in pool:
+            th.join()
+        return _time.perf_counter() - started, latencies, len(errors)
+
+    def _run_asgi(self, make, n, concurrency, user):
+        client = AsyncClient()
+        client.force_login(user)
+        latencies, errors = [], []
+
+        async def one(i, gate):
+            async with gate:
+                method, url, body = make(i)
+                t0 = _time.perf_counter()
+                if body is None:
+                    response = await client.get(url)
+                else:
+                    response = await client.post(url, body, content_type='application/json')
+                if response.streaming:
+                    [chunk async for chunk in response.streaming_content]
+                latencies.append(_time.perf_counter() - t0)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+        async def main():
+            gate = asyncio.Semaphore(concurrency)
+            try:
+                await asyncio.gather(*(one(i, gate) for i in range(n)))
+            finally:
+                await sync_to_async(connections.close_all)()
+
+        started = _time.perf_counter()
+        asyncio.run(main())
+        return _time.perf_counter() - started, latencies, len(errors)
@@ -0,0 +1,37 @@
+from datetime import timedelta
+from timeit import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import localtime, now
+
+from reservas.recurrence import expand_window, parse_rule
+
+
+class Command(BaseCommand):
+    help = 'Compara a expansão de RRULE (dateutil x ancorada na janela) conforme a idade da série'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rule', default='FREQ=WEEKLY;BYDAY=MO,WE,FR')
+        parser.add_argument('--years', type=int, nargs='+', default=[0, 1, 2, 5, 10])
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        window_start = localtime(now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        window_end = window_start + timedelta(days=7)
+        repeat = options['repeat']
+
+        self.stdout.write(f"Regra: {options['rule']} — janela de 7 dias, {repeat} repetições")
+        self.stdout.write(f"{'idade (anos)':>12} {'dateutil (ms)':>14} {'ancorada (ms)':>14}")
+
+        for years in options['years']:
+            dtstart = window_start - timedelta(days=365 * years) + timedelta(hours=10)
+            rule = parse_rule(options['rule'], dtstart)
+            if rule is None:
+                self.stderr.write('Regra inválida')
+                return
+            expected = list(rule.between(window_start, window_end, inc=True))
+            assert expand_window(rule, window_start, window_end) == expected
+
+            slow = timeit(lambda: rule.between(window_start, window_end, inc=True), number=repeat)
+            fast = timeit(lambda: expand_window(rule, window_start, window_end), number=repeat)
+            self.stdout.write(f"{years:>12} {slow * 1000 / repeat:>14.3f} {fast * 1000 / repeat:>14.3f}")
@@ -0,0 +1,234 @@
+import json
+import statistics
+import time as _time
+from datetime import time, timedelta
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import localtime, now
+
+from reservas import synthetic, views
+from reservas.conflicts import conflict_index
+from reservas.feeds import feed_cache
+from reservas.models import Room
+
+BUDGETS_FILE = Path(__file__).resolve().parents[2] / 'bench_budgets.json'
+MAX_REPEAT = 27
+BENCHMARKS = (
+    'events_feed', 'admin_events_feed', 'availability',
+    'reserve_view', 'has_conflict', 'admin_grade_create',
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede os caminhos quentes da agenda (feeds, disponibilidade, reserva, checagem de '
+        'conflito e criação de aula fixa) sobre a massa sintética em várias escalas: '
+        'mediana em ms e consultas SQL por chamada. Cada escala é gerada e medida dentro '
+        'de uma transação desfeita no fim, então o banco não muda. '
+        'Com --check, falha se algum número passar do orçamento em reservas/bench_budgets.json.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', nargs='+', choices=sorted(synthetic.SCALES), default=['small', 'medium'])
+        parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='Roda só estes benchmarks')
+        parser.add_argument('--repeat', type=int, default=7)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--check', action='store_true', help='Falha se estourar os orçamentos')
+        parser.add_argument('--budgets', type=Path, default=BUDGETS_FILE)
+        parser.add_argument('--record', action='store_true',
+                            help='Grava as medições como novos orçamentos (ms x3, consultas exatas)')
+
+    def handle(self, *args, **options):
+        # Cada chamada de reserve_view/admin_grade_create precisa de um horário livre só dela
+        if not 1 <= options['repeat'] <= MAX_REPEAT:
+            raise CommandError(f'Use 1 <= --repeat <= {MAX_REPEAT}')
+        budgets = {}
+        if options['check'] or options['record']:
+            if options['budgets'].exists():
+                budgets = json.loads(options['budgets'].read_text())
+            elif options['check']:
+                raise CommandError(f'Orçamentos não encontrados: {options["budgets"]}')
+
+        names = options['only'] or BENCHMARKS
+        self.stdout.write(f'{"escala":<8}{"benchmark":<20}{"mediana ms":>11}{"máx ms":>9}{"consultas":>10}  orçamento')
+        failures = []
+        for scale in options['scales']:
+            results = self._run_scale(scale, names, options['repeat'], options['seed'])
+            for name, (median_ms, max_ms, queries) in results.items():
+                budget = budgets.get(scale, {}).get(name)
+                verdict = ''
+                if budget:
+                    over = []
+                    if median_ms > budget['ms']:
+                        over.append(f'{median_ms:.1f} > {budget["ms"]} ms')
+                    if queries > budget['queries']:
+                        over.append(f'{queries} > {budget["queries"]} consultas')
+                    verdict = 'ESTOUROU: ' + '; '.join(over) if over else f'ok (≤ {budget["ms"]} ms, ≤ {budget["queries"]})'
+                    if over:
+                        failures.append(f'{scale}/{name}: ' + '; '.join(over))
+                self.stdout.write(f'{scale:<8}{name:<20}{median_ms:>11.1f}{max_ms:>9.1f}{queries:>10}  {verdict}')
+                if options['record']:
+                    budgets.setdefault(scale, {})[name] = {
+                        'ms': max(5, round(median_ms * 3)),
+                        'queries': queries,
+                    }
+
+        if options['record']:
+            options['budgets'].write_text(json.dumps(budgets, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(f'Orçamentos gravados em {options["budgets"]}.')
+        if options['check']:
+            if failures:
+                raise CommandError('Orçamento estourado:\n' + '\n'.join(failures))
+            self.stdout.write(self.style.SUCCESS('Dentro dos orçamentos.'))
+
+    # =============================
+    # Uma escala (gerada e desfeita numa transação)
+    # =============================
+    def _run_scale(self, scale, names, repeat, seed):
+        results = {}
+        try:
+            with transaction.atomic():
+                started = _time.perf_counter()
+                synthetic.generate(**synthetic.SCALES[scale], seed=seed)
+                self.stdout.write(f'{scale}: massa gerada em {_time.perf_counter() - started:.1f}s')
+                for name in names:
+                    results[name] = self._measure(getattr(self, f'_bench_{name}')(), repeat)
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            # Índices e caches locais podem ter guardado salas que a transação desfez
+            conflict_index.clear()
+            feed_cache.forget_rooms()
+            feed_cache.shared.clear()
+        return results
+
+    def _measure(self, bench, repeat):
+        """(mediana ms, máximo ms, consultas na pior chamada); a 1ª chamada só aquece"""
+        prepare, call = bench
+        timings, queries = [], 0
+        for i in range(repeat + 1):
+            args = prepare(i)
+            with CaptureQueriesContext(connection) as ctx:
+                started = _time.perf_counter()
+                # Tudo roda dentro da transação da escala: os on_commit (índice de
+                # conflitos, avisos) rodam no fim da chamada, como no commit de produção
+                with TestCase.captureOnCommitCallbacks(execute=True):
+                    status = call(*args)
+                elapsed = _time.perf_counter() - started
+            if status != 200:
+                raise CommandError(f'Chamada {i} devolveu {status}')
+            if i:
+                timings.append(elapsed * 1000)
+                queries = max(queries, len(ctx.captured_queries))
+        return statistics.median(timings), max(timings), queries
+
+    # =============================
+    # Benchmarks: cada um devolve (prepare(i) -> args, call(*args) -> status)
+    # =============================
+    def _fixtures(self):
+        rooms = list(Room.objects.filter(slug__startswith=synthetic.PREFIX).order_by('pk'))
+        teacher = User.objects.filter(username=f'{synthetic.PREFIX}prof-1').get()
+        admin = User.objects.filter(username=f'{synthetic.PREFIX}admin').get()
+        return rooms, teacher, admin, localtime(now()).date()
+
+    def _request(self, request, user_pk):
+        # Usuário relido a cada chamada: o papel memorizado no objeto não passa de uma para outra
+        request.user = User.objects.get(pk=user_pk)
+        return request
+
+    def _cold_feed(self):
+        feed_cache.forget_rooms()
+        feed_cache.shared.clear()
+
+    def _week(self, today, i):
+        start = today + timedelta(days=7 * (i % 20))
+        return {'start': f'{start.isoformat()}T00:00:00', 'end': f'{(start + timedelta(days=7)).isoformat()}T00:00:00'}
+
+    def _bench_events_feed(self):
+        rooms, teacher, admin, today = self._fixtures()
+        factory = RequestFactory()
+
+        def prepare(i):
+            self._cold_feed()
+            return (self._request(factory.get('/api/events/', self._week(today, i)), teacher.pk),)
+        return prepare, lambda request: views.events_feed(request).status_code
+
+    def _bench_admin_events_feed(self):
+        rooms, teacher, admin, today = self._fixtures()
+        factory = RequestFactory()
+
+        def prepare(i):
+            return (self._request(factory.get('/api/admin-events/', self._week(today, i)), admin.pk),)
+        return prepare, lambda request: views.admin_events_feed(request).status_code
+
+    def _bench_availability(self):
+        rooms, teacher, admin, today = self._fixtures()
+        factory = RequestFactory()
+
+        def prepare(i):
+            body = json.dumps({
+                'date': (today + timedelta(days=1 + i % 30)).isoformat(),
+                'room_slug': rooms[i % len(rooms)].slug,
+                'duration_min': 60,
+            })
+            return (self._request(factory.post('/api/availability/', body, content_type='application/json'), teacher.pk),)
+        return prepare, lambda request: views.availability(request).status_code
+
+    def _bench_reserve_view(self):
+        rooms, teacher, admin, today = self._fixtures()
+        factory = RequestFactory()
+
+        def prepare(i):
+            # Depois de LAST_HOUR a massa sintética não ocupa nada. _has_conflict olha a
+            # próxima data do dia da semana, então o horário também anda a cada semana
+            minute = synthetic.LAST_HOUR * 60 + 15 * (i // 7)
+            return (self._request(factory.post('/reserve/', {
+                'room_slug': rooms[0].slug,
+                'date': (today + timedelta(days=1 + i)).isoformat(),
+                'start_time': f'{minute // 60:02d}:{minute % 60:02d}',
+                'duration_min': 15,
+            }), teacher.pk),)
+        return prepare, lambda request: views.reserve_view(request).status_code
+
+    def _bench_has_conflict(self):
+        rooms, teacher, admin, today = self._fixtures()
+        hours = synthetic.LAST_HOUR - synthetic.FIRST_HOUR
+
+        def prepare(i):
+            hour = synthetic.FIRST_HOUR + i % hours
+            return rooms[i % len(rooms)], i % 7, time(hour), time(hour + 1)
+
+        def call(*args):
+            views._has_conflict(*args)
+            return 200
+        return prepare, call
+
+    def _bench_admin_grade_create(self):
+        rooms, teacher, admin, today = self._fixtures()
+        if len(rooms) < 2:
+            raise CommandError('admin_grade_create precisa de ao menos 2 salas')
+        factory = RequestFactory()
+
+        def prepare(i):
+            # Sala 0 fica com o reserve_view; aqui uma célula livre (sala, dia) por chamada
+            room = rooms[1 + (i // 7) % (len(rooms) - 1)]
+            request = factory.post('/admin-grade/create/', {
+                'room': room.slug,
+                'user': teacher.pk,
+                'title': 'Benchmark',
+                'weekday': [i % 7],
+                'start': f'{synthetic.LAST_HOUR}:00',
+                'duration': 45,
+            }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            return (self._request(request, admin.pk),)
+        return prepare, lambda request: views.admin_grade_create(request).status_code
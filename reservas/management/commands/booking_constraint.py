@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from reservas.locking import EXCLUSION_CONSTRAINT, exclusion_constraint_available
+from reservas.models import Occurrence
+
+
+class Command(BaseCommand):
+    help = (
+        'Liga/desliga (PostgreSQL) a exclusion constraint que impede reservas '
+        'sobrepostas na mesma sala, direto nas ocorrências materializadas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', action='store_true', help='Remove a constraint')
+
+    def handle(self, *args, **options):
+        if not exclusion_constraint_available():
+            raise CommandError('Exclusion constraints exigem PostgreSQL; no resto vale a trava por sala.')
+
+        table = connection.ops.quote_name(Occurrence._meta.db_table)
+        name = connection.ops.quote_name(EXCLUSION_CONSTRAINT)
+        with connection.cursor() as cursor:
+            if options['drop']:
+                cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}')
+                self.stdout.write(self.style.SUCCESS('Constraint removida.'))
+                return
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}')
+            # Falha se já houver reservas sobrepostas: corrija-as antes de ligar
+            cursor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT {name} EXCLUDE USING gist '
+                f'(room_id WITH =, tstzrange("start", "end", \'[)\') WITH &&) '
+                f'WHERE (reservation_id IS NOT NULL)'
+            )
+        self.stdout.write(self.style.SUCCESS('Constraint criada.'))
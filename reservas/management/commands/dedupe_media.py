@@ -0,0 +1,103 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reservas import images
+from reservas.models import MediaBlob, Notice, Profile
+from reservas.storage import PREFIX, is_blob, media_storage
+
+TARGETS = ((Profile, 'photo'), (Notice, 'imagem'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Passa para o armazenamento por conteúdo (media/blobs/) as fotos de perfil e imagens '
+        'de avisos gravadas com nome comum, junta os arquivos idênticos e refaz as variantes; '
+        'arquivos antigos que ninguém mais usa são apagados. Com --recount, recalcula as '
+        'referências de MediaBlob a partir dos registros e apaga blobs órfãos '
+        '(rode sem uploads em andamento).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help='Só recalcula as referências')
+        parser.add_argument('--dry-run', action='store_true', help='Mostra o que faria, sem gravar')
+
+    def handle(self, *args, **options):
+        if not options['recount']:
+            self._migrate(options['dry_run'])
+        if options['recount'] or not options['dry_run']:
+            self._recount(options['dry_run'])
+
+    def _legacy_names(self):
+        names = set()
+        for model, field_name in TARGETS:
+            for name in model.objects.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''}) \
+                    .values_list(field_name, flat=True):
+                if not is_blob(name):
+                    names.add(name)
+        return names
+
+    def _migrate(self, dry_run):
+        storage = media_storage()
+        moved, missing, freed = 0, 0, 0
+        for name in sorted(self._legacy_names()):
+            if not storage.exists(name):
+                self.stderr.write(f'Arquivo não encontrado: {name}')
+                missing += 1
+                continue
+            size = storage.size(name)
+            if dry_run:
+                self.stdout.write(f'{name} ({size} bytes)')
+                moved += 1
+                continue
+            with transaction.atomic():
+                for model, field_name in TARGETS:
+                    for pk in model.objects.filter(**{field_name: name}).values_list('pk', flat=True):
+                        with storage.open(name) as content:
+                            blob = storage.save(name, content)
+                        model.objects.filter(pk=pk).update(**{field_name: blob})
+                        # Variantes (com os nomes antigos) e original limpo refeitos como blobs
+                        images.process(model, pk, field_name, force=True)
+                        moved += 1
+            storage.delete(name)
+            freed += size
+        verb = 'seria(m) movido(s)' if dry_run else 'movido(s)'
+        self.stdout.write(f'{moved} arquivo(s) {verb}; {missing} ausente(s); {freed} bytes de nomes antigos apagados.')
+
+    def _recount(self, dry_run):
+        storage = media_storage()
+        refs = Counter()
+        for model, field_name in TARGETS:
+            attr = images.variants_attr(field_name)
+            for name, variants in model.objects.values_list(field_name, attr):
+                if is_blob(name):
+                    refs[name] += 1
+                for fmt in images.FORMATS:
+                    refs.update(n for n in (variants or {}).get(fmt, {}).values() if is_blob(n))
+
+        fixed = 0
+        known = dict(MediaBlob.objects.values_list('name', 'refs'))
+        for name in set(known) | set(refs):
+            if known.get(name) == refs[name]:
+                continue
+            fixed += 1
+            if dry_run:
+                self.stdout.write(f'{name}: {known.get(name)} -> {refs[name]}')
+                continue
+            if refs[name]:
+                size = storage.size(name) if storage.exists(name) else 0
+                MediaBlob.objects.update_or_create(name=name, defaults={'refs': refs[name], 'size': size})
+            else:
+                MediaBlob.objects.filter(name=name).delete()
+
+        orphans = 0
+        if storage.exists(PREFIX):
+            for shard in storage.listdir(PREFIX)[0]:
+                for filename in storage.listdir(f'{PREFIX}/{shard}')[1]:
+                    name = f'{PREFIX}/{shard}/{filename}'
+                    if not refs[name]:
+                        orphans += 1
+                        if not dry_run:
+                            storage.purge(name)
+        self.stdout.write(f'{fixed} contagem(ns) corrigida(s); {orphans} blob(s) órfão(s) apagado(s).')
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from reservas.timetable import import_timetable, parse_file
+
+
+class Command(BaseCommand):
+    help = 'Importa a grade fixa de um arquivo CSV ou ICS e mostra os conflitos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Arquivo .csv ou .ics')
+        parser.add_argument('--dry-run', action='store_true', help='Só valida, não grava nada')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        try:
+            parsed = parse_file(path.name, path.read_bytes())
+        except (OSError, UnicodeDecodeError) as exc:
+            raise CommandError(f'Não foi possível ler {path}: {exc}')
+
+        result = import_timetable(parsed, dry_run=options['dry_run'])
+
+        for problem in result['problems']:
+            if 'error' in problem:
+                detail = problem['error']
+            else:
+                detail = 'conflita com ' + ', '.join(problem['conflicts'])
+            self.stdout.write(self.style.WARNING(f"linha {problem['line']}: {detail}"))
+
+        if options['dry_run']:
+            self.stdout.write(f"{result['valid']} aula(s) válida(s), nada gravado (--dry-run).")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{result['created']} aula(s) criada(s), {len(result['problems'])} linha(s) recusada(s)."
+            ))
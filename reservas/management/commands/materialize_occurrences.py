@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from reservas.models import Occurrence
+from reservas.occurrences import roll_horizon
+
+
+class Command(BaseCommand):
+    help = 'Avança (ou reconstrói) o horizonte de ocorrências materializadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Apaga e gera tudo de novo')
+
+    def handle(self, *args, **options):
+        horizon = roll_horizon(rebuild=options['rebuild'])
+        total = Occurrence.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Horizonte {horizon.start:%Y-%m-%d} → {horizon.end:%Y-%m-%d} ({total} ocorrências).'
+        ))
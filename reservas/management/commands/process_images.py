@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from reservas import images
+from reservas.models import Notice, Profile
+
+TARGETS = ((Profile, 'photo'), (Notice, 'imagem'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera as variantes WebP/JPEG (e regrava sem metadados) das fotos de perfil e '
+        'imagens de avisos que ainda não têm, na própria execução. Com --force refaz todas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Refaz mesmo as que já têm variantes')
+
+    def handle(self, *args, **options):
+        for model, field_name in TARGETS:
+            attr = images.variants_attr(field_name)
+            qs = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            done = 0
+            for obj in qs.only('pk', field_name, attr).iterator():
+                if not (options['force'] or images.needs_processing(obj, field_name)):
+                    continue
+                images.process(model, obj.pk, field_name, force=options['force'])
+                done += 1
+            self.stdout.write(f'{model.__name__}.{field_name}: {done} imagem(ns) processada(s).')
@@ -0,0 +1,117 @@
+import threading
+import time as _time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import RequestFactory
+from django.utils.timezone import localtime, now
+
+from reservas.models import Occurrence, Room
+from reservas.views import reserve_view
+
+ROOM_PREFIX = 'stress-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga da trava por sala: várias threads reservam o mesmo horário '
+        '(só uma pode vencer) e depois horários livres em uma ou em várias salas. '
+        'Grava no banco configurado: rode contra uma cópia, nunca em produção.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--per-thread', type=int, default=10, help='Reservas por thread na fase de vazão')
+        parser.add_argument('--rooms', type=int, default=4)
+        parser.add_argument('--keep', action='store_true', help='Não apaga as salas de teste no fim')
+
+    def handle(self, *args, **options):
+        threads, per_thread, n_rooms = options['threads'], options['per_thread'], options['rooms']
+        if threads < 2 or n_rooms < 1:
+            raise CommandError('Use --threads >= 2 e --rooms >= 1')
+
+        user, _ = User.objects.get_or_create(username='stress-bot', defaults={'is_superuser': True})
+        rooms = [
+            Room.objects.get_or_create(slug=f'{ROOM_PREFIX}{i}', defaults={'name': f'Stress {i}'})[0]
+            for i in range(n_rooms)
+        ]
+        day = localtime(now()).date() + timedelta(days=7)
+        try:
+            # 1) Todos no mesmo horário da mesma sala: exatamente um 200
+            statuses = self._run(threads, lambda t, i: (rooms[0], day, 8 * 60), 1, user)
+            wins = statuses.count(200)
+            self.stdout.write(f'Mesmo horário: {wins} sucesso(s), {statuses.count(409)} conflito(s), '
+                              f'outros: {sorted(set(statuses) - {200, 409})}')
+
+            # 2) Vazão: horários distintos numa sala só x espalhados entre as salas
+            slot = lambda t, i: 10 * 60 + (t * per_thread + i) * 15
+            single = self._timed(threads, lambda t, i: (rooms[0], day + timedelta(days=1), slot(t, i)), per_thread, user)
+            spread = self._timed(threads, lambda t, i: (rooms[t % n_rooms], day + timedelta(days=2), slot(t, i)), per_thread, user)
+            self.stdout.write(f'Vazão, uma sala: {single:.1f} reservas/s')
+            self.stdout.write(f'Vazão, {n_rooms} salas: {spread:.1f} reservas/s')
+            if connection.vendor == 'sqlite':
+                self.stdout.write('(SQLite serializa toda escrita no arquivo; a diferença entre salas só aparece no PostgreSQL)')
+
+            doubles = self._double_bookings(rooms)
+            self.stdout.write(f'Reservas sobrepostas: {doubles}')
+            if wins != 1 or doubles:
+                raise CommandError('Falhou: houve reserva dupla.')
+            self.stdout.write(self.style.SUCCESS('OK: nenhuma reserva dupla.'))
+        finally:
+            if not options['keep']:
+                Room.objects.filter(slug__startswith=ROOM_PREFIX).delete()
+
+    def _run(self, threads, target, per_thread, user):
+        """Cada thread faz `per_thread` POSTs em reserve_view; devolve os status"""
+        factory = RequestFactory()
+        barrier = threading.Barrier(threads)
+        statuses, lock = [], threading.Lock()
+
+        def worker(t):
+            try:
+                barrier.wait()
+                for i in range(per_thread):
+                    room, day, minute = target(t, i)
+                    request = factory.post('/reserve/', {
+                        'room_slug': room.slug,
+                        'date': day.isoformat(),
+                        'start_time': f'{minute // 60:02d}:{minute % 60:02d}',
+                        'duration_min': 15,
+                    })
+                    request.user = user
+                    try:
+                        status = reserve_view(request).status_code
+                    except Exception as exc:
+                        status = type(exc).__name__
+                    with lock:
+                        statuses.append(status)
+            finally:
+                connections.close_all()
+
+        pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        for th in pool:
+            th.start()
+        for th in pool:
+            th.join()
+        return statuses
+
+    def _timed(self, threads, target, per_thread, user):
+        started = _time.perf_counter()
+        statuses = self._run(threads, target, per_thread, user)
+        elapsed = _time.perf_counter() - started
+        return statuses.count(200) / elapsed if elapsed else 0.0
+
+    def _double_bookings(self, rooms):
+        """Ocorrências de reservas que começam antes de a anterior (na mesma sala) terminar"""
+        rows = Occurrence.objects.filter(
+            room__in=rooms, reservation__isnull=False
+        ).order_by('room_id', 'start').values_list('room_id', 'start', 'end')
+        doubles, last_room, max_end = 0, None, None
+        for room_id, start, end in rows:
+            if room_id == last_room and start < max_end:
+                doubles += 1
+            if room_id != last_room or end > max_end:
+                last_room, max_end = room_id, end
+        return doubles
@@ -0,0 +1,248 @@
+"""
+Métricas agregadas do processo, expostas em /metrics/ no formato texto do Prometheus.
+
+O registro guarda contadores e histogramas (baldes fixos) em dicionários
+protegidos por um único lock: registrar uma observação custa um bisect e
+algumas somas. ServerTimingMiddleware alimenta latência, consultas SQL e
+ocorrências por nome de URL; conflicts.py mede as checagens de conflito; as
+taxas de acerto do rule_cache e do feed_cache são lidas na hora da coleta.
+
+Com METRICS_DIR (vários workers do gunicorn), cada processo grava de tempos
+em tempos um retrato cumulativo em METRICS_DIR/<pid>-<início>.json e o
+endpoint soma os retratos de todos — qualquer worker responde pelo conjunto.
+Retratos sem atualização há METRICS_FILE_TTL_HOURS são apagados.
+
+Este módulo é importado pelo middleware (reservas/instrumentation.py): não
+importa models no topo.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+# Em segundos, como o Prometheus espera
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+HELP = {
+    'reservas_request_duration_seconds': ('histogram', 'Duração das requisições por nome de URL'),
+    'reservas_request_duration_quantile_seconds': ('gauge', 'p50/p95/p99 estimados dos baldes'),
+    'reservas_responses_total': ('counter', 'Respostas por nome de URL e classe de status'),
+    'reservas_sql_queries_total': ('counter', 'Consultas SQL por nome de URL'),
+    'reservas_occurrences_expanded_total': ('counter', 'Ocorrências expandidas por nome de URL'),
+    'reservas_conflict_check_duration_seconds': ('histogram', 'Duração das checagens de conflito'),
+    'reservas_cache_hits_total': ('counter', 'Acertos dos caches em memória'),
+    'reservas_cache_misses_total': ('counter', 'Faltas dos caches em memória'),
+    'reservas_cache_hit_ratio': ('gauge', 'Acertos / consultas dos caches em memória'),
+}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self._token = f'{os.getpid()}-{int(time.time())}'
+        self._last_flush = 0.0
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels(labels))
+        i = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                # Contagem por balde (o último é +Inf), soma, total
+                hist = self.histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+            hist[0][i] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    # =============================
+    # Retrato (processo atual e multiprocesso)
+    # =============================
+    def snapshot(self):
+        with self._lock:
+            data = {
+                'counters': [[n, list(map(list, lb)), v] for (n, lb), v in self.counters.items()],
+                'histograms': [
+                    [n, list(map(list, lb)), list(h[0]), h[1], h[2]] for (n, lb), h in self.histograms.items()
+                ],
+            }
+        data['caches'] = _cache_stats()
+        return data
+
+    def flush(self, force=False):
+        """Grava o retrato em METRICS_DIR (no máximo a cada METRICS_FLUSH_SECONDS)"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < getattr(settings, 'METRICS_FLUSH_SECONDS', 10):
+            return
+        self._last_flush = now
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / f'{self._token}.json'
+        tmp = target.with_suffix(f'.tmp{threading.get_ident()}')
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, target)
+
+    def collect(self):
+        """Retratos somados: só este processo, ou todos os de METRICS_DIR"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return [self.snapshot()]
+        self.flush(force=True)
+        ttl = getattr(settings, 'METRICS_FILE_TTL_HOURS', 24) * 3600
+        snapshots = []
+        for path in Path(directory).glob('*.json'):
+            try:
+                if time.time() - path.stat().st_mtime > ttl:
+                    path.unlink()
+                    continue
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                # Arquivo apagado ou sendo trocado por outro worker
+                continue
+        return snapshots
+
+
+registry = Registry()
+
+
+def _cache_stats():
+    from .feeds import feed_cache
+    from .recurrence import rule_cache
+    return {
+        name: [stats['hits'], stats['misses']]
+        for name, stats in (('rrule', rule_cache.stats()), ('feed', feed_cache.stats()))
+    }
+
+
+def observe_request(view, status, seconds, queries=0, occurrences=0):
+    """Chamado pelo middleware no fim de cada requisição"""
+    registry.observe('reservas_request_duration_seconds', seconds, view=view)
+    registry.inc('reservas_responses_total', view=view, code=f'{status // 100}xx')
+    if queries:
+        registry.inc('reservas_sql_queries_total', queries, view=view)
+    if occurrences:
+        registry.inc('reservas_occurrences_expanded_total', occurrences, view=view)
+    registry.flush()
+
+
+# =============================
+# Formato texto do Prometheus
+# =============================
+def _merge(snapshots):
+    counters, histograms, caches = {}, {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap.get('counters', ()):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snap.get('histograms', ()):
+            key = (name, tuple(map(tuple, labels)))
+            hist = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            hist[0] = [a + b for a, b in zip(hist[0], buckets)]
+            hist[1] += total
+            hist[2] += count
+        for name, (hits, misses) in snap.get('caches', {}).items():
+            acc = caches.setdefault(name, [0, 0])
+            acc[0] += hits
+            acc[1] += misses
+    return counters, histograms, caches
+
+
+def quantile(q, buckets):
+    """Quantil estimado por interpolação linear dentro do balde (como histogram_quantile)"""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank, seen = q * total, 0
+    for i, n in enumerate(buckets):
+        if seen + n >= rank and n:
+            if i == len(LATENCY_BUCKETS):
+                return LATENCY_BUCKETS[-1]
+            lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+            return lower + (LATENCY_BUCKETS[i] - lower) * (rank - seen) / n
+        seen += n
+    return LATENCY_BUCKETS[-1]
+
+
+def _fmt_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (
+        (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in items
+    )
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _fmt_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition():
+    counters, histograms, caches = _merge(registry.collect())
+    lines = {}
+
+    def emit(name, line):
+        lines.setdefault(name, []).append(line)
+
+    for (name, labels), value in sorted(counters.items()):
+        emit(name, f'{name}{_fmt_labels(labels)} {_fmt_value(value)}')
+
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            cumulative += n
+            emit(name, f'{name}_bucket{_fmt_labels(labels, le=bound)} {cumulative}')
+        emit(name, f'{name}_sum{_fmt_labels(labels)} {_fmt_value(float(total))}')
+        emit(name, f'{name}_count{_fmt_labels(labels)} {count}')
+        if name == 'reservas_request_duration_seconds':
+            qname = 'reservas_request_duration_quantile_seconds'
+            for q in QUANTILES:
+                value = quantile(q, buckets)
+                if value is not None:
+                    emit(qname, f'{qname}{_fmt_labels(labels, quantile=q)} {_fmt_value(float(value))}')
+
+    for cache, (hits, misses) in sorted(caches.items()):
+        emit('reservas_cache_hits_total', f'reservas_cache_hits_total{{cache="{cache}"}} {hits}')
+        emit('reservas_cache_misses_total', f'reservas_cache_misses_total{{cache="{cache}"}} {misses}')
+        ratio = hits / (hits + misses) if hits + misses else 0.0
+        emit('reservas_cache_hit_ratio', f'reservas_cache_hit_ratio{{cache="{cache}"}} {_fmt_value(ratio)}')
+
+    out = []
+    for name, (kind, text) in HELP.items():
+        if name in lines:
+            out.append(f'# HELP {name} {text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(lines[name])
+    return '\n'.join(out) + '\n'
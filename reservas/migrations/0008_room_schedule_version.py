@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-16 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0007_occurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='schedule_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
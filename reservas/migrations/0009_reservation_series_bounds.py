@@ -0,0 +1,75 @@
+# Generated by Django 4.2 on 2026-10-16 22:31
+
+from dateutil.rrule import rrule, rrulestr
+from django.db import migrations, models
+from django.utils.timezone import is_naive, localtime, make_aware
+
+ALL_WEEKDAYS = 0b1111111
+
+
+def series_bounds(start_dt, end_dt, rule_text):
+    # Cópia congelada de reservas.recurrence.series_bounds como era nesta migração
+    start_dt = localtime(make_aware(start_dt) if is_naive(start_dt) else start_dt)
+    end_dt = localtime(make_aware(end_dt) if is_naive(end_dt) else end_dt)
+    single = (end_dt, 1 << start_dt.weekday())
+    if not rule_text:
+        return single
+    try:
+        rule = rrulestr(rule_text, dtstart=start_dt)
+    except Exception:
+        return single
+    if not isinstance(rule, rrule):
+        return None, ALL_WEEKDAYS
+
+    mask = ALL_WEEKDAYS
+    weekdays = set(rule._byweekday or ())
+    weekdays.update(wd for wd, _ in rule._bynweekday or ())
+    if weekdays:
+        mask = sum(1 << wd for wd in weekdays)
+    if rule._count is None and rule._until is None:
+        return None, mask
+
+    last = None
+    for last in rule:
+        pass
+    if last is None:
+        return start_dt, mask
+    return last + (end_dt - start_dt), mask
+
+
+def fill_series_bounds(apps, schema_editor):
+    Reservation = apps.get_model('reservas', 'Reservation')
+    for r in Reservation.objects.all().iterator():
+        r.series_end, r.weekday_mask = series_bounds(r.start_dt, r.end_dt, r.recurrence_rule)
+        r.save(update_fields=['series_end', 'weekday_mask'])
+    # A expansão passou a ser no fuso local: força a rematerialização
+    apps.get_model('reservas', 'OccurrenceHorizon').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0008_room_schedule_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='series_end',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='weekday_mask',
+            field=models.PositiveSmallIntegerField(default=127, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('is_cancelled', False)), fields=['room', 'start_dt', 'series_end'], name='reservation_active_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledclass',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['room', 'weekday'], name='scheduledclass_active_idx'),
+        ),
+        migrations.RunPython(fill_series_bounds, migrations.RunPython.noop),
+    ]
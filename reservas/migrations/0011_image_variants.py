@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-16 23:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0010_schedulechange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notice',
+            name='imagem_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
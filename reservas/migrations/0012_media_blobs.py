@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-16 23:12
+
+from django.db import migrations, models
+import reservas.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0011_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refs', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='notice',
+            name='imagem',
+            field=models.ImageField(blank=True, null=True, storage=reservas.storage.media_storage, upload_to='avisos/'),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=reservas.storage.media_storage, upload_to='profile_photos/'),
+        ),
+    ]
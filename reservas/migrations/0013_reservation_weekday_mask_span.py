@@ -0,0 +1,64 @@
+# Generated by Django 4.2 on 2026-10-17 09:40
+
+from datetime import timedelta
+
+from dateutil.rrule import rrule, rrulestr
+from django.db import migrations
+from django.utils.timezone import is_naive, localtime, make_aware
+
+ALL_WEEKDAYS = 0b1111111
+
+
+def _local(dt):
+    return localtime(make_aware(dt) if is_naive(dt) else dt)
+
+
+def _spread(mask, days):
+    if days >= 6:
+        return ALL_WEEKDAYS
+    spread = 0
+    for wd in range(7):
+        if mask >> wd & 1:
+            for i in range(days + 1):
+                spread |= 1 << ((wd + i) % 7)
+    return spread
+
+
+def weekday_mask(start_dt, end_dt, rule_text):
+    # Cópia congelada da máscara de reservas.recurrence.series_bounds: os dias
+    # que a ocorrência alcança depois da meia-noite também contam
+    start_dt = _local(start_dt)
+    span = max((_local(end_dt - timedelta(microseconds=1)).date() - start_dt.date()).days, 0)
+    single = _spread(1 << start_dt.weekday(), span)
+    if not rule_text:
+        return single
+    try:
+        rule = rrulestr(rule_text, dtstart=start_dt)
+    except Exception:
+        return single
+    if not isinstance(rule, rrule):
+        return ALL_WEEKDAYS
+    weekdays = set(rule._byweekday or ())
+    weekdays.update(wd for wd, _ in rule._bynweekday or ())
+    if not weekdays:
+        return ALL_WEEKDAYS
+    return _spread(sum(1 << wd for wd in weekdays), span)
+
+
+def fill_weekday_mask(apps, schema_editor):
+    Reservation = apps.get_model('reservas', 'Reservation')
+    for r in Reservation.objects.all().iterator():
+        mask = weekday_mask(r.start_dt, r.end_dt, r.recurrence_rule)
+        if mask != r.weekday_mask:
+            Reservation.objects.filter(pk=r.pk).update(weekday_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0012_media_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_weekday_mask, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.utils.timezone import make_aware, is_naive
+from django.utils.timezone import make_aware, is_naive, localtime
+from collections import defaultdict
 from datetime import datetime, timedelta
-from dateutil.rrule import rrulestr
 from django.dispatch import receiver
 from django.db.models.signals import post_save
+from .storage import media_storage
+from .recurrence import ALL_WEEKDAYS, expand_window, parse_rule, series_bounds, weekday_bits
 
 
 # =============================
@@ -14,10 +16,18 @@ from django.db.models.signals import post_save
 class Room(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
+    # Incrementada a cada mudança em reservas/exceções/aulas da sala
+    schedule_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def bump_schedule_version(cls, room_id):
+        """Incrementa a versão da agenda da sala e retorna o novo valor"""
+        cls.objects.filter(pk=room_id).update(schedule_version=models.F('schedule_version') + 1)
+        return cls.objects.filter(pk=room_id).values_list('schedule_version', flat=True).first()
+
 
 # =============================
 # Perfil do Usuário (Função + Foto + Telefone)
@@ -31,7 +41,9 @@ class Profile(models.Model):
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='professor')
-    photo = models.ImageField(upload_to='profile_photos/', blank=True, null=True)
+    photo = models.ImageField(upload_to='profile_photos/', storage=media_storage, blank=True, null=True)
+    # Versões redimensionadas da foto (reservas/images.py)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     phone = models.CharField(max_length=20, blank=True, null=True)
 
     def __str__(self):
@@ -60,6 +72,40 @@ class ReservationException(models.Model):
 # =============================
 # Reservas Avulsas (com recorrência)
 # =============================
+class ReservationQuerySet(models.QuerySet):
+    def intersecting(self, start_range, end_range):
+        """
+        Reservas ativas cuja série pode ter ocorrência em [start_range, end_range).
+        Usa series_end/weekday_mask (índice parcial), sem expandir nada em Python.
+        """
+        qs = self.filter(is_cancelled=False, start_dt__lt=end_range).filter(
+            models.Q(series_end__isnull=True) | models.Q(series_end__gt=start_range)
+        )
+        mask = weekday_bits(start_range, end_range)
+        if mask != ALL_WEEKDAYS:
+            qs = qs.alias(
+                weekday_hit=models.F('weekday_mask').bitand(mask)
+            ).filter(weekday_hit__gt=0)
+        return qs
+
+    def expand_between(self, start_range, end_range):
+        """
+        Gera (início, fim, reserva) das ocorrências que cruzam o intervalo
+        para todas as reservas do queryset. As exceções vêm numa única consulta,
+        então o custo é fixo (2 consultas) qualquer que seja o número de reservas.
+        """
+        reservations = self.intersecting(start_range, end_range)
+        cancelled = defaultdict(set)
+        exc_qs = ReservationException.objects.filter(reservation__in=reservations.values('pk'))
+        for reservation_id, date in exc_qs.values_list('reservation_id', 'date'):
+            cancelled[reservation_id].add(date)
+
+        for r in reservations.iterator(chunk_size=1000):
+            for s, e, obj in r.occurrences_between(start_range, end_range, cancelled[r.pk]):
+                if s < end_range and e > start_range:
+                    yield s, e, obj
+
+
 class Reservation(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -70,14 +116,42 @@ class Reservation(models.Model):
     recurrence_rule = models.TextField(blank=True, null=True)
     is_cancelled = models.BooleanField(default=False)
 
+    # Derivados de start_dt/end_dt/recurrence_rule no save() (ver series_bounds)
+    series_end = models.DateTimeField(blank=True, null=True, editable=False)
+    weekday_mask = models.PositiveSmallIntegerField(default=ALL_WEEKDAYS, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ReservationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['room', 'start_dt', 'series_end'],
+                name='reservation_active_range_idx',
+                condition=models.Q(is_cancelled=False),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.room} - {self.user} ({self.start_dt})"
 
-    def occurrences_between(self, start_range, end_range):
-        """Retorna as ocorrências entre datas, respeitando cancelamentos e recorrências"""
+    def save(self, *args, **kwargs):
+        self.series_end, self.weekday_mask = series_bounds(
+            self.start_dt, self.end_dt, self.recurrence_rule
+        )
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'series_end', 'weekday_mask'}
+        super().save(*args, **kwargs)
+
+    def occurrences_between(self, start_range, end_range, cancelled_dates=None):
+        """
+        Retorna as ocorrências entre datas, respeitando cancelamentos e recorrências.
+        `cancelled_dates` evita a consulta às exceções quando já foram buscadas
+        (ver Reservation.objects.expand_between).
+        """
         def aw(dt):
             return make_aware(dt) if is_naive(dt) else dt
 
@@ -87,10 +161,12 @@ class Reservation(models.Model):
         if self.is_cancelled:
             return []
 
-        base_start = aw(self.start_dt)
-        base_end = aw(self.end_dt)
+        # Expande no fuso local: BYDAY e as datas de exceção são dias locais
+        base_start = localtime(aw(self.start_dt))
+        base_end = localtime(aw(self.end_dt))
         delta = base_end - base_start
-        cancelled_dates = set(self.exceptions.values_list('date', flat=True))
+        if cancelled_dates is None:
+            cancelled_dates = set(self.exceptions.values_list('date', flat=True))
         results = []
 
         # Sem recorrência
@@ -100,10 +176,9 @@ class Reservation(models.Model):
                     results.append((base_start, base_end, self))
             return results
 
-        # Com recorrência
-        try:
-            rule = rrulestr(self.recurrence_rule, dtstart=base_start)
-        except Exception:
+        # Com recorrência (regras inválidas viram ocorrência única)
+        rule = parse_rule(self.recurrence_rule, base_start)
+        if rule is None:
             if base_start.date() not in cancelled_dates:
                 results.append((base_start, base_end, self))
             return results
@@ -111,7 +186,7 @@ class Reservation(models.Model):
         window_start = start_range - timedelta(hours=1)
         window_end = end_range + timedelta(hours=1)
 
-        for dt_start in rule.between(window_start, window_end, inc=True):
+        for dt_start in expand_window(rule, window_start, window_end):
             dt_start = aw(dt_start)
             dt_end = dt_start + delta
             if dt_start.date() not in cancelled_dates:
@@ -148,6 +223,13 @@ class ScheduledClass(models.Model):
 
     class Meta:
         ordering = ['room', 'weekday', 'start_time']
+        indexes = [
+            models.Index(
+                fields=['room', 'weekday'],
+                name='scheduledclass_active_idx',
+                condition=models.Q(is_active=True),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.room.name} ({self.get_weekday_display()})"
@@ -187,6 +269,75 @@ class ScheduledClass(models.Model):
         return results
 
 
+# =============================
+# Ocorrências materializadas (reservas + grade fixa)
+# =============================
+class Occurrence(models.Model):
+    """Ocorrência concreta de uma reserva ou aula fixa, mantida pelos signals"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='occurrences')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.CASCADE, null=True, blank=True, related_name='materialized'
+    )
+    scheduled_class = models.ForeignKey(
+        ScheduledClass, on_delete=models.CASCADE, null=True, blank=True, related_name='materialized'
+    )
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    class Meta:
+        ordering = ['start']
+        indexes = [
+            models.Index(fields=['room', 'start', 'end'], name='occurrence_room_range_idx'),
+            models.Index(fields=['start', 'end'], name='occurrence_range_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.room} ({self.start} → {self.end})"
+
+    @property
+    def source(self):
+        return self.reservation if self.reservation_id else self.scheduled_class
+
+
+class OccurrenceHorizon(models.Model):
+    """Janela [start, end) já materializada em Occurrence (linha única, pk=1)"""
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Horizonte {self.start} → {self.end}"
+
+
+class ScheduleChange(models.Model):
+    """
+    Diário de mudanças da agenda (ver reservas/changes.py): sala, trecho afetado
+    e nova versão. start/end vazios = sem limite (séries sem fim, aulas fixas).
+    """
+    # Sem constraint: excluir uma sala apaga as reservas em cascata, e os signals
+    # delas ainda registram avisos para a sala que está saindo (o diário é podado)
+    room = models.ForeignKey(Room, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    start = models.DateTimeField(blank=True, null=True)
+    end = models.DateTimeField(blank=True, null=True)
+    version = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.room} v{self.version} ({self.start} → {self.end})"
+
+
+class MediaBlob(models.Model):
+    """Arquivo de mídia endereçado por conteúdo e quantas referências ele tem (reservas/storage.py)"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} ref.)"
+
+
 # =============================
 # Avisos (painel de administração)
 # =============================
@@ -199,7 +350,9 @@ class Notice(models.Model):
     tipo = models.CharField(max_length=10, choices=TIPO_CHOICES, default='texto')
     titulo = models.CharField(max_length=200)
     corpo = models.TextField(blank=True, null=True)
-    imagem = models.ImageField(upload_to='avisos/', blank=True, null=True)
+    imagem = models.ImageField(upload_to='avisos/', storage=media_storage, blank=True, null=True)
+    # Versões redimensionadas da imagem (reservas/images.py)
+    imagem_variants = models.JSONField(default=dict, blank=True, editable=False)
     criado_em = models.DateTimeField(default=timezone.now)
     criado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     is_active = models.BooleanField(default=True)
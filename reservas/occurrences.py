@@ -0,0 +1,269 @@
+"""
+Materialização das ocorrências de reservas e aulas fixas.
+
+A tabela Occurrence guarda cada ocorrência concreta dentro de um horizonte
+rolante (OCCURRENCE_HISTORY_DAYS para trás, OCCURRENCE_HORIZON_DAYS para
+frente). Feeds e checagens de conflito viram consultas por intervalo no
+índice (room, start, end); janelas fora do horizonte caem na expansão ao vivo.
+"""
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import is_naive, localtime, make_aware, now
+
+from . import instrumentation
+from .models import (
+    Occurrence, OccurrenceHorizon, Reservation, ScheduledClass
+)
+
+HORIZON_PK = 1
+BATCH_SIZE = 1000
+
+# Ocorrências que começam antes do horizonte ainda podem invadir o primeiro dia
+START_MARGIN = timedelta(days=1)
+
+
+def target_window(today=None):
+    """Janela que o horizonte deveria cobrir hoje (meia-noite local a meia-noite local)"""
+    today = today or localtime(now()).date()
+    history = getattr(settings, 'OCCURRENCE_HISTORY_DAYS', 60)
+    horizon = getattr(settings, 'OCCURRENCE_HORIZON_DAYS', 180)
+    start = make_aware(datetime.combine(today - timedelta(days=history), time.min))
+    end = make_aware(datetime.combine(today + timedelta(days=horizon + 1), time.min))
+    return start, end
+
+
+def get_horizon():
+    return OccurrenceHorizon.objects.filter(pk=HORIZON_PK).first()
+
+
+def ensure_horizon():
+    """Retorna o horizonte atual, rolando-o se o dia virou"""
+    horizon = get_horizon()
+    _, target_end = target_window()
+    if horizon is None or horizon.end < target_end:
+        horizon = roll_horizon()
+    return horizon
+
+
+def _aware(dt):
+    return make_aware(dt) if is_naive(dt) else dt
+
+
+def covers(horizon, start, end):
+    return (
+        horizon is not None
+        and start >= horizon.start + START_MARGIN
+        and end <= horizon.end
+    )
+
+
+# =============================
+# Geração das linhas
+# =============================
+def _rows(triples, window_start, window_end):
+    """Linhas de Occurrence para as ocorrências cujo início cai em [window_start, window_end)"""
+    rows = []
+    for s, e, obj in triples:
+        if not (window_start <= s < window_end):
+            continue
+        is_reservation = isinstance(obj, Reservation)
+        rows.append(Occurrence(
+            room_id=obj.room_id,
+            user_id=obj.user_id,
+            reservation=obj if is_reservation else None,
+            scheduled_class=None if is_reservation else obj,
+            start=s,
+            end=e,
+        ))
+    return rows
+
+
+def _expand(reservations, scheduled_classes, window_start, window_end):
+    window_start = localtime(window_start)
+    window_end = localtime(window_end)
+    yield from reservations.expand_between(window_start, window_end)
+    for sc in scheduled_classes.filter(is_active=True):
+        yield from sc.occurrences_between(window_start, window_end)
+
+
+def _materialize_all(window_start, window_end):
+    triples = _expand(
+        Reservation.objects.all(), ScheduledClass.objects.all(), window_start, window_end
+    )
+    rows = _rows(triples, window_start, window_end)
+    Occurrence.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+@transaction.atomic
+def roll_horizon(rebuild=False):
+    """
+    Avança o horizonte até a janela-alvo de hoje.
+    Descarta o que ficou para trás e materializa só o trecho novo;
+    reconstrói tudo quando não há horizonte ou quando a janela cresceu para trás.
+    """
+    target_start, target_end = target_window()
+    horizon = OccurrenceHorizon.objects.select_for_update().filter(pk=HORIZON_PK).first()
+
+    if rebuild or horizon is None or target_start < horizon.start:
+        Occurrence.objects.all().delete()
+        _materialize_all(target_start, target_end)
+        horizon, _ = OccurrenceHorizon.objects.update_or_create(
+            pk=HORIZON_PK, defaults={'start': target_start, 'end': target_end}
+        )
+        return horizon
+
+    if horizon.end >= target_end:
+        return horizon
+
+    Occurrence.objects.filter(start__lt=target_start).delete()
+    _materialize_all(horizon.end, target_end)
+    horizon.start = target_start
+    horizon.end = target_end
+    horizon.save()
+    return horizon
+
+
+# =============================
+# Sincronização (chamada pelos signals)
+# =============================
+def _sync(reservations, scheduled_classes, **lookup):
+    horizon = get_horizon()
+    if horizon is None:
+        # Nada materializado ainda: o primeiro roll_horizon gera tudo
+        return
+    triples = _expand(reservations, scheduled_classes, horizon.start, horizon.end)
+    with transaction.atomic():
+        Occurrence.objects.filter(**lookup).delete()
+        Occurrence.objects.bulk_create(
+            _rows(triples, horizon.start, horizon.end), batch_size=BATCH_SIZE
+        )
+
+
+def sync_reservation(reservation):
+    _sync(
+        Reservation.objects.filter(pk=reservation.pk), ScheduledClass.objects.none(),
+        reservation=reservation,
+    )
+
+
+def sync_scheduled_class(scheduled_class):
+    _sync(
+        Reservation.objects.none(), ScheduledClass.objects.filter(pk=scheduled_class.pk),
+        scheduled_class=scheduled_class,
+    )
+
+
+def sync_scheduled_classes(ids):
+    """Mesmo que sync_scheduled_class, para várias aulas de uma vez (importação em lote)"""
+    _sync(
+        Reservation.objects.none(), ScheduledClass.objects.filter(pk__in=ids),
+        scheduled_class_id__in=ids,
+    )
+
+
+# =============================
+# Consulta por intervalo
+# =============================
+def _range_qs(start, end, kind, filters):
+    qs = Occurrence.objects.filter(start__lt=end, end__gt=start, **filters)
+    if kind == 'reservation':
+        qs = qs.filter(reservation__isnull=False)
+    elif kind == 'scheduled_class':
+        qs = qs.filter(scheduled_class__isnull=False)
+    return qs
+
+
+def occurrences_in(start, end, kind=None, **filters):
+    """
+    Gera (início, fim, reserva|aula) das ocorrências que cruzam [start, end).
+    `kind` limita a 'reservation' ou 'scheduled_class'; `filters` vale igualmente
+    para Occurrence, Reservation e ScheduledClass (ex.: room=..., room__slug=..., user_id=...).
+    """
+    start, end = _aware(start), _aware(end)
+    horizon = ensure_horizon()
+    expanded = 0
+    try:
+        if covers(horizon, start, end):
+            qs = _range_qs(start, end, kind, filters).select_related(
+                'reservation__room', 'reservation__user',
+                'scheduled_class__room', 'scheduled_class__user',
+            )
+            for occ in qs.iterator(chunk_size=BATCH_SIZE):
+                expanded += 1
+                yield occ.start, occ.end, occ.source
+            return
+
+        # Fora do horizonte: expansão ao vivo
+        if kind in (None, 'reservation'):
+            res_qs = Reservation.objects.filter(**filters).select_related('room', 'user')
+            for triple in res_qs.expand_between(start, end):
+                expanded += 1
+                yield triple
+        if kind in (None, 'scheduled_class'):
+            sc_qs = ScheduledClass.objects.filter(is_active=True, **filters)
+            for sc in sc_qs.select_related('room', 'user').iterator(chunk_size=BATCH_SIZE):
+                for triple in sc.occurrences_between(start, end):
+                    expanded += 1
+                    yield triple
+    finally:
+        instrumentation.count('occurrences', expanded)
+
+
+def has_overlap(start, end, kind=None, **filters):
+    """True se alguma ocorrência cruza [start, end)"""
+    start, end = _aware(start), _aware(end)
+    horizon = ensure_horizon()
+    if covers(horizon, start, end):
+        return _range_qs(start, end, kind, filters).exists()
+    return next(iter(occurrences_in(start, end, kind=kind, **filters)), None) is not None
+
+
+# =============================
+# Versões assíncronas (views ASGI)
+# =============================
+async def aensure_horizon():
+    horizon = await OccurrenceHorizon.objects.filter(pk=HORIZON_PK).afirst()
+    _, target_end = target_window()
+    if horizon is None or horizon.end < target_end:
+        # Raro (uma vez por dia): a rolagem continua síncrona, numa transação
+        horizon = await sync_to_async(roll_horizon)()
+    return horizon
+
+
+async def aoccurrences_in(start, end, kind=None, **filters):
+    """
+    occurrences_in para `async for`. Dentro do horizonte lê a tabela em blocos
+    com aiterator(); a expansão ao vivo (fora dele) roda numa thread.
+    """
+    start, end = _aware(start), _aware(end)
+    horizon = await aensure_horizon()
+
+    if covers(horizon, start, end):
+        qs = _range_qs(start, end, kind, filters).select_related(
+            'reservation__room', 'reservation__user',
+            'scheduled_class__room', 'scheduled_class__user',
+        )
+        expanded = 0
+        try:
+            async for occ in qs.aiterator(chunk_size=BATCH_SIZE):
+                expanded += 1
+                yield occ.start, occ.end, occ.source
+        finally:
+            instrumentation.count('occurrences', expanded)
+        return
+
+    # A contagem fica com o occurrences_in da thread (mesmo contexto)
+    for triple in await sync_to_async(list)(occurrences_in(start, end, kind, **filters)):
+        yield triple
+
+
+async def ahas_overlap(start, end, kind=None, **filters):
+    start, end = _aware(start), _aware(end)
+    horizon = await aensure_horizon()
+    if covers(horizon, start, end):
+        return await _range_qs(start, end, kind, filters).aexists()
+    return await sync_to_async(has_overlap)(start, end, kind, **filters)
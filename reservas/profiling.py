@@ -0,0 +1,306 @@
+"""
+Profiler sob demanda para requisições de produção.
+
+Uma requisição é perfilada quando:
+- vem de alguém da equipe com o cabeçalho "X-Profile: 1"; ou
+- a chave ligada pela equipe (/api/profiles/, POST) está valendo e a
+  requisição casa com o padrão de caminho (regex) e com a taxa de amostragem.
+
+A chave fica em PROFILING_DIR/switch.json, então vale para todos os workers
+da máquina; cada processo relê o arquivo no máximo a cada SWITCH_REFRESH
+segundos. Com a chave desligada e sem o cabeçalho, o custo por requisição é
+uma comparação de relógio e uma busca em request.META.
+
+Coletores:
+- "sample" (padrão): thread que lê a pilha da thread da requisição a cada
+  PROFILING_INTERVAL_MS e grava pilhas "colapsadas" (.collapsed), a entrada de
+  flamegraph.pl e do speedscope; custo baixo e independente do código medido.
+- "cprofile": cProfile determinístico, grava .prof (pstats, snakeviz, gprof2dot).
+Sob ASGI a thread medida é a do event loop, que também roda as outras
+requisições em andamento: o perfil mistura o que estava concorrendo.
+
+Os perfis ficam em PROFILING_DIR (mantidos os PROFILING_MAX_FILES mais
+recentes) e saem em /api/profiles/<nome>/; a resposta perfilada traz o nome
+em X-Profile-Id. Em respostas em streaming (feed admin em janelas grandes) o
+trabalho acontece enquanto o corpo sai: o coletor só para e o perfil só é
+gravado quando o corpo termina, e o nome leva "stream" no lugar da duração.
+"""
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .instrumentation import on_stream_end
+from .roles import is_staff_like
+
+SWITCH_FILE = 'switch.json'
+SWITCH_REFRESH = 5
+COLLECTORS = ('sample', 'cprofile')
+NAME_RE = re.compile(r'^[\w.-]+\.(prof|collapsed)$')
+
+
+def profiles_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', None) or Path(settings.BASE_DIR) / 'profiles')
+
+
+# =============================
+# Chave (arquivo compartilhado pelos workers)
+# =============================
+class _Switch:
+    def __init__(self):
+        self.value = None
+        self._next_check = 0.0
+        self._mtime = None
+
+    def get(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + SWITCH_REFRESH
+            self._reload()
+        value = self.value
+        if value is not None and time.time() >= value['until']:
+            return None
+        return value
+
+    def _reload(self):
+        path = profiles_dir() / SWITCH_FILE
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            self.value, self._mtime = None, None
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            value = json.loads(path.read_text())
+            value['pattern'] = re.compile(value['pattern']) if value.get('pattern') else None
+        except (OSError, ValueError, re.error):
+            value = None
+        self.value, self._mtime = value, mtime
+
+    def expire(self):
+        self._next_check = 0.0
+
+
+switch = _Switch()
+
+
+def set_switch(minutes, pattern='', rate=1.0, collector='sample'):
+    """Liga a chave por `minutes` minutos (0 desliga) e devolve o estado gravado"""
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / SWITCH_FILE
+    if minutes <= 0:
+        path.unlink(missing_ok=True)
+        switch.expire()
+        return None
+    re.compile(pattern or '')  # re.error sobe para a view
+    state = {
+        'until': time.time() + minutes * 60,
+        'pattern': pattern or '',
+        'rate': min(max(float(rate), 0.0), 1.0),
+        'collector': collector if collector in COLLECTORS else 'sample',
+    }
+    tmp = path.with_suffix(f'.tmp{os.getpid()}')
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path)
+    switch.expire()
+    return state
+
+
+def switch_state():
+    value = switch.get()
+    if value is None:
+        return None
+    return {**value, 'pattern': value['pattern'].pattern if value['pattern'] else ''}
+
+
+# =============================
+# Coletores
+# =============================
+class SamplingCollector:
+    extension = 'collapsed'
+
+    def __init__(self):
+        # Thread da requisição (a que é amostrada e marcada como ocupada no middleware)
+        self.ident = threading.get_ident()
+        self.interval = getattr(settings, 'PROFILING_INTERVAL_MS', 5) / 1000
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, args=(self.ident,), daemon=True)
+        self._thread.start()
+
+    def _run(self, target):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        lines = (f'{stack} {n}' for stack, n in self.stacks.most_common())
+        path.write_text('\n'.join(lines) + '\n')
+
+
+class CProfileCollector:
+    extension = 'prof'
+
+    def __init__(self):
+        self.ident = threading.get_ident()
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+# =============================
+# Middleware
+# =============================
+class ProfilingMiddleware:
+    """Depois de AuthenticationMiddleware (o cabeçalho só vale para a equipe)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Threads com um perfil em andamento: o cProfile não aceita dois na mesma thread
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        staff = 'HTTP_X_PROFILE' in request.META and is_staff_like(request.user)
+        collector = self._collector_for(request, staff)
+        if collector is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        collector.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self._stop(collector)
+            raise
+        return self._finish(request, response, collector, started)
+
+    async def __acall__(self, request):
+        # Carregar o usuário da sessão consulta o banco: fora do event loop
+        staff = 'HTTP_X_PROFILE' in request.META and await sync_to_async(is_staff_like)(request.user)
+        collector = self._collector_for(request, staff)
+        if collector is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        collector.start()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            self._stop(collector)
+            raise
+        return self._finish(request, response, collector, started)
+
+    def _collector_for(self, request, staff):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            return None
+        state = switch.get()
+        if 'HTTP_X_PROFILE' in request.META:
+            if request.META['HTTP_X_PROFILE'] not in ('1',) + COLLECTORS or not staff:
+                return None
+            kind = request.META['HTTP_X_PROFILE']
+            kind = kind if kind in COLLECTORS else (state or {}).get('collector', 'sample')
+        elif state is None:
+            return None
+        elif state['pattern'] and not state['pattern'].search(request.path):
+            return None
+        elif random.random() >= state['rate']:
+            return None
+        else:
+            kind = state['collector']
+
+        ident = threading.get_ident()
+        with self._lock:
+            if ident in self._busy:
+                return None
+            self._busy.add(ident)
+        return CProfileCollector() if kind == 'cprofile' else SamplingCollector()
+
+    def _stop(self, collector):
+        collector.stop()
+        with self._lock:
+            self._busy.discard(collector.ident)
+
+    def _finish(self, request, response, collector, started):
+        match = getattr(request, 'resolver_match', None)
+        view = re.sub(r'[^\w-]+', '-', (match.view_name or match.route) if match else 'unresolved').strip('-')
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        suffix = f'{uuid.uuid4().hex[:8]}.{collector.extension}'
+
+        def store(name):
+            self._stop(collector)
+            directory = profiles_dir()
+            directory.mkdir(parents=True, exist_ok=True)
+            collector.dump(directory / name)
+            _prune(directory)
+
+        # O cabeçalho sai antes do corpo: o nome do perfil em streaming não tem a duração
+        name = f'{stamp}-{view}-stream-{suffix}'
+        if on_stream_end(response, lambda: store(name)):
+            response['X-Profile-Id'] = name
+            return response
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        name = f'{stamp}-{view}-{elapsed_ms:.0f}ms-{suffix}'
+        store(name)
+        response['X-Profile-Id'] = name
+        return response
+
+
+def _prune(directory):
+    keep = getattr(settings, 'PROFILING_MAX_FILES', 50)
+    # Nome começa pelo horário: ordem alfabética = ordem de gravação
+    for path in sorted(list_profiles(directory), key=lambda p: p.name, reverse=True)[keep:]:
+        path.unlink(missing_ok=True)
+
+
+def list_profiles(directory=None):
+    directory = directory or profiles_dir()
+    if not directory.is_dir():
+        return []
+    return [p for p in directory.iterdir() if NAME_RE.match(p.name)]
+
+
+def profile_path(name):
+    """Caminho do perfil pelo nome (None se o nome não for de um perfil existente)"""
+    if not NAME_RE.match(name):
+        return None
+    path = profiles_dir() / name
+    return path if path.is_file() else None
@@ -0,0 +1,250 @@
+"""
+Utilitários de recorrência (RRULE) das reservas.
+"""
+import threading
+import weakref
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from math import lcm
+
+from dateutil.rrule import DAILY, WEEKLY, rrule, rrulestr
+from django.conf import settings
+from django.utils.timezone import is_naive, localtime, make_aware
+
+ALL_WEEKDAYS = 0b1111111
+
+_INVALID = object()
+
+
+# =============================
+# Cache de regras compiladas
+# =============================
+class RuleCache:
+    """
+    LRU limitado e thread-safe de regras compiladas, chaveado por
+    (texto da regra, dtstart). Regras inválidas também ficam no cache,
+    para não serem reprocessadas (e falharem de novo) a cada requisição.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text, dtstart):
+        """Regra compilada, ou None se o texto não for uma RRULE válida"""
+        key = (text, dtstart, dtstart.tzinfo)
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return None if value is _INVALID else value
+            self.misses += 1
+
+        try:
+            value = rrulestr(text, dtstart=dtstart)
+        except Exception:
+            value = _INVALID
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return None if value is _INVALID else value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+rule_cache = RuleCache(getattr(settings, 'RRULE_CACHE_SIZE', 1024))
+
+
+def parse_rule(text, dtstart):
+    return rule_cache.get(text, dtstart)
+
+
+# =============================
+# Expansão ancorada na janela
+# =============================
+class _AnchoredSpec:
+    """
+    Forma "simples" de uma regra DAILY/WEEKLY (INTERVAL, BYDAY, UNTIL, COUNT):
+    as ocorrências se repetem num ciclo de `cycle` dias a partir de `anchor`,
+    nos deslocamentos `offsets`. Isso permite pular direto para a janela.
+    """
+
+    def __init__(self, rule):
+        dtstart = rule._dtstart
+        self.tzinfo = dtstart.tzinfo
+        self.time = dtstart.time()
+        self.dtstart = dtstart
+        self.day0 = dtstart.date()
+        self.count = rule._count
+        self.until = rule._until
+        weekdays = set(rule._byweekday) if rule._byweekday else set(range(7))
+
+        if rule._freq == DAILY:
+            self.anchor = self.day0
+            step = rule._interval
+            self.cycle = lcm(step, 7)
+        else:
+            # Semanas contadas a partir do WKST que contém o dtstart
+            self.anchor = self.day0 - timedelta(days=(self.day0.weekday() - rule._wkst) % 7)
+            step = 7 * rule._interval
+            self.cycle = step
+
+        self.offsets = [
+            off for off in range(self.cycle)
+            if (rule._freq == WEEKLY and off % step < 7 or rule._freq == DAILY and off % step == 0)
+            and (self.anchor + timedelta(days=off)).weekday() in weekdays
+        ]
+        # Deslocamentos do primeiro ciclo anteriores ao dtstart não contam
+        self.skipped = bisect_left(self.offsets, (self.day0 - self.anchor).days)
+
+    @classmethod
+    def build(cls, rule):
+        if not isinstance(rule, rrule) or rule._freq not in (DAILY, WEEKLY):
+            return None
+        if any((rule._bysetpos, rule._bymonth, rule._bymonthday, rule._bynmonthday,
+                rule._byyearday, rule._byeaster, rule._byweekno, rule._bynweekday)):
+            return None
+        dtstart = rule._dtstart
+        if len(rule._timeset) != 1 or rule._timeset[0].replace(tzinfo=None) != dtstart.time():
+            return None
+        spec = cls(rule)
+        return spec if spec.offsets else None
+
+    def _index_of_cycle_pos(self, cycle_no, pos):
+        """Número de ocorrências antes da posição `pos` do ciclo `cycle_no`"""
+        return cycle_no * len(self.offsets) + pos - self.skipped
+
+    def between(self, window_start, window_end):
+        """Mesmo resultado de rule.between(window_start, window_end, inc=True)"""
+        first = max(window_start.astimezone(self.tzinfo).date(), self.day0)
+        n = (first - self.anchor).days
+        cycle_no, rem = divmod(n, self.cycle)
+        pos = bisect_left(self.offsets, rem)
+        results = []
+        while True:
+            if pos == len(self.offsets):
+                cycle_no, pos = cycle_no + 1, 0
+            index = self._index_of_cycle_pos(cycle_no, pos)
+            if self.count is not None and index >= self.count:
+                break
+            day = self.anchor + timedelta(days=cycle_no * self.cycle + self.offsets[pos])
+            dt = datetime.combine(day, self.time, tzinfo=self.tzinfo)
+            if dt > window_end or (self.until is not None and dt > self.until):
+                break
+            if dt >= window_start and dt >= self.dtstart:
+                results.append(dt)
+            pos += 1
+        return results
+
+
+_specs = weakref.WeakKeyDictionary()
+_specs_lock = threading.Lock()
+
+
+def expand_window(rule, window_start, window_end):
+    """
+    Inícios das ocorrências em [window_start, window_end] (inclusivo).
+    Regras simples pulam direto para a janela, com custo independente da idade
+    da série; o resto cai no rule.between do dateutil.
+    """
+    with _specs_lock:
+        spec = _specs.get(rule, _INVALID)
+    if spec is _INVALID:
+        spec = _AnchoredSpec.build(rule)
+        with _specs_lock:
+            _specs[rule] = spec
+    if spec is None:
+        return rule.between(window_start, window_end, inc=True)
+    return spec.between(window_start, window_end)
+
+
+def _local(dt):
+    return localtime(make_aware(dt) if is_naive(dt) else dt)
+
+
+def weekday_bits(start, end):
+    """Máscara (bit 0 = segunda) dos dias da semana locais tocados por [start, end)"""
+    start, end = _local(start), _local(end - timedelta(microseconds=1))
+    if end < start:
+        return 0
+    days = (end.date() - start.date()).days
+    if days >= 6:
+        return ALL_WEEKDAYS
+    mask = 0
+    for i in range(days + 1):
+        mask |= 1 << ((start.weekday() + i) % 7)
+    return mask
+
+
+def _spread(mask, days):
+    """Máscara com cada dia marcado estendido pelos `days` dias seguintes"""
+    if days >= 6:
+        return ALL_WEEKDAYS
+    spread = 0
+    for wd in range(7):
+        if mask >> wd & 1:
+            for i in range(days + 1):
+                spread |= 1 << ((wd + i) % 7)
+    return spread
+
+
+def series_bounds(start_dt, end_dt, rule_text):
+    """
+    Calcula (series_end, weekday_mask) de uma reserva.
+    series_end é o fim da última ocorrência (None se a série não termina);
+    weekday_mask indica em quais dias da semana (hora local) ela pode
+    ocupar — inclusive os dias seguintes, se a ocorrência passa da meia-noite.
+    Regras inválidas viram uma ocorrência única, como em occurrences_between.
+    """
+    start_dt, end_dt = _local(start_dt), _local(end_dt)
+    single = (end_dt, weekday_bits(start_dt, end_dt) or 1 << start_dt.weekday())
+    if not rule_text:
+        return single
+
+    rule = parse_rule(rule_text, start_dt)
+    if rule is None:
+        return single
+
+    if not isinstance(rule, rrule):
+        # rruleset (várias linhas): sem limites conhecidos
+        return None, ALL_WEEKDAYS
+
+    mask = ALL_WEEKDAYS
+    weekdays = set(rule._byweekday or ())
+    weekdays.update(wd for wd, _ in rule._bynweekday or ())
+    if weekdays:
+        # Dias em que as ocorrências começam, mais os que elas alcançam
+        span = (_local(end_dt - timedelta(microseconds=1)).date() - start_dt.date()).days
+        mask = _spread(sum(1 << wd for wd in weekdays), max(span, 0))
+
+    if rule._count is None and rule._until is None:
+        return None, mask
+
+    last = None
+    for last in rule:
+        pass
+    if last is None:
+        return start_dt, mask
+    return last + (end_dt - start_dt), mask
@@ -0,0 +1,89 @@
+"""
+Papel efetivo do usuário (admin / secretario / professor).
+
+Combina Profile.role e os grupos do usuário numa única consulta e guarda o
+resultado no próprio objeto user — que vive uma requisição —, então
+is_staff_like() pode ser chamado quantas vezes for preciso sem novas queries.
+Opcionalmente o papel também fica no cache do Django por ROLE_CACHE_TIMEOUT
+segundos; os signals apagam a entrada quando grupos, perfil ou usuário mudam.
+Isso só vale com um cache compartilhado entre os workers: com LocMemCache a
+limpeza chegaria só ao processo que fez a mudança, então o cache é ignorado.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .instrumentation import timing
+
+STAFF_ROLES = frozenset({'admin', 'secretario'})
+
+# Do mais forte para o mais fraco
+ROLE_PRIORITY = ('admin', 'secretario', 'professor')
+DEFAULT_ROLE = 'professor'
+
+GROUP_ROLES = {
+    'administrador': 'admin',
+    'secretario': 'secretario',
+    'professor': 'professor',
+}
+
+
+def _cache():
+    return caches[getattr(settings, 'ROLE_CACHE_ALIAS', 'default')]
+
+
+def _cache_timeout():
+    """ROLE_CACHE_TIMEOUT, ou 0 se o cache for só deste processo"""
+    timeout = getattr(settings, 'ROLE_CACHE_TIMEOUT', 0)
+    if timeout and isinstance(_cache(), (LocMemCache, DummyCache)):
+        return 0
+    return timeout
+
+
+def _cache_key(user_id):
+    return f'role:{user_id}'
+
+
+def _compute_role(user):
+    if user.is_superuser:
+        return 'admin'
+    roles = set()
+    rows = User.objects.filter(pk=user.pk).values_list('profile__role', 'groups__name')
+    for profile_role, group in rows:
+        if profile_role:
+            roles.add(profile_role)
+        if group and group.lower() in GROUP_ROLES:
+            roles.add(GROUP_ROLES[group.lower()])
+    return next((role for role in ROLE_PRIORITY if role in roles), DEFAULT_ROLE)
+
+
+def user_role(user):
+    """Papel efetivo do usuário (None se anônimo), calculado uma vez por objeto user"""
+    if not getattr(user, 'is_authenticated', False):
+        return None
+    role = getattr(user, '_effective_role', None)
+    if role is not None:
+        return role
+
+    with timing('perm'):
+        timeout = _cache_timeout()
+        if timeout:
+            role = _cache().get(_cache_key(user.pk))
+        if role is None:
+            role = _compute_role(user)
+            if timeout:
+                _cache().set(_cache_key(user.pk), role, timeout)
+    user._effective_role = role
+    return role
+
+
+def is_staff_like(user):
+    return user_role(user) in STAFF_ROLES
+
+
+def forget_role(user_id):
+    """Descarta o papel em cache (chamado pelos signals)"""
+    if _cache_timeout():
+        _cache().delete(_cache_key(user_id))
@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.contrib.auth.models import User
-from .models import Profile
+from django.contrib.auth.models import Group, User
+from django.db.models import F
+from .models import Notice, Profile, Reservation, ReservationException, Room, ScheduledClass
+from . import changes, conflicts, images, occurrences
+from .availability import day_bounds
+from .feeds import feed_cache
+from .roles import forget_role
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -9,3 +14,174 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         # 🔒 Cria somente se não existir
         Profile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def bump_versions_on_rename(sender, instance, created, update_fields=None, **kwargs):
+    # Nomes de professores aparecem nos feeds: renomear invalida os ETags de todas as salas
+    if created:
+        return
+    if update_fields is None or {'first_name', 'last_name', 'username'} & set(update_fields):
+        Room.objects.update(schedule_version=F('schedule_version') + 1)
+        feed_cache.forget_rooms()
+        changes.record(dict(Room.objects.values_list('pk', 'schedule_version')))
+
+
+# =============================
+# Papel efetivo em cache (roles.py)
+# =============================
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def forget_cached_role(sender, instance, **kwargs):
+    forget_role(instance.pk if sender is User else instance.user_id)
+
+
+def _forget_members(group):
+    for user_id in getattr(group, '_member_ids', ()):
+        forget_role(user_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def forget_cached_role_on_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.groups.add/remove/clear
+        if action.startswith('post_'):
+            forget_role(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set.clear(): guarda quem era membro antes de sair
+        instance._member_ids = list(instance.user_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        _forget_members(instance)
+    elif action.startswith('post_'):
+        for user_id in pk_set or ():
+            forget_role(user_id)
+
+
+@receiver(pre_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def remember_group_members(sender, instance, **kwargs):
+    # Renomear ou excluir um grupo muda o papel de todos os membros
+    instance._member_ids = []
+    if instance.pk:
+        instance._member_ids = list(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_cached_role_on_group_change(sender, instance, **kwargs):
+    _forget_members(instance)
+
+
+# =============================
+# Ocorrências materializadas + índice de conflitos
+# =============================
+# Exclusões de Reservation/ScheduledClass removem as ocorrências via CASCADE.
+def _span(instance):
+    """Trecho afetado pela mudança na série (aulas fixas valem toda semana: sem limite)"""
+    if isinstance(instance, Reservation):
+        return changes.merge_ranges(
+            changes.reservation_range(instance), getattr(instance, '_previous_range', None)
+        )
+    return None, None
+
+
+def _series_changed(instance, room_ids, deleted=False, span=None):
+    # Versiona as salas (invalida ETags e chaves do feed), atualiza índices/caches locais
+    # e avisa os calendários abertos (diário de mudanças)
+    versions = conflicts.series_changed(instance, room_ids, deleted=deleted)
+    feed_cache.forget_rooms([rid for rid in room_ids if rid is not None])
+    changes.record(versions, *(span or _span(instance)))
+
+
+@receiver(pre_save, sender=Reservation)
+@receiver(pre_save, sender=ScheduledClass)
+def remember_previous_room(sender, instance, **kwargs):
+    # Se a série mudou de sala (ou de datas), a sala e o trecho antigos também precisam ser invalidados
+    instance._previous_room_id = None
+    instance._previous_range = None
+    if instance.pk:
+        fields = ('room_id', 'start_dt', 'series_end') if sender is Reservation else ('room_id',)
+        previous = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+        if previous:
+            instance._previous_room_id = previous[0]
+            instance._previous_range = previous[1:] or None
+
+
+@receiver(post_save, sender=Reservation)
+def sync_reservation_occurrences(sender, instance, **kwargs):
+    occurrences.sync_reservation(instance)
+    _series_changed(instance, [instance.room_id, getattr(instance, '_previous_room_id', None)])
+
+
+@receiver(post_save, sender=ScheduledClass)
+def sync_scheduled_class_occurrences(sender, instance, **kwargs):
+    occurrences.sync_scheduled_class(instance)
+    _series_changed(instance, [instance.room_id, getattr(instance, '_previous_room_id', None)])
+
+
+@receiver(post_delete, sender=Reservation)
+@receiver(post_delete, sender=ScheduledClass)
+def forget_deleted_series(sender, instance, **kwargs):
+    _series_changed(instance, [instance.room_id], deleted=True)
+
+
+@receiver(post_save, sender=ReservationException)
+@receiver(post_delete, sender=ReservationException)
+def sync_exception_occurrences(sender, instance, origin=None, **kwargs):
+    # Exceções apagadas em cascata (reserva/sala/usuário excluídos) não ressincronizam
+    if origin is not None and getattr(origin, 'model', type(origin)) is not ReservationException:
+        return
+    reservation = instance.reservation
+    occurrences.sync_reservation(reservation)
+    _series_changed(reservation, [reservation.room_id], span=day_bounds(instance.date))
+
+
+# =============================
+# Variantes de imagem (images.py)
+# =============================
+def _image_field(sender):
+    return 'photo' if sender is Profile else 'imagem'
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Notice)
+def process_uploaded_image(sender, instance, **kwargs):
+    field_name = _image_field(sender)
+    if images.needs_processing(instance, field_name):
+        images.schedule(instance, field_name)
+
+
+# =============================
+# Referências de mídia (storage.py): o arquivo anterior é solto aqui, não nas views
+# =============================
+@receiver(pre_save, sender=Profile)
+@receiver(pre_save, sender=Notice)
+def remember_previous_image(sender, instance, update_fields=None, **kwargs):
+    field_name = _image_field(sender)
+    instance._previous_image = None
+    instance._storing_image = False
+    if instance.pk and (update_fields is None or field_name in update_fields):
+        instance._previous_image = sender.objects.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+        # Arquivo novo: o save() do campo vai gravar e somar uma referência, mesmo
+        # que o conteúdo (e portanto o nome) seja igual ao anterior
+        instance._storing_image = not getattr(instance, field_name)._committed
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Notice)
+def release_replaced_image(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_image', None)
+    field = getattr(instance, _image_field(sender))
+    if previous and (previous != field.name or getattr(instance, '_storing_image', False)):
+        field.storage.delete(previous)
+
+
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=Notice)
+def release_deleted_image(sender, instance, **kwargs):
+    field_name = _image_field(sender)
+    field = getattr(instance, field_name)
+    if field.name:
+        field.storage.delete(field.name)
+    images.delete_variants(field.storage, getattr(instance, images.variants_attr(field_name)))
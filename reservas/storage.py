@@ -0,0 +1,116 @@
+"""
+Armazenamento endereçado por conteúdo para Profile.photo, Notice.imagem e
+suas variantes (reservas/images.py).
+
+O nome do arquivo é o SHA-256 do conteúdo (blobs/ab/abcdef….png): o mesmo
+arquivo enviado duas vezes, por pessoas ou campos diferentes, é gravado uma
+vez só. Cada save() é uma referência a mais e cada delete() uma a menos
+(contadas em MediaBlob); o arquivo só sai do disco quando a última
+referência é solta, depois do commit.
+
+Gravar (_save) e apagar (_collect) o mesmo blob acontecem com a linha de
+MediaBlob travada (select_for_update): um upload que chega enquanto o último
+dono solta o arquivo ou espera o apagamento terminar e grava os bytes de
+novo, ou pega a referência antes e o apagamento desiste.
+
+Quem usa o campo não apaga o arquivo diretamente: os signals soltam a
+referência do arquivo anterior quando o campo muda ou o registro é excluído.
+
+Como a URL muda sempre que o conteúdo muda, /media/blobs/ é servido com
+Cache-Control immutable (views.media_blob).
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+PREFIX = 'blobs'
+CHUNK_SIZE = 64 * 1024
+
+
+def content_name(digest, ext):
+    return f'{PREFIX}/{digest[:2]}/{digest}{ext}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{PREFIX}/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # O nome final sai do conteúdo em _save(); repetido = mesmo conteúdo
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        ext = os.path.splitext(name)[1].lower()[:10]
+        blob = content_name(digest.hexdigest(), ext)
+        with transaction.atomic():
+            # Com a linha travada, _collect não apaga o arquivo entre o exists() e a referência
+            row = self._locked_row(blob, content.size)
+            if not self.exists(blob):
+                # Grava com nome temporário e troca: o arquivo nunca aparece pela metade
+                tmp = super()._save(f'{blob}.{uuid.uuid4().hex}.tmp', content)
+                os.replace(self.path(tmp), self.path(blob))
+            type(row).objects.filter(pk=row.pk).update(refs=F('refs') + 1)
+        return blob
+
+    def delete(self, name):
+        if not is_blob(name):
+            # Arquivo anterior ao armazenamento por conteúdo: nome único, pode sair
+            return super().delete(name)
+        self.release(name)
+
+    # =============================
+    # Contagem de referências
+    # =============================
+    def _locked_row(self, name, size=0):
+        """Linha de MediaBlob do blob, travada até o fim da transação (criada com refs=0)"""
+        from .models import MediaBlob
+        row = MediaBlob.objects.select_for_update().filter(name=name).first()
+        if row is not None:
+            return row
+        try:
+            with transaction.atomic():
+                return MediaBlob.objects.create(name=name, size=size, refs=0)
+        except IntegrityError:
+            # Outro worker criou a linha ao mesmo tempo: espera a transação dele
+            return MediaBlob.objects.select_for_update().get(name=name)
+
+    def release(self, name):
+        from .models import MediaBlob
+        MediaBlob.objects.filter(name=name, refs__gt=0).update(refs=F('refs') - 1)
+        transaction.on_commit(lambda: self._collect(name))
+
+    def _collect(self, name):
+        from .models import MediaBlob
+        with transaction.atomic():
+            row = MediaBlob.objects.select_for_update().filter(name=name).first()
+            # Só apaga se ninguém pegou uma referência nova desde o release()
+            if row is None or row.refs > 0:
+                return
+            self.purge(name)
+            row.delete()
+
+    def purge(self, name):
+        """Apaga o arquivo sem olhar as referências (manage.py dedupe_media --recount)"""
+        super().delete(name)
+
+
+_storage = None
+
+
+def media_storage():
+    """Storage dos campos de imagem (callable: a migração guarda só o caminho)"""
+    global _storage
+    if _storage is None:
+        _storage = ContentAddressedStorage()
+    return _storage
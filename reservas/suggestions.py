@@ -0,0 +1,177 @@
+"""
+Sugestões de horários alternativos quando um pedido conflita.
+
+As lacunas livres saem de intervalos ordenados (sweep_free_windows), em lote
+para vários dias e salas; dentro de cada lacuna só os inícios mais próximos do
+horário pedido viram candidatos. O ranking é pela distância no tempo até o
+pedido original, com a mesma sala desempatando na frente das outras.
+"""
+import heapq
+from datetime import timedelta
+
+from django.utils.timezone import localtime, now
+
+from .availability import day_bounds, floor_minutes, sweep_free_windows, free_windows
+from .models import Room, ScheduledClass, WEEKDAY_CHOICES
+from .occurrences import occurrences_in
+
+# Faixa do dia em que sugerimos horários (minutos desde a meia-noite)
+DAY_START = 6 * 60
+DAY_END = 24 * 60
+STEP = 30
+MINUTES_PER_DAY = 24 * 60
+
+WEEKDAY_NAMES = dict(WEEKDAY_CHOICES)
+WEEKDAY_SHORT = {0: "Seg", 1: "Ter", 2: "Qua", 3: "Qui", 4: "Sex", 5: "Sáb", 6: "Dom"}
+
+
+def _nearest(lo, hi, want, step, k):
+    """Até k inícios múltiplos de `step` em [lo, hi], do mais próximo de `want` ao mais distante"""
+    first = -(-lo // step) * step
+    last = hi // step * step
+    if first > last:
+        return []
+    center = min(max(round(want / step) * step, first), last)
+    out = [center]
+    left, right = center - step, center + step
+    while len(out) < k and (left >= first or right <= last):
+        if right > last or (left >= first and want - left <= right - want):
+            out.append(left)
+            left -= step
+        else:
+            out.append(right)
+            right += step
+    return out
+
+
+def _ranked(gaps, want, duration, room_id, k, step=STEP):
+    """
+    gaps: [(room_id, desvio, início, fim)] em minutos; `desvio` leva o início
+    para a mesma escala de `want`. Devolve os k melhores (distância, sala, desvio, início).
+    """
+    candidates = []
+    for gap_room, offset, lo, hi in gaps:
+        for t in _nearest(lo, hi - duration, want - offset, step, k):
+            candidates.append((abs(t + offset - want), gap_room != room_id, gap_room, offset, t))
+    return heapq.nsmallest(k, candidates)
+
+
+def _rooms(room):
+    rooms = {r.pk: r for r in Room.objects.all()}
+    rooms.setdefault(room.pk, room)
+    return rooms
+
+
+# =============================
+# Grade fixa (dia da semana + horário)
+# =============================
+def weekly_alternatives(room, weekday, around_start, duration_min, exclude_id=None,
+                        max_suggestions=8, day_radius=1):
+    """
+    Horários livres para uma aula fixa: o mesmo dia da semana e os vizinhos
+    (±day_radius), nesta sala e nas outras. Ocupam a grade fixa e as reservas
+    na próxima data de cada dia da semana (o mesmo critério de _has_conflict).
+    """
+    rooms = _rooms(room)
+    # dia da semana -> deslocamento em dias (o menor, se o raio der a volta na semana)
+    weekdays = {}
+    for d in sorted(range(-day_radius, day_radius + 1), key=abs):
+        weekdays.setdefault((weekday + d) % 7, d)
+    keys = [(rid, wd) for rid in rooms for wd in weekdays]
+
+    intervals = []
+    sc_qs = ScheduledClass.objects.filter(is_active=True, weekday__in=list(weekdays))
+    if exclude_id:
+        sc_qs = sc_qs.exclude(id=exclude_id)
+    for rid, wd, s, e in sc_qs.values_list('room_id', 'weekday', 'start_time', 'end_time'):
+        start_m, end_m = s.hour * 60 + s.minute, e.hour * 60 + e.minute
+        # Horário que "vira" a meia-noite vai até o fim do dia
+        intervals.append(((rid, wd), start_m, end_m if end_m > start_m else MINUTES_PER_DAY))
+
+    today = now().date()
+    dates = {today + timedelta(days=(wd - today.weekday()) % 7): wd for wd in weekdays}
+    starts = {d: day_bounds(d)[0] for d in dates}
+    range_start, range_end = starts[min(dates)], day_bounds(max(dates))[1]
+    for s, e, obj in occurrences_in(range_start, range_end, kind='reservation', room_id__in=list(rooms)):
+        for d, ds in starts.items():
+            start_m, end_m = floor_minutes(s - ds), floor_minutes(e - ds)
+            if start_m < MINUTES_PER_DAY and end_m > 0:
+                intervals.append(((obj.room_id, dates[d]), max(start_m, 0), min(end_m, MINUTES_PER_DAY)))
+
+    windows = sweep_free_windows(intervals, keys, DAY_START, DAY_END, duration_min)
+    gaps = [
+        (rid, weekdays[wd] * MINUTES_PER_DAY, lo, hi)
+        for (rid, wd), spans in windows.items()
+        for lo, hi in spans
+    ]
+    want = around_start.hour * 60 + around_start.minute
+
+    result = []
+    for _, _, rid, offset, t in _ranked(gaps, want, duration_min, room.pk, max_suggestions):
+        wd = (weekday + offset // MINUTES_PER_DAY) % 7
+        r = rooms[rid]
+        start = f"{t // 60:02d}:{t % 60:02d}"
+        label = f"{WEEKDAY_NAMES.get(wd, 'Dia')} • {start}"
+        if rid != room.pk:
+            label += f" • {r.name}"
+        result.append({
+            "weekday": wd,
+            "weekday_label": WEEKDAY_NAMES.get(wd, "Dia"),
+            "start": start,
+            "room_slug": r.slug,
+            "room_name": r.name,
+            "label": label,
+        })
+    return result
+
+
+# =============================
+# Reservas (data + horário)
+# =============================
+def dated_alternatives(room, start_dt, duration_min, max_suggestions=8, day_radius=2):
+    """
+    Horários livres para uma reserva: dias vizinhos (±day_radius, nunca no
+    passado), nesta sala e nas outras, ordenados pela distância até start_dt.
+    """
+    rooms = _rooms(room)
+    current = localtime(now())
+    target_day = localtime(start_dt).date()
+    first_day = max(target_day - timedelta(days=day_radius), current.date())
+    last_day = target_day + timedelta(days=day_radius)
+    if last_day < first_day:
+        return []
+
+    origin = day_bounds(first_day)[0]
+    window_start = max(origin, current)
+    window_end = day_bounds(last_day)[1]
+    windows = free_windows(list(rooms), window_start, window_end, timedelta(minutes=duration_min))
+
+    # Cada lacuna é recortada na faixa útil de cada dia que ela atravessa
+    gaps = []
+    for rid, spans in windows.items():
+        for s, e in spans:
+            lo, hi = floor_minutes(s - origin), floor_minutes(e - origin)
+            for day in range(lo // MINUTES_PER_DAY, (hi - 1) // MINUTES_PER_DAY + 1):
+                base = day * MINUTES_PER_DAY
+                clip_lo, clip_hi = max(lo, base + DAY_START), min(hi, base + DAY_END)
+                if clip_hi - clip_lo >= duration_min:
+                    gaps.append((rid, 0, clip_lo, clip_hi))
+
+    want = floor_minutes(start_dt - origin)
+    result = []
+    for _, _, rid, _, t in _ranked(gaps, want, duration_min, room.pk, max_suggestions):
+        r = rooms[rid]
+        s = localtime(origin + timedelta(minutes=t))
+        e = s + timedelta(minutes=duration_min)
+        label = f"{WEEKDAY_SHORT[s.weekday()]} {s:%d/%m} • {s:%H:%M}"
+        if rid != room.pk:
+            label += f" • {r.name}"
+        result.append({
+            "date": s.date().isoformat(),
+            "start": s.strftime("%H:%M"),
+            "end": e.strftime("%H:%M"),
+            "room_slug": r.slug,
+            "room_name": r.name,
+            "label": label,
+        })
+    return result
@@ -0,0 +1,184 @@
+"""
+Massa de dados sintética e reprodutível (manage.py generate_dataset e bench_suite).
+
+Gera salas, professores, grade fixa semanal, séries RRULE com exceções e
+reservas avulsas sem nenhuma sobreposição: cada sala tem células de uma hora
+(dia da semana × hora, de FIRST_HOUR a LAST_HOUR) e cada aula fixa ou série
+recebe células só suas; as avulsas caem em células livres de datas
+específicas. A mesma semente gera sempre os mesmos dados.
+
+Tudo é gravado com bulk_create (sem signals); no fim as ocorrências são
+rematerializadas e as salas versionadas de uma vez. Salas e usuários levam o
+prefixo PREFIX, para que clear() apague só o que foi gerado.
+"""
+import random
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils.timezone import get_current_timezone, localtime, make_aware, now
+
+from . import changes
+from .conflicts import rooms_changed
+from .feeds import feed_cache
+from .models import Profile, Reservation, ReservationException, Room, ScheduledClass
+from .occurrences import roll_horizon
+from .recurrence import series_bounds
+
+PREFIX = 'syn-'
+# Células de 07:00 a 22:00; das 22:00 em diante fica livre para os benchmarks gravarem
+FIRST_HOUR, LAST_HOUR = 7, 22
+
+SCALES = {
+    'small': {'rooms': 5, 'teachers': 20, 'classes': 10, 'series': 40, 'singles': 200},
+    'medium': {'rooms': 20, 'teachers': 100, 'classes': 15, 'series': 400, 'singles': 2000},
+    'large': {'rooms': 60, 'teachers': 400, 'classes': 20, 'series': 2000, 'singles': 10000},
+}
+
+RRULE_DAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+FIRST_NAMES = ('Ana', 'Bruno', 'Carla', 'Diego', 'Elisa', 'Fábio', 'Gabriela', 'Heitor', 'Isabela', 'João')
+LAST_NAMES = ('Silva', 'Souza', 'Oliveira', 'Santos', 'Pereira', 'Lima', 'Costa', 'Ribeiro', 'Almeida', 'Rocha')
+CLASS_TITLES = ('Ballet', 'Jazz', 'Contemporâneo', 'Hip Hop', 'Sapateado', 'Dança de Salão', 'Alongamento')
+
+
+def _aware(day, hour, minute=0):
+    return make_aware(datetime.combine(day, time(hour, minute)), timezone=get_current_timezone())
+
+
+def _rule(rng, weekdays, dtstart, years):
+    """RRULE semanal com variações: sem fim, COUNT, UNTIL ou INTERVAL=2"""
+    rule = 'FREQ=WEEKLY;BYDAY=' + ','.join(RRULE_DAYS[wd] for wd in weekdays)
+    kind = rng.random()
+    if kind < 0.2:
+        rule += f';COUNT={rng.randint(10, 80)}'
+    elif kind < 0.4:
+        until = dtstart.date() + timedelta(days=rng.randint(60, 365 * (years + 1)))
+        rule += f';UNTIL={until:%Y%m%d}T235959Z'
+    elif kind < 0.5:
+        rule += ';INTERVAL=2'
+    return rule
+
+
+def generate(rooms, teachers, classes, series, singles, exceptions=3, years=3, seed=42):
+    """Grava a massa de dados e devolve as contagens. `classes` é por sala; o resto é total"""
+    rng = random.Random(seed)
+    today = localtime(now()).date()
+    history = getattr(settings, 'OCCURRENCE_HISTORY_DAYS', 60)
+    horizon = getattr(settings, 'OCCURRENCE_HORIZON_DAYS', 180)
+    hours = range(FIRST_HOUR, LAST_HOUR)
+
+    room_objs = Room.objects.bulk_create([
+        Room(name=f'Sala sintética {i + 1}', slug=f'{PREFIX}sala-{i + 1}') for i in range(rooms)
+    ])
+    password = make_password(None)
+    users = User.objects.bulk_create([
+        User(
+            username=f'{PREFIX}prof-{i + 1}',
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            password=password,
+        )
+        for i in range(teachers)
+    ] + [User(username=f'{PREFIX}admin', first_name='Admin', password=password)])
+    teacher_objs, admin = users[:-1], users[-1]
+    Profile.objects.bulk_create(
+        [Profile(user=u, role='professor') for u in teacher_objs] + [Profile(user=admin, role='admin')]
+    )
+
+    # Células livres de cada sala, em ordem aleatória
+    free = {}
+    for room in room_objs:
+        cells = [(wd, h) for wd in range(7) for h in hours]
+        rng.shuffle(cells)
+        free[room.pk] = cells
+
+    scheduled = []
+    for room in room_objs:
+        for _ in range(min(classes, len(free[room.pk]))):
+            wd, h = free[room.pk].pop()
+            scheduled.append(ScheduledClass(
+                room=room, user=rng.choice(teacher_objs), title=rng.choice(CLASS_TITLES),
+                weekday=wd, start_time=time(h), end_time=time(h, rng.choice((45, 50, 59))),
+            ))
+    ScheduledClass.objects.bulk_create(scheduled)
+
+    reservations, exception_dates = [], []
+    for i in range(series):
+        room = room_objs[i % rooms]
+        cells = free[room.pk]
+        if not cells:
+            continue
+        wd, h = cells.pop()
+        weekdays = [wd]
+        # Algumas séries caem em dois dias da semana, no mesmo horário
+        twin = next((c for c in cells if c[1] == h), None) if rng.random() < 0.3 else None
+        if twin:
+            cells.remove(twin)
+            weekdays.append(twin[0])
+        first = today - timedelta(days=rng.randint(0, 365 * years))
+        first += timedelta(days=(wd - first.weekday()) % 7)
+        start = _aware(first, h)
+        end = start + timedelta(minutes=rng.choice((45, 60)))
+        reservations.append(Reservation(
+            room=room, user=rng.choice(teacher_objs), start_dt=start, end_dt=end,
+            recurrence_rule=_rule(rng, sorted(weekdays), start, years),
+        ))
+        weeks = max(1, (today + timedelta(days=horizon) - first).days // 7)
+        exception_dates.append(sorted({
+            first + timedelta(weeks=w) for w in rng.sample(range(weeks), min(weeks, rng.randint(0, 2 * exceptions)))
+        }))
+
+    # Avulsas: células que nenhuma aula ou série usa naquela sala/dia da semana
+    weekly_used = {
+        room.pk: {(wd, h) for wd in range(7) for h in hours} - set(free[room.pk]) for room in room_objs
+    }
+    taken = set()
+    for _ in range(singles * 3):
+        if len(taken) >= singles:
+            break
+        room = rng.choice(room_objs)
+        day = today + timedelta(days=rng.randint(-history, horizon))
+        h = rng.choice(hours)
+        if (day.weekday(), h) in weekly_used[room.pk] or (room.pk, day, h) in taken:
+            continue
+        taken.add((room.pk, day, h))
+        start = _aware(day, h, rng.choice((0, 30)))
+        reservations.append(Reservation(
+            room=room, user=rng.choice(teacher_objs), start_dt=start,
+            end_dt=start + timedelta(minutes=30), is_cancelled=rng.random() < 0.05,
+        ))
+
+    # bulk_create não passa pelo save(): calcula os limites da série aqui
+    for r in reservations:
+        r.series_end, r.weekday_mask = series_bounds(r.start_dt, r.end_dt, r.recurrence_rule)
+    Reservation.objects.bulk_create(reservations, batch_size=1000)
+    exception_rows = [
+        ReservationException(reservation=r, date=d)
+        for r, dates in zip(reservations, exception_dates) for d in dates
+    ]
+    ReservationException.objects.bulk_create(exception_rows, batch_size=1000)
+
+    roll_horizon(rebuild=True)
+    room_ids = [room.pk for room in room_objs]
+    changes.record(rooms_changed(room_ids))
+    feed_cache.forget_rooms(room_ids)
+
+    return {
+        'rooms': len(room_objs),
+        'teachers': len(teacher_objs),
+        'scheduled_classes': len(scheduled),
+        'series': len(exception_dates),
+        'exceptions': len(exception_rows),
+        'singles': len(taken),
+    }
+
+
+def clear():
+    """Apaga salas e usuários gerados (e, em cascata, tudo que é deles)"""
+    rooms = Room.objects.filter(slug__startswith=PREFIX)
+    room_ids = list(rooms.values_list('pk', flat=True))
+    deleted, _ = rooms.delete()
+    deleted += User.objects.filter(username__startswith=PREFIX).delete()[0]
+    feed_cache.forget_rooms(room_ids)
+    return deleted
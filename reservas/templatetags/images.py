@@ -0,0 +1,42 @@
+"""
+Imagens responsivas a partir das variantes de reservas/images.py.
+
+    {% load images %}
+    {% picture profile.photo "160px" alt="Foto" class="rounded-circle" %}
+    <img src="..." srcset="{% srcset aviso.imagem 'webp' %}" sizes="...">
+
+Sem variantes prontas (upload ainda em processamento ou imagem que o Pillow
+não abriu), `picture` cai num <img> simples com o arquivo original.
+"""
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from reservas import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset(field_file, fmt='webp'):
+    return images.srcset(field_file, fmt)
+
+
+@register.simple_tag
+def picture(field_file, sizes, **attrs):
+    """<picture> com WebP e JPEG nos tamanhos gerados; `sizes` é o do HTML (ex.: "40px")"""
+    if not field_file:
+        return ''
+    attrs.setdefault('decoding', 'async')
+    variants = images.ready_variants(field_file)
+    if variants is None:
+        return format_html('<img src="{}"{}>', field_file.url, flatatt(attrs))
+
+    storage = field_file.storage
+    largest = variants['jpeg'][max(variants['jpeg'], key=int)]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        images.srcset(field_file, 'webp'), sizes,
+        storage.url(largest), images.srcset(field_file, 'jpeg'), sizes, flatatt(attrs),
+    )
@@ -1,3 +1,77 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from . import images
+from .models import MediaBlob, Profile
+from .storage import media_storage
+
+
+# =============================
+# Referências de mídia (storage.py + signals)
+# =============================
+class MediaRefcountTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Sem variantes: só as referências do próprio upload entram na conta
+        schedule = mock.patch.object(images, 'schedule')
+        schedule.start()
+        self.addCleanup(schedule.stop)
+
+    def _profile(self, username):
+        # O perfil nasce com o usuário (signals.py)
+        return Profile.objects.get(user=User.objects.create(username=username))
+
+    def _upload(self, profile, data):
+        profile.photo = SimpleUploadedFile('avatar.png', data)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        return profile.photo.name
+
+    def _refs(self, name):
+        return MediaBlob.objects.filter(name=name).values_list('refs', flat=True).first()
+
+    def test_upload_reupload_replace_delete(self):
+        profile = self._profile('ana')
+        first = self._upload(profile, b'avatar-1')
+        self.assertEqual(self._refs(first), 1)
+        self.assertTrue(media_storage().exists(first))
+
+        # Mesmo conteúdo de novo: mesmo blob, e a referência do upload anterior é solta
+        self.assertEqual(self._upload(profile, b'avatar-1'), first)
+        self.assertEqual(self._refs(first), 1)
+
+        second = self._upload(profile, b'avatar-2')
+        self.assertNotEqual(second, first)
+        self.assertIsNone(self._refs(first))
+        self.assertFalse(media_storage().exists(first))
+        self.assertEqual(self._refs(second), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.delete()
+        self.assertIsNone(self._refs(second))
+        self.assertFalse(media_storage().exists(second))
+
+    def test_shared_blob_survives_until_last_owner(self):
+        ana, bia = self._profile('ana'), self._profile('bia')
+        name = self._upload(ana, b'same-bytes')
+        self.assertEqual(self._upload(bia, b'same-bytes'), name)
+        self.assertEqual(self._refs(name), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ana.delete()
+        self.assertEqual(self._refs(name), 1)
+        self.assertTrue(media_storage().exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bia.delete()
+        self.assertIsNone(self._refs(name))
+        self.assertFalse(media_storage().exists(name))
@@ -0,0 +1,364 @@
+"""
+Importação da grade fixa (ScheduledClass) a partir de CSV ou ICS.
+
+Todas as linhas são validadas de uma vez: as aulas já existentes, as reservas
+da próxima data de cada dia da semana e as próprias linhas do arquivo entram
+num único sweep ordenado por (sala, dia da semana). O que passa é gravado com
+bulk_create numa transação; o resto volta num relatório de conflitos.
+
+CSV (separador , ou ;), com cabeçalho:
+    sala,professor,dia,inicio,fim,titulo
+`fim` pode ser trocado por `duracao` (minutos). `sala` aceita slug ou nome,
+`professor` aceita username ou e-mail e `dia` aceita 0–6 ou o nome do dia.
+
+ICS: cada VEVENT semanal vira uma aula por BYDAY (ou pelo dia do DTSTART).
+LOCATION é a sala, SUMMARY o título e ORGANIZER (e-mail ou CN) o professor.
+"""
+import csv
+import io
+import re
+import unicodedata
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.timezone import localtime, now
+
+from . import changes
+from .availability import day_bounds, floor_minutes
+from .conflicts import rooms_changed
+from .feeds import feed_cache
+from .locking import lock_rooms
+from .models import Room, ScheduledClass
+from .occurrences import occurrences_in, sync_scheduled_classes
+
+MINUTES_PER_DAY = 24 * 60
+
+COLUMNS = {
+    'sala': 'room', 'room': 'room',
+    'professor': 'teacher', 'teacher': 'teacher',
+    'dia': 'weekday', 'weekday': 'weekday',
+    'inicio': 'start', 'start': 'start',
+    'fim': 'end', 'end': 'end',
+    'duracao': 'duration', 'duration': 'duration',
+    'titulo': 'title', 'title': 'title',
+}
+
+WEEKDAY_NAMES = {
+    'seg': 0, 'ter': 1, 'qua': 2, 'qui': 3, 'sex': 4, 'sab': 5, 'dom': 6,
+    'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6,
+}
+ICS_DAYS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+
+
+class TimetableError(ValueError):
+    """Linha que não pôde ser interpretada"""
+
+
+def _plain(text):
+    """minúsculas, sem acento e sem espaços nas pontas"""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode()
+    return text.strip().lower()
+
+
+def _parse_time(text):
+    try:
+        h, m = map(int, str(text).strip().split(':')[:2])
+        return time(h, m)
+    except (TypeError, ValueError):
+        raise TimetableError(f"Horário inválido: {text!r}")
+
+
+def _parse_weekday(text):
+    value = _plain(text)
+    if value.isdigit() and int(value) < 7:
+        return int(value)
+    if value[:3] in WEEKDAY_NAMES:
+        return WEEKDAY_NAMES[value[:3]]
+    raise TimetableError(f"Dia da semana inválido: {text!r}")
+
+
+# =============================
+# Leitura dos arquivos
+# =============================
+def parse_csv(text):
+    """[(linha, dados)] com dados = dict(room, teacher, weekday, start, end, title) ou TimetableError"""
+    try:
+        dialect = csv.Sniffer().sniff(text.split('\n', 1)[0], delimiters=',;')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    rows = []
+    for line, raw in enumerate(reader, start=2):
+        data = {COLUMNS[_plain(k)]: (v or '').strip() for k, v in raw.items() if _plain(k) in COLUMNS}
+        try:
+            start = _parse_time(data.get('start'))
+            if data.get('end'):
+                end = _parse_time(data['end'])
+            elif data.get('duration', '').isdigit():
+                end = (datetime.combine(datetime.min, start) + timedelta(minutes=int(data['duration']))).time()
+            else:
+                raise TimetableError("Informe fim ou duração")
+            rows.append((line, {
+                'room': data.get('room', ''),
+                'teacher': data.get('teacher', ''),
+                'weekday': _parse_weekday(data.get('weekday')),
+                'start': start,
+                'end': end,
+                'title': data.get('title') or 'Aula',
+            }))
+        except TimetableError as exc:
+            rows.append((line, exc))
+    return rows
+
+
+def _ics_lines(text):
+    """Linhas do ICS já "desdobradas" (continuações começam com espaço), com o nº da linha"""
+    lines = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if line[:1] in (' ', '\t') and lines:
+            lines[-1] = (lines[-1][0], lines[-1][1] + line[1:])
+        elif line.strip():
+            lines.append((number, line))
+    return lines
+
+
+def _ics_datetime(value):
+    """(data, hora) locais; horários em UTC ("...Z") são convertidos para o fuso do projeto"""
+    match = re.match(r'(\d{8})T(\d{2})(\d{2})\d{0,2}(Z?)', value.strip())
+    if not match:
+        raise TimetableError(f"DTSTART/DTEND sem horário: {value!r}")
+    dt = datetime.strptime(match.group(1) + match.group(2) + match.group(3), '%Y%m%d%H%M')
+    if match.group(4):
+        dt = localtime(dt.replace(tzinfo=dt_timezone.utc))
+    return dt.date(), dt.time().replace(second=0, microsecond=0, tzinfo=None)
+
+
+def _ics_duration(value):
+    match = re.fullmatch(r'PT(?:(\d+)H)?(?:(\d+)M)?', value)
+    if not match or not any(match.groups()):
+        raise TimetableError(f"DURATION inválida: {value!r}")
+    return int(match.group(1) or 0) * 60 + int(match.group(2) or 0)
+
+
+def parse_ics(text):
+    """Mesmo formato de parse_csv; o "nº da linha" é o do BEGIN:VEVENT"""
+    rows, event, line = [], None, 0
+    for number, raw in _ics_lines(text):
+        name, _, value = raw.partition(':')
+        key, *params = name.split(';')
+        key = key.upper()
+        if key == 'BEGIN' and value.upper() == 'VEVENT':
+            event, line = {}, number
+        elif key == 'END' and value.upper() == 'VEVENT' and event is not None:
+            rows.extend((line, data) for data in _ics_event(event))
+            event = None
+        elif event is not None:
+            event[key] = (value, params)
+    return rows
+
+
+def _ics_event(event):
+    try:
+        if 'DTSTART' not in event:
+            raise TimetableError("VEVENT sem DTSTART")
+        day, start = _ics_datetime(event['DTSTART'][0])
+        if 'DTEND' in event:
+            _, end = _ics_datetime(event['DTEND'][0])
+        elif 'DURATION' in event:
+            minutes = _ics_duration(event['DURATION'][0])
+            end = (datetime.combine(day, start) + timedelta(minutes=minutes)).time()
+        else:
+            raise TimetableError("VEVENT sem DTEND/DURATION")
+
+        rule = dict(
+            part.split('=', 1) for part in event.get('RRULE', ('', []))[0].upper().split(';') if '=' in part
+        )
+        if rule and rule.get('FREQ') != 'WEEKLY':
+            raise TimetableError("Só recorrências semanais viram aula fixa")
+        weekdays = [ICS_DAYS[d[-2:]] for d in rule.get('BYDAY', '').split(',') if d[-2:] in ICS_DAYS]
+
+        organizer, params = event.get('ORGANIZER', ('', []))
+        teacher = organizer.split(':', 1)[-1] if organizer.lower().startswith('mailto:') else organizer
+        for param in params:
+            if param.upper().startswith('CN=') and not teacher:
+                teacher = param[3:].strip('"')
+    except TimetableError as exc:
+        return [exc]
+
+    return [
+        {
+            'room': event.get('LOCATION', ('', []))[0].strip(),
+            'teacher': teacher.strip(),
+            'weekday': wd,
+            'start': start,
+            'end': end,
+            'title': event.get('SUMMARY', ('', []))[0].strip() or 'Aula',
+        }
+        for wd in (weekdays or [day.weekday()])
+    ]
+
+
+def parse_file(name, content):
+    """Escolhe o parser pela extensão (ou pelo conteúdo) do arquivo"""
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if name.lower().endswith('.ics') or content.lstrip().upper().startswith('BEGIN:VCALENDAR'):
+        return parse_ics(content)
+    return parse_csv(content)
+
+
+# =============================
+# Validação (sweep por sala + dia da semana)
+# =============================
+def _minutes(start_t, end_t):
+    start = start_t.hour * 60 + start_t.minute
+    end = end_t.hour * 60 + end_t.minute
+    # Horário que "vira" a meia-noite vai até o fim do dia
+    return start, end if end > start else MINUTES_PER_DAY
+
+
+def _sweep(items):
+    """
+    Intervalos (início, fim, origem) de um (sala, dia), em qualquer ordem; a
+    origem é ('row', índice) para linhas do arquivo e (tipo, id) para o resto.
+    Em ordem de início, tudo o que ainda está ativo cruza o intervalo que chega.
+    1ª passada: linhas que cruzam algo já existente são recusadas;
+    2ª passada: entre as restantes, a que começa antes fica e as que a cruzam saem.
+    Devolve (índices aceitos, {índice: [origens em conflito]}).
+    """
+    items.sort(key=lambda item: (item[0], item[1]))
+    conflicts = {}
+
+    active = []
+    for start, end, source in items:
+        active = [item for item in active if item[1] > start]
+        for _, _, other in active:
+            if (source[0] == 'row') != (other[0] == 'row'):
+                row, fixed = (source, other) if source[0] == 'row' else (other, source)
+                conflicts.setdefault(row[1], []).append(fixed)
+        active.append((start, end, source))
+
+    accepted, active = set(), []
+    for start, end, source in items:
+        if source[0] != 'row' or source[1] in conflicts:
+            continue
+        active = [item for item in active if item[1] > start]
+        if active:
+            conflicts[source[1]] = [other for _, _, other in active]
+        else:
+            accepted.add(source[1])
+            active.append((start, end, source))
+    return accepted, conflicts
+
+
+def _busy_intervals(keys):
+    """{(sala, dia): [(início, fim, origem)]} das aulas ativas e reservas que já ocupam a grade"""
+    busy = {key: [] for key in keys}
+    if not keys:
+        return busy
+    room_ids = {room_id for room_id, _ in keys}
+
+    existing = ScheduledClass.objects.filter(
+        is_active=True, room_id__in=room_ids, weekday__in={wd for _, wd in keys}
+    ).values_list('id', 'room_id', 'weekday', 'start_time', 'end_time')
+    for pk, room_id, wd, s, e in existing:
+        if (room_id, wd) in busy:
+            busy[room_id, wd].append((*_minutes(s, e), ('class', pk)))
+
+    # Reservas na próxima data de cada dia da semana (mesmo critério de _has_conflict)
+    today = now().date()
+    dates = {today + timedelta(days=(wd - today.weekday()) % 7): wd for wd in range(7)}
+    starts = {d: day_bounds(d)[0] for d in dates}
+    for s, e, obj in occurrences_in(
+        starts[min(dates)], day_bounds(max(dates))[1], kind='reservation', room_id__in=room_ids
+    ):
+        for d, ds in starts.items():
+            key = (obj.room_id, dates[d])
+            start_m, end_m = floor_minutes(s - ds), floor_minutes(e - ds)
+            if key in busy and start_m < MINUTES_PER_DAY and end_m > 0:
+                busy[key].append((max(start_m, 0), min(end_m, MINUTES_PER_DAY), ('reservation', obj.pk)))
+    return busy
+
+
+def plan_import(parsed, lock=False):
+    """
+    Resolve salas/professores e valida tudo de uma vez.
+    Devolve (aceitas, problemas): aceitas = [ScheduledClass não salvas],
+    problemas = [{"line", "error"}] ou [{"line", "weekday", "start", "conflicts"}].
+    """
+    problems, candidates = [], []
+    rooms = {}
+    for room in Room.objects.all():
+        rooms[_plain(room.slug)] = room
+        rooms.setdefault(_plain(room.name), room)
+    users = {}
+    for user in User.objects.filter(is_active=True):
+        for key in (user.username, user.email):
+            if key:
+                users.setdefault(_plain(key), user)
+
+    for line, data in parsed:
+        if isinstance(data, Exception):
+            problems.append({'line': line, 'error': str(data)})
+            continue
+        room = rooms.get(_plain(data['room']))
+        user = users.get(_plain(data['teacher']))
+        if room is None:
+            problems.append({'line': line, 'error': f"Sala desconhecida: {data['room']!r}"})
+        elif user is None:
+            problems.append({'line': line, 'error': f"Professor desconhecido: {data['teacher']!r}"})
+        else:
+            candidates.append((line, ScheduledClass(
+                room=room, user=user, title=data['title'][:100], weekday=data['weekday'],
+                start_time=data['start'], end_time=data['end'], is_active=True,
+            )))
+
+    if lock:
+        # Valida e grava dentro da trava das salas do arquivo (ver locking.py)
+        lock_rooms({sc.room_id for _, sc in candidates})
+    busy = _busy_intervals({(sc.room_id, sc.weekday) for _, sc in candidates})
+    for idx, (_, sc) in enumerate(candidates):
+        busy[sc.room_id, sc.weekday].append((*_minutes(sc.start_time, sc.end_time), ('row', idx)))
+
+    accepted, conflicts = set(), {}
+    for items in busy.values():
+        ok, clashes = _sweep(items)
+        accepted |= ok
+        conflicts.update(clashes)
+
+    def describe(source):
+        kind, ref = source
+        if kind == 'class':
+            return f"aula fixa existente #{ref}"
+        if kind == 'reservation':
+            return f"reserva #{ref}"
+        return f"linha {candidates[ref][0]} do arquivo"
+
+    for idx, clashes in conflicts.items():
+        line, sc = candidates[idx]
+        problems.append({
+            'line': line,
+            'weekday': sc.weekday,
+            'start': sc.start_time.strftime('%H:%M'),
+            'conflicts': [describe(source) for source in clashes],
+        })
+    problems.sort(key=lambda p: p['line'])
+    return [sc for idx, (_, sc) in enumerate(candidates) if idx in accepted], problems
+
+
+def import_timetable(parsed, dry_run=False):
+    """Valida e grava numa transação. Devolve {"created", "problems"}"""
+    if dry_run:
+        accepted, problems = plan_import(parsed)
+        return {'created': 0, 'valid': len(accepted), 'problems': problems}
+
+    with transaction.atomic():
+        accepted, problems = plan_import(parsed, lock=True)
+        created = ScheduledClass.objects.bulk_create(accepted)
+        # bulk_create não dispara signals: ocorrências, versões e caches aqui
+        sync_scheduled_classes([sc.pk for sc in created])
+        room_ids = {sc.room_id for sc in created}
+        changes.record(rooms_changed(room_ids))
+    feed_cache.forget_rooms(room_ids)
+    return {'created': len(created), 'valid': len(accepted), 'problems': problems}
@@ -1,17 +1,23 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 from django.contrib.auth import views as auth_views
+from . import async_views, views
 from .views import (
-    home, profile_view, events_feed, availability, reserve_view,
-    cancel_reservation,
+    home, profile_view, free_rooms, schedule_changes_poll,
+    reserve_view, cancel_reservation,
     # Admin agenda
-    admin_agenda, admin_events_feed, cancel_bulk,
+    admin_agenda, cancel_bulk,
     # Admin grade fixa
     admin_grade_view, admin_grade_create, admin_grade_update,
-    admin_grade_toggle, admin_grade_delete,
+    admin_grade_toggle, admin_grade_delete, admin_grade_import,
     # Painel administrativo e home com avisos
     admin_panel, home_with_notices,   # ✅ ESSENCIAL: importa as duas novas views
+    metrics_view, profiles_api, profile_download, media_blob,
 )
 
+# Sob ASGI (core/asgi.py) as APIs de leitura usam as versões assíncronas
+feeds = async_views if getattr(settings, 'ASYNC_VIEWS', False) else views
+
 urlpatterns = [
 
     # =============================
@@ -31,8 +37,11 @@ urlpatterns = [
     # ==============================
     # 🧩 API de reservas
     # ==============================
-    path("api/events/", events_feed, name="events_feed"),
-    path("api/availability/", availability, name="availability"),
+    path("api/events/", feeds.events_feed, name="events_feed"),
+    path("api/availability/", feeds.availability, name="availability"),
+    path("api/free-rooms/", free_rooms, name="free_rooms"),
+    path("api/changes/", feeds.schedule_changes, name="schedule_changes"),
+    path("api/changes/poll/", schedule_changes_poll, name="schedule_changes_poll"),
     path("reserve/", reserve_view, name="reserve"),
     path("cancel/", cancel_reservation, name="cancel_reservation"),
 
@@ -40,8 +49,11 @@ urlpatterns = [
     # 🧑‍💼 Administração - Agenda
     # ==============================
     path("admin-agenda/", admin_agenda, name="admin_agenda"),
-    path("api/admin-events/", admin_events_feed, name="admin_events_feed"),
+    path("api/admin-events/", feeds.admin_events_feed, name="admin_events_feed"),
     path("api/cancel-bulk/", cancel_bulk, name="cancel_bulk"),
+    path("metrics/", metrics_view, name="metrics"),
+    path("api/profiles/", profiles_api, name="profiles"),
+    path("api/profiles/<str:name>/", profile_download, name="profile_download"),
 
     # ==============================
     # 🗓️ Administração - Grade fixa
@@ -51,6 +63,16 @@ urlpatterns = [
     path("admin-grade/update/", admin_grade_update, name="admin_grade_update"),
     path("admin-grade/toggle/", admin_grade_toggle, name="admin_grade_toggle"),
     path("admin-grade/delete/", admin_grade_delete, name="admin_grade_delete"),
+    path("admin-grade/import/", admin_grade_import, name="admin_grade_import"),
+
+    # ==============================
+    # 🖼️ Mídia endereçada por conteúdo (servida também fora do DEBUG)
+    # ==============================
+    re_path(
+        r"^" + settings.MEDIA_URL.lstrip("/") + r"blobs/(?P<path>[0-9a-f]{2}/[0-9a-f]{64}(?:\.[a-z0-9]{1,9})?)$",
+        media_blob,
+        name="media_blob",
+    ),
 
     # ==============================
     # 🔐 Sistema de Reset de Senha
@@ -1,22 +1,54 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.conf import settings
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed,
+    JsonResponse, StreamingHttpResponse,
+)
+from django.urls import reverse
 from django.utils.dateparse import parse_datetime, parse_date
-from django.views.decorators.http import require_POST
-from django.utils.timezone import make_aware, is_naive, now, get_current_timezone
+from django.views.decorators.http import require_POST, condition
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.vary import vary_on_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.timezone import make_aware, is_naive, now, get_current_timezone, localtime
 from datetime import datetime, timedelta, time
 from django.contrib import messages
 from .models import Notice, Profile
-from django.db import models
+from django.db import models, IntegrityError
 from .forms import ProfilePhotoForm
+from .occurrences import occurrences_in, has_overlap
+from .availability import (
+    occupancy, free_starts, free_windows, day_bounds, floor_minutes, ceil_minutes, MINUTES_PER_DAY,
+)
+from .conflicts import reservation_overlaps, weekly_overlaps
+from .suggestions import weekly_alternatives, dated_alternatives
+from .bulk import cancel_events
+from .timetable import parse_file as parse_timetable, import_timetable
+# Helper: perfil administrativo (papel resolvido uma vez por requisição)
+from .roles import is_staff_like
+from .instrumentation import timing
+from . import metrics, profiling
+from .storage import PREFIX as BLOB_PREFIX, media_storage
+from .locking import room_lock
+from .changes import latest_cursor, poll_changes, requested_cursor, sse_response, stream_changes
+from .feeds import (
+    events_etag, admin_events_etag, events_cache_key, CompactEvents,
+    feed_cache, cached_response, request_room_versions, stream_json_array,
+)
 import json
+import logging
+import mimetypes
+import re
 
 from .models import (
     Room, Reservation, ReservationException,
     ScheduledClass, WEEKDAY_CHOICES
 )
 
+logger = logging.getLogger(__name__)
+
 WEEKDAY_LABELS = {
     0: "Segunda", 1: "Terça", 2: "Quarta", 3: "Quinta",
     4: "Sexta", 5: "Sábado", 6: "Domingo"
@@ -34,18 +66,10 @@ def _overlap(a_start: time, a_end: time, b_start: time, b_end: time) -> bool:
     return (_t2m(a_start) < _t2m(b_end)) and (_t2m(a_end) > _t2m(b_start))
 
 def _has_conflict(room, weekday: int, start_t: time, end_t: time, exclude_id: int|None=None) -> bool:
-    print("\n🔎 Verificando conflito:")
-    print(f"➡ Sala: {room.slug}, Dia: {weekday}, Início: {start_t}, Fim: {end_t}")
-
-    # 1️⃣ Conflito com Aulas Fixas
-    sc_qs = ScheduledClass.objects.filter(room=room, weekday=weekday, is_active=True)
-    if exclude_id:
-        sc_qs = sc_qs.exclude(id=exclude_id)
-
-    for sc in sc_qs:
-        if _overlap(start_t, end_t, sc.start_time, sc.end_time):
-            print(f"🚫 Conflito aula fixa: {sc.id} {sc.title} {sc.start_time}-{sc.end_time}")
-            return True
+    # 1️⃣ Conflito com Aulas Fixas (índice semanal da sala)
+    if weekly_overlaps(room, weekday, start_t, end_t, exclude_id=exclude_id):
+        logger.debug("Conflito aula fixa: sala=%s dia=%s %s-%s", room.slug, weekday, start_t, end_t)
+        return True
 
     # 2️⃣ Conflito com Reservas (baseado em ocorrências reais)
     today = now().date()
@@ -56,84 +80,34 @@ def _has_conflict(room, weekday: int, start_t: time, end_t: time, exclude_id: in
     day_start = make_aware(datetime.combine(check_date, start_t), timezone=tz)
     day_end = make_aware(datetime.combine(check_date, end_t), timezone=tz)
 
-    reservations = Reservation.objects.filter(room=room, is_cancelled=False)
+    if reservation_overlaps(room, day_start, day_end):
+        logger.debug("Conflito reserva: sala=%s %s-%s", room.slug, day_start, day_end)
+        return True
 
-    for r in reservations:
-        for s, e, _ in r.occurrences_between(day_start - timedelta(hours=1), day_end + timedelta(hours=1)):
-            if not (day_end <= s or day_start >= e):
-                print(f"🚫 Conflito reserva: {r.id} {s.time()}-{e.time()} do user {r.user}")
-                return True
-
-    print("✅ Nenhum conflito encontrado")
     return False
 
 def _suggest_alternatives(room, weekday: int, around_start: time, duration_min: int, exclude_id: int|None=None, max_suggestions: int=8):
     """
-    Sugere horários livres no mesmo dia/sala.
-    Varre o dia de 06:00 a 23:00 em passos de 30 min e escolhe os mais próximos.
+    Sugere horários livres para uma aula fixa, do mais próximo ao mais distante:
+    mesmo dia e dias vizinhos, nesta sala e nas outras (ver suggestions.py).
     """
-    step = 30
-    start_window = _t2m(time(6, 0))
-    end_window   = _t2m(time(23, 0))
-    want = _t2m(around_start)
-    dur = duration_min
-
-    # Colete os intervalos ocupados
-    busy = []
-    qs = ScheduledClass.objects.filter(room=room, weekday=weekday, is_active=True)
-    if exclude_id:
-        qs = qs.exclude(id=exclude_id)
-    for sc in qs:
-        busy.append((_t2m(sc.start_time), _t2m(sc.end_time)))
-
-    # Varre slots
-    candidates = []
-    for start_m in range(start_window, end_window+1, step):
-        end_m = start_m + dur
-        if end_m > (23*60+59):
-            continue
-        # checa conflito com qualquer busy
-        if any(not (end_m <= b0 or start_m >= b1) for (b0, b1) in busy):
-            continue
-        candidates.append(start_m)
-
-    # Ordena por proximidade ao horário pedido
-    candidates.sort(key=lambda m: abs(m - want))
-
-    # Formata sugestões
-    result = []
-    for m in candidates[:max_suggestions]:
-        t = _m2t(m)
-        label = f"{WEEKDAY_LABELS.get(weekday, 'Dia')} • {t.strftime('%H:%M')}"
-        result.append({
-            "weekday": weekday,
-            "weekday_label": WEEKDAY_LABELS.get(weekday, "Dia"),
-            "start": t.strftime("%H:%M"),
-            "label": label
-        })
-    return result
+    return weekly_alternatives(
+        room, weekday, around_start, duration_min,
+        exclude_id=exclude_id, max_suggestions=max_suggestions,
+    )
 
 def _is_ajax(request) -> bool:
     return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
-# =============================
-# Helper: perfil administrativo
-# =============================
-def is_staff_like(user):
-    return (
-        user.is_superuser
-        or user.groups.filter(name__iexact='Secretario').exists()
-        or user.groups.filter(name__iexact='Administrador').exists()
-    )
-
 # =============================
 # Home — Calendário (cliente)
 # =============================
 @login_required
 def home(request):
     rooms = Room.objects.all().order_by('id')
+    staff = is_staff_like(request.user)
     teachers = None
-    if is_staff_like(request.user):
+    if staff:
         teachers = User.objects.filter(groups__name__iexact='Professor')
 
     from .models import Notice
@@ -142,34 +116,28 @@ def home(request):
     return render(request, 'reservas/calendar.html', {
         'rooms': rooms,
         'users': teachers,
-        'is_staff_like': is_staff_like(request.user),
+        'is_staff_like': staff,
         'avisos': avisos,
     })
 
 
-# =============================
-# API Normal — Eventos (FullCalendar do cliente)
-# =============================
-@login_required
-def events_feed(request):
-    start = parse_datetime(request.GET.get('start'))
-    end = parse_datetime(request.GET.get('end'))
-    room_slug = request.GET.get('room')
-
-    if not (start and end):
-        return JsonResponse([], safe=False)
-
+def _client_events(occurrences, user_id, staff, compact=None):
+    """
+    Eventos do feed do cliente a partir de (início, fim, obj).
+    Com `compact` (CompactEvents) os eventos vão para ele e a lista volta vazia.
+    """
     events = []
-
-    # --- Reservas normais ---
-    res_qs = Reservation.objects.filter(is_cancelled=False)
-    if room_slug:
-        res_qs = res_qs.filter(room__slug=room_slug)
-
     # Você pode ajustar as cores por sala se quiser
-    for r in res_qs.select_related('room', 'user'):
-        teacher = r.user.get_full_name() or r.user.username
-        for s, e, _ in r.occurrences_between(start, end):
+    for s, e, obj in occurrences:
+        teacher = obj.user.get_full_name() or obj.user.username
+
+        # --- Reservas normais ---
+        if isinstance(obj, Reservation):
+            r = obj
+            can_cancel = staff or (r.user_id == user_id)
+            if compact is not None:
+                compact.add(f"r-{r.id}", "r", teacher.split()[0], can_cancel, s, e, r.room, r.user, teacher)
+                continue
             events.append({
                 "id": f"r-{r.id}",
                 "title": teacher.split()[0],  # no cliente, título curtinho
@@ -183,19 +151,17 @@ def events_feed(request):
                     "teacher_name": teacher,   # <- disponível pra quem quiser mostrar
                     "room_name": r.room.name,
                     "owner_id": r.user.id,
-                    "can_cancel": (r.user_id == request.user.id) or is_staff_like(request.user),
+                    "can_cancel": can_cancel,
                 }
             })
 
-    # --- Aulas fixas (grade) ---
-    sc_qs = ScheduledClass.objects.filter(is_active=True)
-    if room_slug:
-        sc_qs = sc_qs.filter(room__slug=room_slug)
-
-    for sc in sc_qs.select_related('room', 'user'):
-        teacher = sc.user.get_full_name() or sc.user.username
-        title = f"{(sc.title or 'Aula').strip()} — {sc.user.get_full_name() or sc.user.username}"
-        for s, e, _ in sc.occurrences_between(start, end):
+        # --- Aulas fixas (grade) ---
+        else:
+            sc = obj
+            title = f"{(sc.title or 'Aula').strip()} — {teacher}"
+            if compact is not None:
+                compact.add(f"sc-{sc.id}", "sc", title, False, s, e, sc.room, sc.user, teacher)
+                continue
             events.append({
                 "id": f"sc-{sc.id}",
                 "title": title,
@@ -212,80 +178,209 @@ def events_feed(request):
                 }
             })
 
-    return JsonResponse(events, safe=False)
+    return events
+
 
 # =============================
-# Horários disponíveis (24h) — versão definitiva e compatível com Django 4.2+
+# API Normal — Eventos (FullCalendar do cliente)
 # =============================
 @login_required
-@require_POST
-def availability(request):
-    from django.utils.timezone import localtime
+@cache_control(private=True, no_cache=True)
+@vary_on_headers('Accept-Encoding')  # também no 304 do condition
+@condition(etag_func=events_etag)
+def events_feed(request):
+    start = parse_datetime(request.GET.get('start'))
+    end = parse_datetime(request.GET.get('end'))
+    room_slug = request.GET.get('room')
+
+    if not (start and end):
+        return JsonResponse([], safe=False)
+
+    filters = {'room__slug': room_slug} if room_slug else {}
+
+    # Cache de respostas: só o can_cancel depende de quem pergunta
+    staff = is_staff_like(request.user)
+    if staff:
+        viewer = 'staff'
+    elif has_overlap(start, end, kind='reservation', user_id=request.user.id, **filters):
+        viewer = request.user.id
+    else:
+        viewer = 'guest'
+    cache_key = events_cache_key(request, start, end, viewer)
+    entry = feed_cache.get(cache_key)
+    if entry is not None:
+        return cached_response(request, entry)
 
+    # ?format=compact: tabelas de salas/professores/séries + colunas de inteiros
+    compact = CompactEvents() if request.GET.get('format') == 'compact' else None
+    events = _client_events(occurrences_in(start, end, **filters), request.user.id, staff, compact)
+
+    room_ids = [pk for pk, *_ in request_room_versions(request)]
+    data = compact.as_dict() if compact is not None else events
+    return cached_response(request, feed_cache.set(cache_key, room_ids, data))
+
+# =============================
+# Horários disponíveis (24h) — versão definitiva e compatível com Django 4.2+
+# =============================
+def _availability_params(request):
+    """Lê o corpo JSON do /api/availability/: dict de parâmetros ou a resposta de erro"""
     try:
         data = json.loads(request.body.decode('utf-8'))
     except Exception:
         return HttpResponseBadRequest("JSON inválido")
+    if not isinstance(data, dict):
+        return HttpResponseBadRequest("JSON inválido")
 
     date_str = data.get('date')
     room_slug = data.get('room_slug')
-    duration_min = int(data.get('duration_min', 60))
+    try:
+        duration_min = int(data.get('duration_min', 60))
+        granularity_min = int(data.get('granularity_min', 30))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("Duração ou intervalo inválido")
 
     if not (date_str and room_slug):
         return HttpResponseBadRequest("Parâmetros faltando")
+    # Um dia inteiro no máximo (o bitmap de ocupação é por dia)
+    if not (0 < duration_min <= MINUTES_PER_DAY and 0 < granularity_min <= MINUTES_PER_DAY):
+        return HttpResponseBadRequest("Duração ou intervalo inválido")
 
-    target_date = parse_date(date_str)
+    try:
+        target_date = parse_date(date_str)
+    except (TypeError, ValueError):
+        # "2026-02-30" tem o formato certo mas não existe; número no lugar do texto
+        target_date = None
     if not target_date:
         return HttpResponseBadRequest("Data inválida")
 
+    return {
+        'date': target_date,
+        'room_slug': room_slug,
+        'duration_min': duration_min,
+        'granularity_min': granularity_min,
+    }
+
+
+def _available_slots(target_date, busy, duration_min, granularity_min):
+    """Inícios livres ("HH:MM") do dia, dado o bitmap de ocupação da sala"""
+    current_time = localtime(now())
+
+    # janela completa do dia (00:00 → 00:00 do dia seguinte)
+    day_start, day_end = day_bounds(target_date)
+    day_minutes = floor_minutes(day_end - day_start)
+
+    # se for hoje, pula apenas horários anteriores à hora atual
+    not_before = 0
+    if target_date == current_time.date():
+        not_before = ceil_minutes(current_time - day_start)
+
+    starts = free_starts(busy, duration_min, granularity_min, day_minutes, not_before)
+    return [localtime(day_start + timedelta(minutes=m)).strftime("%H:%M") for m in starts]
+
+
+@login_required
+@require_POST
+def availability(request):
+    params = _availability_params(request)
+    if isinstance(params, HttpResponse):
+        return params
+    target_date = params['date']
+
     # não permite datas passadas
     if target_date < now().date():
         return JsonResponse({'available': []})
 
-    room = get_object_or_404(Room, slug=room_slug)
-
-    tz = get_current_timezone()
-    current_time = localtime(now())
+    room = get_object_or_404(Room, slug=params['room_slug'])
 
-    # janela completa do dia (00:00 → 23:59)
-    day_start = make_aware(datetime.combine(target_date, time(0, 0)), timezone=tz)
-    day_end = make_aware(datetime.combine(target_date, time(23, 59, 59)), timezone=tz)
-
-    slot_len = timedelta(minutes=30)
-    slots = []
-
-    cur = day_start
-    while cur + timedelta(minutes=duration_min) <= day_end:
-        # se for hoje, pula apenas horários anteriores à hora atual (no mesmo fuso)
-        if target_date == current_time.date() and cur.astimezone(tz).time() < current_time.time():
-            cur += slot_len
-            continue
-        slots.append(cur)
-        cur += slot_len
-
-    # reservas existentes do dia
-    existing = Reservation.objects.filter(
-        room=room,
-        start_dt__date=target_date,
-        is_cancelled=False
+    # bitmap de ocupação do dia: reservas, séries e aulas fixas
+    busy = occupancy([room.pk], target_date)[room.pk, target_date]
+    available_slots = _available_slots(
+        target_date, busy, params['duration_min'], params['granularity_min']
     )
 
-    busy_ranges = [(r.start_dt, r.end_dt) for r in existing]
+    return JsonResponse({'available': available_slots})
 
-    available_slots = []
-    for start_time in slots:
-        end_time = start_time + timedelta(minutes=duration_min)
+# =============================
+# API: SALAS LIVRES (todas as salas de uma vez)
+# =============================
+@login_required
+def free_rooms(request):
+    """
+    Janelas livres de cada sala entre as datas `start` e `end` (inclusivas)
+    que comportam `duration_min` minutos. `room` pode se repetir para limitar
+    as salas. Uma consulta de ocorrências + um sweep-line para todas as salas.
+    """
+    try:
+        first_day = parse_date(request.GET.get('start') or '')
+        last_day = parse_date(request.GET.get('end') or '') or first_day
+    except ValueError:
+        # Formato certo, data que não existe ("2026-02-30")
+        return HttpResponseBadRequest("Parâmetros inválidos")
+    try:
+        duration_min = int(request.GET.get('duration_min', 60))
+    except ValueError:
+        return HttpResponseBadRequest("Duração inválida")
+
+    if not first_day or last_day < first_day or duration_min <= 0:
+        return HttpResponseBadRequest("Parâmetros inválidos")
+    if (last_day - first_day).days >= getattr(settings, 'FREE_ROOMS_MAX_DAYS', 31):
+        return HttpResponseBadRequest("Intervalo muito grande")
+
+    rooms = Room.objects.order_by('name')
+    slugs = request.GET.getlist('room')
+    if slugs:
+        rooms = rooms.filter(slug__in=slugs)
+    rooms = list(rooms)
+
+    # não oferece horários que já passaram
+    start = max(day_bounds(first_day)[0], now())
+    end = day_bounds(last_day)[1]
+    windows = {}
+    if start < end:
+        windows = free_windows([r.pk for r in rooms], start, end, timedelta(minutes=duration_min))
+
+    return JsonResponse({
+        'duration_min': duration_min,
+        'rooms': [
+            {
+                'slug': r.slug,
+                'name': r.name,
+                'windows': [
+                    {'start': localtime(s).isoformat(), 'end': localtime(e).isoformat()}
+                    for s, e in windows.get(r.pk, [])
+                ],
+            }
+            for r in rooms
+        ],
+    })
 
-        # verifica conflito com reservas
-        conflict = any(
-            s < end_time and start_time < e
-            for s, e in busy_ranges
-        )
+# =============================
+# API: Avisos de mudança na agenda (SSE)
+# =============================
+@login_required
+def schedule_changes(request):
+    """
+    text/event-stream com um evento "change" ({room, start, end, version}) por
+    mudança na agenda; os calendários recarregam só se o trecho estiver à vista.
+    """
+    cursor = requested_cursor(request)
+    if cursor is None:
+        cursor = latest_cursor()
+    return sse_response(stream_changes(cursor, request.GET.get('room')))
 
-        if not conflict:
-            available_slots.append(start_time.astimezone(tz).strftime("%H:%M"))
 
-    return JsonResponse({'available': available_slots})
+@login_required
+@never_cache
+def schedule_changes_poll(request):
+    """
+    Mesmos avisos do stream, mas responde na hora (sem ASYNC_VIEWS os
+    calendários usam isto): {"last_id": n, "changes": [{id, room, start, end, version}]}.
+    Sem last_id, devolve só o cursor atual.
+    """
+    cursor = requested_cursor(request)
+    if cursor is None:
+        return JsonResponse({'last_id': latest_cursor(), 'changes': []})
+    return JsonResponse(poll_changes(cursor, request.GET.get('room')))
 
 # =============================
 # Criar Reserva (cliente & staff)
@@ -316,25 +411,40 @@ def reserve_view(request):
     if is_staff_like(request.user) and request.POST.get('user_id'):
         target_user = get_object_or_404(User, id=int(request.POST['user_id']))
 
-    # ✅ CONFLITO com AULA FIXA AQUI!
-    weekday = start_dt.weekday()
-    if _has_conflict(room, weekday, start_dt.time(), end_dt.time()):
-        return JsonResponse({'error': 'Conflito com uma aula fixa existente'}, status=409)
-
-    # ✅ Conflito com outras reservas
-    existing = Reservation.objects.filter(room=room, is_cancelled=False)
-    for r in existing:
-        for s, e, _ in r.occurrences_between(start_dt - timedelta(hours=1), end_dt + timedelta(hours=1)):
-            if not (end_dt <= s or start_dt >= e):
-                return JsonResponse({'error': 'Conflito com outra reserva'}, status=409)
-
-    Reservation.objects.create(
-        room=room,
-        user=target_user,
-        start_dt=start_dt,
-        end_dt=end_dt,
-        recurrence_rule=recurrence_rule
-    )
+    # Checagem + gravação dentro da trava da sala: duas reservas simultâneas
+    # no mesmo horário não passam as duas pela checagem
+    conflict = None
+    try:
+        with room_lock([room.pk]) as rooms:
+            room = rooms[room.pk]
+
+            # ✅ CONFLITO com AULA FIXA AQUI!
+            weekday = start_dt.weekday()
+            if _has_conflict(room, weekday, start_dt.time(), end_dt.time()):
+                conflict = 'Conflito com uma aula fixa existente'
+
+            # ✅ Conflito com outras reservas
+            elif reservation_overlaps(room, start_dt, end_dt):
+                conflict = 'Conflito com outra reserva'
+
+            else:
+                Reservation.objects.create(
+                    room=room,
+                    user=target_user,
+                    start_dt=start_dt,
+                    end_dt=end_dt,
+                    recurrence_rule=recurrence_rule
+                )
+    except IntegrityError:
+        # Exclusion constraint (PostgreSQL, manage.py booking_constraint) recusou a sobreposição
+        conflict = 'Conflito com outra reserva'
+
+    if conflict:
+        # Sugestões fora da trava: não seguram a sala para os outros
+        return JsonResponse({
+            'error': conflict,
+            'alternatives': dated_alternatives(room, start_dt, duration_min),
+        }, status=409)
 
     return JsonResponse({'ok': True, 'message': 'Reserva criada com sucesso!'})
 
@@ -400,71 +510,168 @@ def admin_agenda(request):
 # =============================
 # API Admin — Eventos (inclui teacher_name)
 # =============================
-@user_passes_test(is_staff_like)
-def admin_events_feed(request):
+def _admin_events(start, end, filters):
+    """Gera os eventos do feed admin um a um (permite streaming)"""
+    for s, e, obj in occurrences_in(start, end, **filters):
+        yield _admin_event(s, e, obj)
+
+
+def _admin_event(s, e, obj):
+    """Evento do feed admin para uma ocorrência"""
+    teacher = obj.user.get_full_name() or obj.user.username
+
+    # Reservas normais
+    if isinstance(obj, Reservation):
+        r = obj
+        return {
+            "id": f"r-{r.id}",
+            "title": teacher,  # no admin pode usar nome completo
+            "start": s.isoformat(),
+            "end": e.isoformat(),
+            "room_slug": r.room.slug,
+            "backgroundColor": "#0BAFEE",
+            "textColor": "#ffffff",
+            "extendedProps": {
+                "type": "reservation",
+                "teacher_name": teacher,
+                "room_name": r.room.name,
+                "can_cancel": True
+            }
+        }
+
+    # Aulas fixas (grade)
+    else:
+        sc = obj
+        title = (sc.title or "Aula").strip() or "Aula"
+        return {
+            "id": f"sc-{sc.id}",
+            "title": title,  # título da aula
+            "start": s.isoformat(),
+            "end": e.isoformat(),
+            "room_slug": sc.room.slug,
+            "backgroundColor": "#495057",  # cinza sólido
+            "textColor": "#ffffff",
+            "classNames": ["fixed-class", sc.room.slug],
+            "extendedProps": {
+                "type": "scheduled_class",
+                "teacher_name": teacher,
+                "room_name": sc.room.name,
+                "can_cancel": True
+            }
+        }
+
+
+def _admin_feed_query(request):
+    """(início, fim, filtros) do /api/admin-events/"""
     room_slug = request.GET.get('room')
     user_filter = request.GET.get('user')
 
     start = datetime.fromisoformat(request.GET.get('start')).astimezone(get_current_timezone())
     end = datetime.fromisoformat(request.GET.get('end')).astimezone(get_current_timezone())
 
-    events = []
-
-    # Reservas normais
-    res_qs = Reservation.objects.filter(is_cancelled=False)
+    filters = {}
     if room_slug:
-        res_qs = res_qs.filter(room__slug=room_slug)
+        filters['room__slug'] = room_slug
     if user_filter and user_filter != 'all':
-        res_qs = res_qs.filter(user_id=user_filter)
+        filters['user_id'] = user_filter
+    return start, end, filters
 
-    for r in res_qs.select_related('room', 'user'):
-        teacher = r.user.get_full_name() or r.user.username
-        for s, e, _ in r.occurrences_between(start, end):
-            events.append({
-                "id": f"r-{r.id}",
-                "title": teacher,  # no admin pode usar nome completo
-                "start": s.isoformat(),
-                "end": e.isoformat(),
-                "room_slug": r.room.slug,
-                "backgroundColor": "#0BAFEE",
-                "textColor": "#ffffff",
-                "extendedProps": {
-                    "type": "reservation",
-                    "teacher_name": teacher,
-                    "room_name": r.room.name,
-                    "can_cancel": True
-                }
-            })
 
-    # Aulas fixas (grade)
-    sc_qs = ScheduledClass.objects.filter(is_active=True)
-    if room_slug:
-        sc_qs = sc_qs.filter(room__slug=room_slug)
-    if user_filter and user_filter != 'all':
-        sc_qs = sc_qs.filter(user_id=user_filter)
+def _admin_feed_streams(request, start, end):
+    """Intervalos largos (ano/lista) saem em streaming: memória constante"""
+    stream_days = getattr(settings, 'ADMIN_FEED_STREAM_DAYS', 45)
+    return request.GET.get('stream') == '1' or (end - start).days > stream_days
 
-    for sc in sc_qs.select_related('room', 'user'):
-        teacher = sc.user.get_full_name() or sc.user.username
-        title = (sc.title or "Aula").strip() or "Aula"
-        for s, e, _ in sc.occurrences_between(start, end):
-            events.append({
-                "id": f"sc-{sc.id}",
-                "title": title,  # título da aula
-                "start": s.isoformat(),
-                "end": e.isoformat(),
-                "room_slug": sc.room.slug,
-                "backgroundColor": "#495057",  # cinza sólido
-                "textColor": "#ffffff",
-                "classNames": ["fixed-class", sc.room.slug],
-                "extendedProps": {
-                    "type": "scheduled_class",
-                    "teacher_name": teacher,
-                    "room_name": sc.room.name,
-                    "can_cancel": True
-                }
-            })
 
-    return JsonResponse(events, safe=False)
+@user_passes_test(is_staff_like)
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=admin_events_etag)
+def admin_events_feed(request):
+    start, end, filters = _admin_feed_query(request)
+    events = _admin_events(start, end, filters)
+
+    if _admin_feed_streams(request, start, end):
+        return StreamingHttpResponse(stream_json_array(events), content_type='application/json')
+
+    events = list(events)
+    with timing('json'):
+        return JsonResponse(events, safe=False)
+
+# =============================
+# Mídia endereçada por conteúdo (storage.py)
+# =============================
+def _blob_etag(request, path):
+    # O nome já é o hash do conteúdo
+    return path.rsplit('/', 1)[-1].split('.', 1)[0]
+
+
+@condition(etag_func=_blob_etag)
+def media_blob(request, path):
+    try:
+        blob = media_storage().open(f'{BLOB_PREFIX}/{path}')
+    except FileNotFoundError:
+        raise Http404("Arquivo não encontrado")
+    response = FileResponse(blob, content_type=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    # A URL muda junto com o conteúdo: pode ficar em cache para sempre
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+# =============================
+# Métricas (Prometheus)
+# =============================
+@never_cache
+def metrics_view(request):
+    # Equipe logada, ou o coletor com "Authorization: Bearer <METRICS_TOKEN>"
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    bearer = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (bearer or is_staff_like(request.user)):
+        return HttpResponse("Sem permissão", status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# =============================
+# Profiler sob demanda (equipe)
+# =============================
+@login_required
+@user_passes_test(is_staff_like)
+@never_cache
+def profiles_api(request):
+    """
+    GET: chave atual e perfis gravados (mais recentes primeiro).
+    POST {"minutes": 10, "pattern": "^/api/admin-events/", "rate": 0.2, "collector": "sample"}
+    liga a chave; "minutes": 0 desliga.
+    """
+    if request.method == 'POST':
+        try:
+            payload = json.loads(request.body.decode('utf-8'))
+            state = profiling.set_switch(
+                minutes=float(payload.get('minutes', 10)),
+                pattern=str(payload.get('pattern') or ''),
+                rate=float(payload.get('rate', 1.0)),
+                collector=str(payload.get('collector') or 'sample'),
+            )
+        except (ValueError, TypeError, AttributeError, re.error):
+            return HttpResponseBadRequest("Payload inválido")
+        logger.info("Profiler: chave %s por user=%s", "ligada" if state else "desligada", request.user.pk)
+    elif request.method != 'GET':
+        return HttpResponseNotAllowed(['GET', 'POST'])
+
+    files = sorted(profiling.list_profiles(), key=lambda p: p.name, reverse=True)
+    return JsonResponse({
+        'switch': profiling.switch_state(),
+        'profiles': [
+            {'name': p.name, 'size': p.stat().st_size, 'url': reverse('profile_download', args=[p.name])}
+            for p in files
+        ],
+    })
+
+
+@login_required
+@user_passes_test(is_staff_like)
+def profile_download(request, name):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise Http404("Perfil não encontrado")
+    return FileResponse(path.open('rb'), as_attachment=True, filename=name, content_type='application/octet-stream')
 
 # =============================
 # Cancelamento em lote (admin)
@@ -479,27 +686,28 @@ def cancel_bulk(request):
         payload = json.loads(request.body.decode('utf-8'))
     except:
         return HttpResponseBadRequest("Payload inválido")
+    if not isinstance(payload, dict):
+        return HttpResponseBadRequest("Payload inválido")
 
-    ids = payload.get('ids', [])
-    if not ids:
+    ids = payload.get('ids') or []
+    occurrences = payload.get('occurrences') or []
+    if not (isinstance(ids, list) and isinstance(occurrences, list)):
+        return HttpResponseBadRequest("Payload inválido")
+    # Cancelamento por data: [{"id": "r-12", "date": "2025-03-10"}, ...]
+    try:
+        dated = [
+            (item.get('id'), parse_date(str(item.get('date') or '')))
+            for item in occurrences
+            if isinstance(item, dict)
+        ]
+    except ValueError:
+        # Formato certo, data que não existe ("2026-02-30")
+        return HttpResponseBadRequest("Data inválida")
+    if not (ids or dated):
         return HttpResponseBadRequest("Nenhum evento selecionado")
 
-    for sid in ids:
-        sid = str(sid)
-        if sid.startswith('r-'):
-            rid = int(sid[2:])
-            res = Reservation.objects.filter(id=rid).first()
-            if res:
-                res.is_cancelled = True
-                res.save()
-        elif sid.startswith('sc-'):
-            scid = int(sid[3:])
-            sc = ScheduledClass.objects.filter(id=scid).first()
-            if sc:
-                sc.is_active = False
-                sc.save()
-
-    return JsonResponse({"ok": True})
+    counts = cancel_events(ids, dated)
+    return JsonResponse({"ok": True, **counts})
 
 # =============================
 # Grade Fixa — telas (admin/secretário)
@@ -542,20 +750,36 @@ def admin_grade_create(request):
         end_dt = datetime(2000, 1, 1, h, m) + timedelta(minutes=int(request.POST.get("duration")))
         end_time = end_dt.time()
 
-        # Checar conflitos por dia
-        conflicts = []
-        for wd_str in weekdays:
-            wd = int(wd_str)
-            if _has_conflict(room, wd, start_time, end_time):
-                alts = _suggest_alternatives(room, wd, start_time, int(request.POST.get("duration")))
-                conflicts.append({
-                    "weekday": wd,
-                    "weekday_label": WEEKDAY_LABELS.get(wd, "Dia"),
-                    "start": start_time.strftime("%H:%M"),
-                    "alternatives": alts
-                })
-
-        if conflicts:
+        # Checar conflitos por dia (na trava da sala, junto com a gravação)
+        conflicting = []
+        with room_lock([room.pk]) as rooms:
+            room = rooms[room.pk]
+            for wd_str in weekdays:
+                wd = int(wd_str)
+                if _has_conflict(room, wd, start_time, end_time):
+                    conflicting.append(wd)
+
+            # Sem conflitos → cria todas
+            if not conflicting:
+                for wd_str in weekdays:
+                    wd = int(wd_str)
+                    ScheduledClass.objects.create(
+                        room=room,
+                        user=teacher,
+                        title=title,
+                        weekday=wd,
+                        start_time=start_time,
+                        end_time=end_time,
+                        is_active=True,
+                    )
+
+        if conflicting:
+            conflicts = [{
+                "weekday": wd,
+                "weekday_label": WEEKDAY_LABELS.get(wd, "Dia"),
+                "start": start_time.strftime("%H:%M"),
+                "alternatives": _suggest_alternatives(room, wd, start_time, int(request.POST.get("duration"))),
+            } for wd in conflicting]
             if _is_ajax(request):
                 return JsonResponse({
                     "ok": False,
@@ -565,19 +789,6 @@ def admin_grade_create(request):
             # Fluxo não-AJAX (fallback)
             return HttpResponseBadRequest("Conflito com outras aulas fixas.")
 
-        # Sem conflitos → cria todas
-        for wd_str in weekdays:
-            wd = int(wd_str)
-            ScheduledClass.objects.create(
-                room=room,
-                user=teacher,
-                title=title,
-                weekday=wd,
-                start_time=start_time,
-                end_time=end_time,
-                is_active=True,
-            )
-
         if _is_ajax(request):
             return JsonResponse({"ok": True, "message": "Aula(s) criada(s) com sucesso!"})
         return redirect("admin_grade")
@@ -592,6 +803,7 @@ def admin_grade_create(request):
 def admin_grade_update(request):
     try:
         sc = get_object_or_404(ScheduledClass, id=int(request.POST.get("id")))
+        previous_room_id = sc.room_id
         sc.room = get_object_or_404(Room, slug=request.POST.get("room"))
         sc.user = get_object_or_404(User, id=request.POST.get("user"))
         sc.title = (request.POST.get("title") or sc.title).strip() or sc.title
@@ -605,8 +817,18 @@ def admin_grade_update(request):
         weekdays = request.POST.getlist("weekday")
         new_weekday = int(weekdays[0]) if weekdays else sc.weekday
 
-        # Conflito (exclui a própria)
-        if _has_conflict(sc.room, new_weekday, start_time, end_time, exclude_id=sc.id):
+        # Conflito (exclui a própria) + gravação na trava das salas (antiga e nova)
+        with room_lock([previous_room_id, sc.room_id]) as rooms:
+            sc.room = rooms[sc.room_id]
+            conflict = _has_conflict(sc.room, new_weekday, start_time, end_time, exclude_id=sc.id)
+            if not conflict:
+                # Salva
+                sc.weekday = new_weekday
+                sc.start_time = start_time
+                sc.end_time = end_time
+                sc.save()
+
+        if conflict:
             alts = _suggest_alternatives(sc.room, new_weekday, start_time, int(request.POST.get("duration")), exclude_id=sc.id)
             if _is_ajax(request):
                 return JsonResponse({
@@ -621,12 +843,6 @@ def admin_grade_update(request):
                 }, status=409)
             return HttpResponseBadRequest("Conflito com outra aula fixa.")
 
-        # Salva
-        sc.weekday = new_weekday
-        sc.start_time = start_time
-        sc.end_time = end_time
-        sc.save()
-
         if _is_ajax(request):
             return JsonResponse({"ok": True, "message": "Aula atualizada com sucesso!"})
         return redirect("admin_grade")
@@ -636,6 +852,23 @@ def admin_grade_update(request):
             return JsonResponse({"ok": False, "error": str(e)}, status=400)
         return HttpResponseBadRequest(str(e))
 
+@user_passes_test(is_staff_like)
+@require_POST
+def admin_grade_import(request):
+    """Importa a grade de um arquivo CSV/ICS (ver timetable.py); ?dry_run=1 só valida"""
+    upload = request.FILES.get("file")
+    if upload is None:
+        return JsonResponse({"ok": False, "error": "Envie um arquivo CSV ou ICS."}, status=400)
+
+    try:
+        parsed = parse_timetable(upload.name, upload.read())
+    except UnicodeDecodeError:
+        return JsonResponse({"ok": False, "error": "O arquivo precisa estar em UTF-8."}, status=400)
+
+    dry_run = request.POST.get("dry_run") == "1" or request.GET.get("dry_run") == "1"
+    result = import_timetable(parsed, dry_run=dry_run)
+    return JsonResponse({"ok": True, "dry_run": dry_run, **result})
+
 @user_passes_test(is_staff_like)
 @require_POST
 def admin_grade_toggle(request):
@@ -664,15 +897,14 @@ def profile_view(request):
         if new_phone:
             profile.phone = new_phone
             profile.save(update_fields=['phone'])
-            print(f"✅ Telefone salvo com sucesso: {new_phone}")
+            logger.info("Telefone atualizado: user=%s", request.user.pk)
             return JsonResponse({'success': True, 'phone': new_phone})
         else:
             return JsonResponse({'success': False, 'error': 'Telefone inválido'}, status=400)
 
     # ✅ Remover foto
     elif request.method == 'POST' and 'remove_photo' in request.POST:
-        if profile.photo:
-            profile.photo.delete(save=True)
+        # O arquivo é solto pelo signal (pode ser compartilhado: reservas/storage.py)
         profile.photo = None
         profile.save(update_fields=['photo'])
         return redirect('profile')
@@ -874,8 +1106,9 @@ def home_with_notices(request):
     Substitui a home atual se quiser mostrar os avisos abaixo do calendário.
     """
     rooms = Room.objects.all().order_by('id')
+    staff = is_staff_like(request.user)
     teachers = None
-    if is_staff_like(request.user):
+    if staff:
         teachers = User.objects.filter(groups__name__iexact='Professor')
 
     avisos = Notice.objects.filter(is_active=True).order_by('-criado_em')[:3]
@@ -884,5 +1117,5 @@ def home_with_notices(request):
         'rooms': rooms,
         'users': teachers,
         'avisos': avisos,
-        'is_staff_like': is_staff_like(request.user),
+        'is_staff_like': staff,
     })